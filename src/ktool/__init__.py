@@ -1,9 +1,12 @@
-from ktool.ktool import load_image, load_objc_metadata, generate_headers, generate_text_based_stub, load_macho_file, \
-    macho_verify, reload_image, macho_combine
+from ktool.ktool import load_image, load_objc_metadata, generate_headers, generate_header_texts, \
+    iter_header_texts, update_headers, generate_text_based_stub, load_macho_file, macho_verify, reload_image, \
+    macho_combine, load_shared_cache
 
 from ktool.objc import ObjCImage
 from ktool.loader import MachOImageLoader
 from ktool.image import Image
+from ktool.dyld_cache import DyldSharedCache
+from ktool.cache_index import SharedCacheIndex
 from ktool.macho import Slice, MachOFile, MachOFileType, Segment, Section, MachOImageHeader
 
 try:
@@ -0,0 +1,284 @@
+#
+#  ktool | ktool
+#  batch.py
+#
+#  Batch processing of every MachO in a directory tree across a pool of worker processes.
+#
+#  This file is part of ktool. ktool is free software that
+#  is made available under the MIT license. Consult the
+#  file "LICENSE" that is distributed together with this file
+#  for the exact licensing terms.
+#
+#  Copyright (c) 0cyn 2022.
+#
+
+import concurrent.futures
+import json
+import os
+import signal
+import time
+from collections import namedtuple
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Iterator, Optional
+
+from ktool.exceptions import ProcessingTimeoutException
+from ktool.util import detect_filetype, FileType, ignore, opts, ArchiveWriter, archive_format
+
+from lib0cyn.log import log, LogLevel
+
+BATCH_COMMANDS = ['json', 'symbols', 'dump-headers', 'dump-tbd']
+
+batch_file = namedtuple('batch_file', ['path', 'size', 'filetype'])
+batch_result = namedtuple('batch_result', ['path', 'status', 'data', 'error', 'elapsed'])
+
+_BATCH_FILETYPES = [FileType.MachOFileType, FileType.FatMachOFileType, FileType.KCacheFileType]
+
+
+def find_macho_files(root: str) -> List[batch_file]:
+    """
+    Walk a directory tree and collect every file that looks like a MachO.
+
+    Symlinks are skipped so that framework bundles aren't processed several times over.
+
+    :param root: Directory to walk
+    :return: List of files found, largest first. Scheduling the largest files first keeps a single huge binary from
+        being the last thing a pool is waiting on.
+    """
+    found = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if os.path.islink(path) or not os.path.isfile(path):
+                continue
+            try:
+                size = os.path.getsize(path)
+                if size < 0x20:
+                    continue
+                with open(path, 'rb') as fp:
+                    filetype = detect_filetype(fp)
+            except OSError:
+                continue
+            if filetype in _BATCH_FILETYPES:
+                found.append(batch_file(path, size, filetype))
+
+    found.sort(key=lambda f: f.size, reverse=True)
+    return found
+
+
+class _worker_state:
+    use_mmaped_io = False
+
+
+def _worker_init(log_level: int, force_load: bool, use_mmaped_io: bool):
+    # Called before every file a pool worker processes, rather than as the pool's initializer, as the executor only
+    #   takes an initializer from 3.7 on. It's only setting a few globals.
+    log.LOG_LEVEL = LogLevel(log_level)
+    ignore.MALFORMED = force_load
+    # we're already one of a pool of processes, don't start another per file
+    opts.FIXUP_WORKERS = 1
+    opts.HEADER_WORKERS = 1
+    _worker_state.use_mmaped_io = use_mmaped_io
+
+
+def _batch_json(fp):
+    import ktool
+
+    macho_file = ktool.load_macho_file(fp, use_mmaped_io=_worker_state.use_mmaped_io)
+    slices = []
+    for macho_slice in macho_file.slices:
+        image = ktool.load_image(macho_slice)
+        slices.append({'offset': macho_slice.offset, 'size': macho_slice.size, 'type': macho_slice.type.name,
+                       'subtype': macho_slice.subtype.name, 'image': image.serialize()})
+    return {'filetype': macho_file.type.name, 'slices': slices}
+
+
+def _batch_symbols(fp):
+    import ktool
+
+    image = ktool.load_image(fp, use_mmaped_io=_worker_state.use_mmaped_io)
+    return {'imports': [sym.serialize() for sym in image.imports],
+            'exports': [sym.serialize() for sym in image.exports],
+            'symtab': [sym.serialize() for sym in image.symbol_table.table]}
+
+
+def _batch_dump_headers(fp):
+    import ktool
+
+    image = ktool.load_image(fp, use_mmaped_io=_worker_state.use_mmaped_io)
+    if image.name == "":
+        image.name = os.path.basename(fp.name)
+    objc_image = ktool.load_objc_metadata(image)
+    return ktool.generate_header_texts(objc_image)
+
+
+def _batch_dump_tbd(fp):
+    import ktool
+
+    image = ktool.load_image(fp, use_mmaped_io=_worker_state.use_mmaped_io)
+    return ktool.generate_text_based_stub(image, compatibility=True)
+
+
+_BATCH_FUNCS = {
+    'json': _batch_json,
+    'symbols': _batch_symbols,
+    'dump-headers': _batch_dump_headers,
+    'dump-tbd': _batch_dump_tbd
+}
+
+
+def _pool_process_file(worker_args: tuple, command: str, path: str, timeout: int, out_path: Optional[str]):
+    _worker_init(*worker_args)
+    return process_file(command, path, timeout, out_path)
+
+
+def output_path_for(outdir: str, root: str, path: str, command: str) -> str:
+    """
+    Get the location a file's output should be written to, mirroring the layout of the input tree.
+
+    dump-headers gets a directory per file, dump-tbd a .tbd file, everything else gets a single .json file.
+    """
+    out_path = os.path.join(outdir, os.path.relpath(path, root))
+    if command == 'dump-headers':
+        return out_path
+    if command == 'dump-tbd':
+        return out_path + '.tbd'
+    return out_path + '.json'
+
+
+def _write_output(out_path: str, command: str, data):
+    if command == 'dump-headers':
+        from ktool.headers import write_headers
+        write_headers(out_path, data)
+    elif command == 'dump-tbd':
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        with open(out_path, 'w') as out:
+            out.write(data)
+    else:
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        with open(out_path, 'w') as out:
+            json.dump(data, out)
+
+
+def _archive_output(archive: ArchiveWriter, name: str, command: str, data):
+    # name is an output_path_for() relative to the archive root
+    name = name.replace(os.sep, '/')
+    if command == 'dump-headers':
+        for header_name, text in data.items():
+            archive.add(f'{name}/{header_name}', text)
+    elif command == 'dump-tbd':
+        archive.add(name, data)
+    else:
+        archive.add(name, json.dumps(data))
+
+
+def _raise_timeout(signum, frame):
+    raise ProcessingTimeoutException
+
+
+def process_file(command: str, path: str, timeout: int = 0, out_path: str = None) -> batch_result:
+    """
+    Run a batch command on a single file.
+
+    This never raises; any failure (including running past the timeout) is returned as the status of the result,
+        so one bad file can't take the rest of a batch down with it.
+
+    :param command: One of BATCH_COMMANDS
+    :param path: File to process
+    :param timeout: Seconds this file is allowed to take. 0 disables the timeout.
+        Timeouts rely on SIGALRM and are ignored on platforms without it.
+    :param out_path: If passed, output is written here by the worker and not sent back in the result.
+    :return: batch_result
+    """
+    use_alarm = timeout > 0 and hasattr(signal, 'SIGALRM')
+    previous_handler = None
+    start = time.time()
+    try:
+        if use_alarm:
+            previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+            signal.alarm(timeout)
+        with open(path, 'rb') as fp:
+            data = _BATCH_FUNCS[command](fp)
+        if use_alarm:
+            signal.alarm(0)
+        if out_path:
+            _write_output(out_path, command, data)
+            data = None
+        return batch_result(path, 'ok', data, None, time.time() - start)
+    except ProcessingTimeoutException:
+        return batch_result(path, 'timeout', None, f'Exceeded {timeout}s', time.time() - start)
+    except Exception as ex:
+        return batch_result(path, 'error', None, f'{ex.__class__.__name__}: {ex}', time.time() - start)
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+            if previous_handler is not None:
+                signal.signal(signal.SIGALRM, previous_handler)
+
+
+def batch_process(root: str, command: str, jobs: int = 0, timeout: int = 0, outdir: str = None,
+                  force_load=False, use_mmaped_io=False) -> Iterator[batch_result]:
+    """
+    Run a batch command on every MachO found under root.
+
+    Results are yielded as soon as each file finishes, not in any particular order.
+
+    :param root: Directory to walk
+    :param command: One of BATCH_COMMANDS
+    :param jobs: Worker process count. 0 uses every core, 1 processes everything in this process.
+    :param timeout: Per-file timeout in seconds. 0 disables it.
+    :param outdir: If passed, write per-file outputs into this directory (mirroring the input tree). If it's an
+        archive path (see ArchiveWriter), outputs are streamed into that archive as each file finishes instead.
+    :param force_load: Ignore malformations in the MachOs being loaded (-f)
+    :param use_mmaped_io: Load files with mmaped IO
+    :return: Iterator of batch_result
+    """
+    if command not in BATCH_COMMANDS:
+        raise ValueError(f'Unknown batch command {command}')
+
+    if outdir and archive_format(outdir):
+        # workers send outputs back, and they're written into the archive from here
+        with ArchiveWriter(outdir) as archive:
+            for result in _batch_results(root, command, jobs, timeout, None, force_load, use_mmaped_io):
+                if result.status == 'ok':
+                    _archive_output(archive, output_path_for('', root, result.path, command), command, result.data)
+                    result = result._replace(data=None)
+                yield result
+        return
+
+    yield from _batch_results(root, command, jobs, timeout, outdir, force_load, use_mmaped_io)
+
+
+def _batch_results(root: str, command: str, jobs: int, timeout: int, outdir: Optional[str], force_load: bool,
+                   use_mmaped_io: bool) -> Iterator[batch_result]:
+    files = find_macho_files(root)
+    log.info(f'Found {len(files)} MachO files under {root}')
+
+    def out_path_for(path):
+        return output_path_for(outdir, root, path, command) if outdir else None
+
+    if jobs == 0:
+        jobs = os.cpu_count()
+
+    if jobs == 1 or len(files) <= 1:
+        # this is the caller's process, so its own settings are put back once the files are done
+        malformed, mmaped_io = ignore.MALFORMED, _worker_state.use_mmaped_io
+        ignore.MALFORMED, _worker_state.use_mmaped_io = force_load, use_mmaped_io
+        try:
+            for file in files:
+                yield process_file(command, file.path, timeout, out_path_for(file.path))
+        finally:
+            ignore.MALFORMED, _worker_state.use_mmaped_io = malformed, mmaped_io
+        return
+
+    worker_args = (log.LOG_LEVEL.value, force_load, use_mmaped_io)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        # submission order is the order workers pick files up in, so this is where largest-first matters
+        futures = {executor.submit(_pool_process_file, worker_args, command, file.path, timeout,
+                                   out_path_for(file.path)): file.path
+                   for file in files}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                yield future.result()
+            except BrokenProcessPool as ex:
+                # A worker died outright (segfault, OOM kill); everything still queued on the pool goes with it.
+                yield batch_result(futures[future], 'error', None, f'Worker process died: {ex}', 0.0)
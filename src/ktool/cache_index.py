@@ -0,0 +1,306 @@
+#
+#  ktool | ktool
+#  cache_index.py
+#
+#  Shared-cache-wide indexes of exported symbols and ObjC classes, so "which dylib has X" can be answered without
+#   loading the dylibs in the cache.
+#
+#  An index is a flat little-endian binary layout, meant to be mmaped and read in place:
+#
+#       header:     magic 'KTSCINDX' | u32 version | 16s cache uuid | u32 image count | u32 table count
+#       directory:  (4s tag | u32 bucket count | u32 entry count | u32 pad | u64 offset) * table count
+#       images:     u32 name[image count]
+#       tables:     u32 bucket start[bucket count + 1] | (u32 name | u32 image | u64 address)[entry count]
+#       strings:    NUL terminated utf-8, names being offsets into this
+#
+#  Entries are grouped by bucket (crc32(name) % bucket count), so a lookup only compares the names in one bucket.
+#
+#  This file is part of ktool. ktool is free software that
+#  is made available under the MIT license. Consult the
+#  file "LICENSE" that is distributed together with this file
+#  for the exact licensing terms.
+#
+#  Copyright (c) 0cyn 2022.
+#
+
+import mmap
+import os
+import struct
+import zlib
+from collections import namedtuple
+from typing import Dict, List, Tuple, Union
+
+from ktool_macho import LOAD_COMMAND
+from ktool.dyld_cache import DyldSharedCache, SharedCacheImageFile
+from ktool.exceptions import InvalidCacheIndexException, VMAddressingError
+from ktool.loader import ExportTrie
+from lib0cyn.log import log
+
+INDEX_MAGIC = b'KTSCINDX'
+INDEX_VERSION = 1
+
+_HEADER = struct.Struct('<8sI16sII')
+_DIRECTORY_ENTRY = struct.Struct('<4sIIIQ')
+_ENTRY = struct.Struct('<IIQ')
+_UINT32 = struct.Struct('<I')
+_UINT32_PAIR = struct.Struct('<II')
+
+_EXPORT_SYMBOL_FLAGS_KIND_MASK = 0x03
+_EXPORT_SYMBOL_FLAGS_KIND_ABSOLUTE = 0x02
+_EXPORT_SYMBOL_FLAGS_REEXPORT = 0x08
+
+index_entry = namedtuple('index_entry', ['install_name', 'address'])
+
+
+def _entries_offset(table_offset: int, bucket_count: int) -> int:
+    return table_offset + (((bucket_count + 1) * 4 + 7) & ~7)
+
+
+class _IndexWriter:
+    def __init__(self):
+        self.strings = bytearray()
+        self._string_offsets: Dict[str, int] = {}
+
+    def string(self, text: str) -> int:
+        offset = self._string_offsets.get(text)
+        if offset is None:
+            offset = self._string_offsets[text] = len(self.strings)
+            self.strings += text.encode('utf-8', errors='surrogateescape') + b'\x00'
+        return offset
+
+    def table(self, entries: List[tuple]) -> Tuple[int, bytearray]:
+        """
+        :param entries: (name, image index, address) for each entry
+        :return: Bucket count, raw table
+        """
+        bucket_count = max(1, len(entries))
+        buckets = [[] for _ in range(bucket_count)]
+        for name, image_index, address in entries:
+            raw_name = name.encode('utf-8', errors='surrogateescape')
+            buckets[zlib.crc32(raw_name) % bucket_count].append(_ENTRY.pack(self.string(name), image_index, address))
+
+        starts = [0]
+        for bucket in buckets:
+            starts.append(starts[-1] + len(bucket))
+        raw = bytearray(struct.pack(f'<{bucket_count + 1}I', *starts))
+        raw += bytes(-len(raw) % 8)
+        for bucket in buckets:
+            raw += b''.join(bucket)
+        return bucket_count, raw
+
+
+class SharedCacheIndex:
+    """
+    Index of which dylibs in a shared cache export which symbols, and define which ObjC classes.
+
+    Build one with SharedCacheIndex.from_cache(cache), or use SharedCacheIndex.for_cache(cache), which reuses the one
+        saved for that cache's UUID if there is one (and builds and saves it otherwise).
+    """
+
+    @classmethod
+    def from_cache(cls, cache: DyldSharedCache) -> 'SharedCacheIndex':
+        """
+        Index every dylib in a cache. Dylibs are read directly, no Images are loaded.
+        """
+        symbols = []
+        classes = []
+        for cache_image in cache.images:
+            # a dylib that can't be read is left out of the index, rather than leaving half of it in
+            try:
+                image_file = cache.image_file(cache_image)
+                image_symbols = [(name, cache_image.index, address)
+                                 for name, address in SharedCacheIndex._exports(cache_image.address, image_file)]
+                image_classes = [(name, cache_image.index, address)
+                                 for name, address in SharedCacheIndex._classes(cache, image_file)]
+            except Exception as ex:
+                log.warn(f'Couldn\'t index {cache_image.install_name} ({ex})')
+                continue
+            symbols += image_symbols
+            classes += image_classes
+
+        writer = _IndexWriter()
+        image_names = [writer.string(cache_image.install_name) for cache_image in cache.images]
+        tables = [(b'SYMS', len(symbols), *writer.table(symbols)), (b'CLSS', len(classes), *writer.table(classes))]
+
+        offset = _HEADER.size + _DIRECTORY_ENTRY.size * len(tables)
+        raw = bytearray(_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, cache.header.uuid, len(image_names), len(tables)))
+        body = bytearray(struct.pack(f'<{len(image_names)}I', *image_names))
+        body += bytes(-(offset + len(body)) % 8)
+        for tag, count, bucket_count, table in tables:
+            raw += _DIRECTORY_ENTRY.pack(tag, bucket_count, count, 0, offset + len(body))
+            body += table
+        raw += body
+        raw += writer.strings
+
+        return cls(raw)
+
+    @classmethod
+    def from_file(cls, filename: str) -> 'SharedCacheIndex':
+        """
+        Open an index saved to disk. The file is mmaped, lookups read straight from it, until the index is closed.
+        """
+        with open(filename, 'rb') as fp:
+            raw = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls(raw)
+        except InvalidCacheIndexException:
+            raw.close()
+            raise
+
+    @classmethod
+    def for_cache(cls, cache: DyldSharedCache, directory: str = None) -> 'SharedCacheIndex':
+        """
+        Open the saved index for a cache, or build (and save) one if there isn't one yet.
+
+        :param cache: Shared cache
+        :param directory: Where indexes are kept. Defaults to ~/.cache/ktool (or $XDG_CACHE_HOME/ktool)
+        :return: Index for the cache
+        """
+        if directory is None:
+            directory = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'ktool')
+        filename = os.path.join(directory, f'{cache.uuid}.ktidx')
+
+        if os.path.exists(filename):
+            try:
+                index = cls.from_file(filename)
+                if index.uuid == cache.header.uuid:
+                    return index
+                index.close()
+                log.warn(f'{filename} is for a different cache, rebuilding it')
+            except (InvalidCacheIndexException, ValueError) as ex:
+                log.warn(f'{filename} is unreadable ({ex}), rebuilding it')
+
+        index = cls.from_cache(cache)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # write then rename, so a reader never sees a half written index
+            with open(filename + '.tmp', 'wb') as fp:
+                fp.write(index.raw)
+            os.replace(filename + '.tmp', filename)
+        except OSError as ex:
+            log.warn(f'Couldn\'t save shared cache index to {filename} ({ex})')
+        return index
+
+    def __init__(self, raw: Union[bytes, bytearray, mmap.mmap]):
+        self.raw = raw
+
+        if len(raw) < _HEADER.size:
+            raise InvalidCacheIndexException('Shared cache index is truncated')
+        magic, version, self.uuid, self.image_count, table_count = _HEADER.unpack_from(raw, 0)
+        if magic != INDEX_MAGIC:
+            raise InvalidCacheIndexException('Not a ktool shared cache index')
+        if version != INDEX_VERSION:
+            raise InvalidCacheIndexException(f'Index version {version} is not supported (expected {INDEX_VERSION})')
+
+        self.tables = {}
+        for i in range(table_count):
+            tag, bucket_count, count, _, offset = _DIRECTORY_ENTRY.unpack_from(raw,
+                                                                               _HEADER.size + i * _DIRECTORY_ENTRY.size)
+            self.tables[tag] = (bucket_count, count, offset)
+        self._images_offset = _HEADER.size + _DIRECTORY_ENTRY.size * table_count
+
+        # strings start right after the last entry of the last table
+        self._strings_offset = max([_entries_offset(offset, bucket_count) + count * _ENTRY.size
+                                    for bucket_count, count, offset in self.tables.values()]
+                                   + [self._images_offset + self.image_count * 4])
+        if self._strings_offset > len(raw):
+            raise InvalidCacheIndexException('Shared cache index is truncated')
+
+    def close(self):
+        """
+        Unmap an index opened with from_file(). It can't be used afterwards.
+        """
+        if isinstance(self.raw, mmap.mmap):
+            self.raw.close()
+
+    def _string(self, offset: int) -> bytes:
+        start = self._strings_offset + offset
+        return self.raw[start:self.raw.find(b'\x00', start)]
+
+    def install_name(self, image_index: int) -> str:
+        offset, = _UINT32.unpack_from(self.raw, self._images_offset + image_index * 4)
+        return self._string(offset).decode('utf-8', errors='surrogateescape')
+
+    def _lookup(self, tag: bytes, name: str) -> List[index_entry]:
+        bucket_count, _, offset = self.tables[tag]
+        raw_name = name.encode('utf-8', errors='surrogateescape')
+        start, end = _UINT32_PAIR.unpack_from(self.raw, offset + zlib.crc32(raw_name) % bucket_count * 4)
+        entries_offset = _entries_offset(offset, bucket_count)
+
+        found = []
+        terminated = raw_name + b'\x00'
+        for entry_offset in range(entries_offset + start * _ENTRY.size, entries_offset + end * _ENTRY.size,
+                                  _ENTRY.size):
+            name_offset, image_index, address = _ENTRY.unpack_from(self.raw, entry_offset)
+            name_start = self._strings_offset + name_offset
+            if self.raw[name_start:name_start + len(terminated)] == terminated:
+                found.append(index_entry(self.install_name(image_index), address))
+        return found
+
+    def symbol(self, name: str) -> List[index_entry]:
+        """
+        Find the dylib(s) exporting a symbol
+
+        :param name: Full symbol name (e.g. _objc_msgSend)
+        :return: (install name, address) for every dylib that exports it (re-exports aren't included)
+        """
+        return self._lookup(b'SYMS', name)
+
+    def objc_class(self, name: str) -> List[index_entry]:
+        """
+        Find the dylib(s) defining an ObjC class
+
+        :param name: Class name (e.g. NSObject)
+        :return: (install name, address of the class) for every dylib with the class in its classlist
+        """
+        return self._lookup(b'CLSS', name)
+
+    @staticmethod
+    def _exports(header_address: int, image_file: SharedCacheImageFile):
+        export_start, export_size = 0, 0
+        for cmd, offset in image_file.load_commands:
+            if cmd in (LOAD_COMMAND.DYLD_INFO.value, LOAD_COMMAND.DYLD_INFO_ONLY.value):
+                export_start, export_size = _UINT32_PAIR.unpack_from(image_file.header, offset + 0x28)
+            elif cmd == LOAD_COMMAND.LC_DYLD_EXPORTS_TRIE.value:
+                export_start, export_size = _UINT32_PAIR.unpack_from(image_file.header, offset + 0x8)
+        if not export_size:
+            return
+
+        for node in ExportTrie.walk(image_file.read_bytes(export_start, export_size)):
+            if node.flags & _EXPORT_SYMBOL_FLAGS_REEXPORT:
+                continue
+            if node.flags & _EXPORT_SYMBOL_FLAGS_KIND_MASK == _EXPORT_SYMBOL_FLAGS_KIND_ABSOLUTE:
+                yield node.text, node.offset
+            else:
+                yield node.text, header_address + node.offset
+
+    @staticmethod
+    def _classes(cache: DyldSharedCache, image_file: SharedCacheImageFile):
+        if image_file.is64:
+            segment_cmd, ptr_size, section_start, section_size = LOAD_COMMAND.SEGMENT_64.value, 8, 0x48, 0x50
+        else:
+            segment_cmd, ptr_size, section_start, section_size = LOAD_COMMAND.SEGMENT.value, 4, 0x38, 0x44
+
+        header = image_file.header
+        for cmd, offset in image_file.load_commands:
+            if cmd != segment_cmd:
+                continue
+            section_count, = _UINT32.unpack_from(header, offset + section_start - 8)
+            for i in range(section_count):
+                section = offset + section_start + i * section_size
+                if header[section:section + 16].rstrip(b'\x00') != b'__objc_classlist':
+                    continue
+                address = int.from_bytes(header[section + 0x20:section + 0x20 + ptr_size], 'little')
+                size = int.from_bytes(header[section + 0x20 + ptr_size:section + 0x20 + 2 * ptr_size], 'little')
+
+                for entry in range(address, address + size, ptr_size):
+                    try:
+                        class_address = cache.read_pointer(entry, ptr_size)
+                        # objc2_class.info, then objc2_class_ro.name
+                        ro_address = cache.read_pointer(class_address + 4 * ptr_size, ptr_size) >> 2 << 2
+                        name_address = cache.read_pointer(ro_address + (0x18 if ptr_size == 8 else 0x10), ptr_size)
+                        name = cache.read_cstr(name_address)
+                    except VMAddressingError as ex:
+                        log.debug(f'Skipping class at {hex(entry)} in {image_file.name} ({ex})')
+                        continue
+                    yield name, class_address
@@ -0,0 +1,585 @@
+#
+#  ktool | ktool
+#  dyld_cache.py
+#
+#  dyld shared cache support. Dylibs are loaded as regular Images, read straight out of the (mmaped) cache and
+#   subcache files rather than being extracted first.
+#
+#  This file is part of ktool. ktool is free software that
+#  is made available under the MIT license. Consult the
+#  file "LICENSE" that is distributed together with this file
+#  for the exact licensing terms.
+#
+#  Copyright (c) 0cyn 2022.
+#
+
+import os
+from bisect import bisect_right
+from collections import namedtuple
+from typing import Dict, List, Tuple, Union
+
+from ktool_macho import LOAD_COMMAND, MH_MAGIC, MH_MAGIC_64
+from lib0cyn.structs import *
+from lib0cyn.log import log
+from ktool.exceptions import MalformedMachOException, UnsupportedFiletypeException, VMAddressingError
+from ktool.image import Image
+from ktool.loader import MachOImageLoader
+from ktool.macho import BackingFile, Slice
+
+
+class dyld_cache_header(Struct):
+    """
+    Every field up to cacheSubType. Older caches have shorter headers (the header ends where the mappings begin);
+        fields past the end of those are read as 0.
+    """
+    _FIELDNAMES = ['magic', 'mappingOffset', 'mappingCount', 'imagesOffsetOld', 'imagesCountOld', 'dyldBaseAddress',
+                   'codeSignatureOffset', 'codeSignatureSize', 'slideInfoOffsetUnused', 'slideInfoSizeUnused',
+                   'localSymbolsOffset', 'localSymbolsSize', 'uuid', 'cacheType', 'branchPoolsOffset',
+                   'branchPoolsCount', 'dyldInCacheMH', 'dyldInCacheEntry', 'imagesTextOffset', 'imagesTextCount',
+                   'patchInfoAddr', 'patchInfoSize', 'otherImageGroupAddrUnused', 'otherImageGroupSizeUnused',
+                   'progClosuresAddr', 'progClosuresSize', 'progClosuresTrieAddr', 'progClosuresTrieSize', 'platform',
+                   'formatVersion', 'sharedRegionStart', 'sharedRegionSize', 'maxSlide', 'dylibsImageArrayAddr',
+                   'dylibsImageArraySize', 'dylibsTrieAddr', 'dylibsTrieSize', 'otherImageArrayAddr',
+                   'otherImageArraySize', 'otherTrieAddr', 'otherTrieSize', 'mappingWithSlideOffset',
+                   'mappingWithSlideCount', 'dylibsPBLStateArrayAddrUnused', 'dylibsPBLSetAddr',
+                   'programsPBLSetPoolAddr', 'programsPBLSetPoolSize', 'programTrieAddr', 'programTrieSize',
+                   'osVersion', 'altPlatform', 'altOsVersion', 'swiftOptsOffset', 'swiftOptsSize',
+                   'subCacheArrayOffset', 'subCacheArrayCount', 'symbolFileUUID', 'rosettaReadOnlyAddr',
+                   'rosettaReadOnlySize', 'rosettaReadWriteAddr', 'rosettaReadWriteSize', 'imagesOffset',
+                   'imagesCount', 'cacheSubType']
+    _SIZES = [char_t[16], uint32_t, uint32_t, uint32_t, uint32_t, uint64_t,
+              uint64_t, uint64_t, uint64_t, uint64_t,
+              uint64_t, uint64_t, bytes_t[16], uint64_t, uint32_t,
+              uint32_t, uint64_t, uint64_t, uint64_t, uint64_t,
+              uint64_t, uint64_t, uint64_t, uint64_t,
+              uint64_t, uint64_t, uint64_t, uint64_t, uint32_t,
+              uint32_t, uint64_t, uint64_t, uint64_t, uint64_t,
+              uint64_t, uint64_t, uint64_t, uint64_t,
+              uint64_t, uint64_t, uint64_t, uint32_t,
+              uint32_t, uint64_t, uint64_t,
+              uint64_t, uint64_t, uint64_t, uint32_t,
+              uint32_t, uint32_t, uint32_t, uint64_t, uint64_t,
+              uint32_t, uint32_t, bytes_t[16], uint64_t,
+              uint64_t, uint64_t, uint64_t, uint32_t,
+              uint32_t, uint32_t]
+    SIZE = sum([0xffff & i for i in _SIZES])
+
+    def __init__(self, byte_order="little"):
+        super().__init__(fields=self._FIELDNAMES, sizes=self._SIZES, byte_order=byte_order)
+
+
+# header offsets of the fields whose presence changes how the rest of the cache is laid out
+_SUBCACHE_ARRAY_OFFSET = 0x188
+_IMAGES_OFFSET = 0x1c0
+_CACHE_SUBTYPE = 0x1c8
+
+
+class dyld_cache_mapping_info(Struct):
+    _FIELDNAMES = ['address', 'size', 'fileOffset', 'maxProt', 'initProt']
+    _SIZES = [uint64_t, uint64_t, uint64_t, uint32_t, uint32_t]
+    SIZE = sum(_SIZES)
+
+    def __init__(self, byte_order="little"):
+        super().__init__(fields=self._FIELDNAMES, sizes=self._SIZES, byte_order=byte_order)
+
+
+class dyld_cache_mapping_and_slide_info(Struct):
+    _FIELDNAMES = ['address', 'size', 'fileOffset', 'slideInfoFileOffset', 'slideInfoFileSize', 'flags', 'maxProt',
+                   'initProt']
+    _SIZES = [uint64_t, uint64_t, uint64_t, uint64_t, uint64_t, uint64_t, uint32_t, uint32_t]
+    SIZE = sum(_SIZES)
+
+    def __init__(self, byte_order="little"):
+        super().__init__(fields=self._FIELDNAMES, sizes=self._SIZES, byte_order=byte_order)
+
+
+class dyld_cache_image_info(Struct):
+    _FIELDNAMES = ['address', 'modTime', 'inode', 'pathFileOffset', 'pad']
+    _SIZES = [uint64_t, uint64_t, uint64_t, uint32_t, uint32_t]
+    SIZE = sum(_SIZES)
+
+    def __init__(self, byte_order="little"):
+        super().__init__(fields=self._FIELDNAMES, sizes=self._SIZES, byte_order=byte_order)
+
+
+class dyld_subcache_entry_v1(Struct):
+    """
+    Subcache entry in caches from before cacheSubType was added. Subcache files are named <cache>.1, <cache>.2, ...
+    """
+    _FIELDNAMES = ['uuid', 'cacheVMOffset']
+    _SIZES = [bytes_t[16], uint64_t]
+    SIZE = sum([0xffff & i for i in _SIZES])
+
+    def __init__(self, byte_order="little"):
+        super().__init__(fields=self._FIELDNAMES, sizes=self._SIZES, byte_order=byte_order)
+
+
+class dyld_subcache_entry(Struct):
+    _FIELDNAMES = ['uuid', 'cacheVMOffset', 'fileSuffix']
+    _SIZES = [bytes_t[16], uint64_t, char_t[32]]
+    SIZE = sum([0xffff & i for i in _SIZES])
+
+    def __init__(self, byte_order="little"):
+        super().__init__(fields=self._FIELDNAMES, sizes=self._SIZES, byte_order=byte_order)
+
+
+cache_mapping = namedtuple('cache_mapping', ['address', 'size', 'file_offset', 'file', 'slide'])
+# How pointers in a mapping are stored; (slide info version, delta_mask, value_add), or None if they're stored as-is
+slide_info = namedtuple('slide_info', ['version', 'delta_mask', 'value_add'])
+cache_image = namedtuple('cache_image', ['install_name', 'address', 'index'])
+_image_segment = namedtuple('_image_segment', ['file_offset', 'file_size', 'vm_address'])
+
+# Where (within each command) the offsets pointing into __LINKEDIT are
+_LINKEDIT_OFFSET_FIELDS = {
+    LOAD_COMMAND.SYMTAB.value: (0x8, 0x10),
+    LOAD_COMMAND.DYSYMTAB.value: (0x20, 0x28, 0x30, 0x38, 0x40, 0x48),
+    LOAD_COMMAND.DYLD_INFO.value: (0x8, 0x10, 0x18, 0x20, 0x28),
+    LOAD_COMMAND.DYLD_INFO_ONLY.value: (0x8, 0x10, 0x18, 0x20, 0x28),
+    **{command.value: (0x8,) for command in [LOAD_COMMAND.CODE_SIGNATURE, LOAD_COMMAND.SEGMENT_SPLIT_INFO,
+                                             LOAD_COMMAND.FUNCTION_STARTS, LOAD_COMMAND.DATA_IN_CODE,
+                                             LOAD_COMMAND.DYLIB_CODE_SIGN_DRS,
+                                             LOAD_COMMAND.LINKER_OPTIMIZATION_HINT,
+                                             LOAD_COMMAND.LC_DYLD_EXPORTS_TRIE, LOAD_COMMAND.LC_DYLD_CHAINED_FIXUPS]}
+}
+
+# Segments get laid out in an image's view of the cache at this alignment
+_VIEW_SEGMENT_ALIGN = 0x4000
+
+
+class SharedCacheImageFile:
+    """
+    Backing "file" for one dylib in a shared cache.
+
+    A dylib's segments can be spread across several cache files, where their file offsets overlap, so the view lays
+        them out one after another instead (__TEXT first, at 0) and serves a copy of the header and load commands with
+        the offsets in them updated to match. Everything else is read straight from the cache when it's asked for.
+
+    It stands in for both the BackingFile and the buffer (.file) a Slice reads from.
+    """
+
+    def __init__(self, cache: 'DyldSharedCache', name: str, header: bytearray, segments: List[_image_segment]):
+        """
+        :param cache: Cache the image is in
+        :param name: File name of the image
+        :param header: Mach header and load commands (already rewritten for this view)
+        :param segments: Location of each segment in this view, sorted by file_offset and not overlapping
+        """
+        self.cache = cache
+        self.name = name
+        self.header = header
+        self.segments = segments
+        self._starts = [segment.file_offset for segment in segments]
+        self.size = max(segment.file_offset + segment.file_size for segment in segments)
+        self.modified = False
+
+        self.is64 = True
+        # (cmd, offset in .header) for each load command
+        self.load_commands: List[Tuple[int, int]] = []
+
+    @property
+    def file(self) -> 'SharedCacheImageFile':
+        return self
+
+    def __len__(self):
+        return self.size
+
+    def _segment_for(self, location: int) -> Union[_image_segment, None]:
+        index = bisect_right(self._starts, location) - 1
+        if index >= 0:
+            segment = self.segments[index]
+            if location < segment.file_offset + segment.file_size:
+                return segment
+        return None
+
+    def _read_run(self, location: int, count: int) -> bytes:
+        """
+        Read as much of [location, location + count) as lives in one place (the header, or a single segment)
+        """
+        if location < len(self.header):
+            return bytes(self.header[location:location + count])
+        segment = self._segment_for(location)
+        if segment is None:
+            return b''
+        count = min(count, segment.file_offset + segment.file_size - location)
+        return self.cache.read_bytes(segment.vm_address + (location - segment.file_offset), count)
+
+    def read_bytes(self, location, count):
+        run = self._read_run(location, count)
+        if len(run) == count or not run:
+            return run
+        out = bytearray(run)
+        while len(out) < count:
+            run = self._read_run(location + len(out), count - len(out))
+            if not run:
+                break
+            out += run
+        return bytes(out)
+
+    def read_int(self, location, count, endian="big"):
+        return int.from_bytes(self.read_bytes(location, count), endian)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, _ = item.indices(self.size)
+            return self.read_bytes(start, max(0, stop - start))
+        run = self._read_run(item, 1)
+        if not run:
+            raise IndexError(f'{hex(item)} is outside of every segment in {self.name}')
+        return run[0]
+
+    def find(self, pattern: bytes) -> int:
+        found = self.header.find(pattern)
+        if found != -1:
+            return found
+        for segment in self.segments:
+            found = self.read_bytes(segment.file_offset, segment.file_size).find(pattern)
+            if found != -1:
+                return segment.file_offset + found
+        return -1
+
+    def write(self, location, data: bytes):
+        self.write_many([(location, data)])
+
+    def write_many(self, writes):
+        # cache files are mapped copy-on-write, so these only ever change our view of the cache
+        for location, data in writes:
+            data = bytes(data)
+            while data:
+                if location < len(self.header):
+                    run = min(len(data), len(self.header) - location)
+                    self.header[location:location + run] = data[:run]
+                else:
+                    segment = self._segment_for(location)
+                    if segment is None:
+                        raise IndexError(f'Write at {hex(location)} is outside of every segment in {self.name}')
+                    run = min(len(data), segment.file_offset + segment.file_size - location)
+                    self.cache.write_bytes(segment.vm_address + (location - segment.file_offset), data[:run])
+                location += run
+                data = data[run:]
+        self.modified = True
+
+    def write_to(self, fp, location=0, count=None):
+        if count is None:
+            count = self.size - location
+        fp.write(self.read_bytes(location, count))
+
+
+class DyldSharedCache:
+    """
+    A dyld shared cache, along with any subcache files next to it.
+
+    Every mapping from every cache file is put into a single VM, which dylibs are read through. Dylibs are only
+        loaded into Images once they're asked for, via .image(install_name).
+    """
+
+    def __init__(self, path: str, use_mmaped_io=True):
+        """
+        :param path: Path to the main cache file. Subcache files are expected to be beside it.
+        :param use_mmaped_io: mmap the cache files. Turning this off reads every one of them into memory.
+        """
+        self.path = path
+        self.filename = os.path.basename(path)
+        self.use_mmaped_io = use_mmaped_io
+
+        self.files: List[BackingFile] = []
+        self.mappings: List[cache_mapping] = []
+        self._mapping_starts: List[int] = []
+
+        main_file = self._open_cache_file(path)
+        self.header: dyld_cache_header = self._read_header(main_file)
+        self._add_mappings(main_file, self.header)
+
+        self.subcaches: List[str] = []
+        for suffix in self._subcache_suffixes():
+            subcache_path = path + suffix
+            if not os.path.exists(subcache_path):
+                log.warn(f'Subcache {subcache_path} is missing, anything in it won\'t be readable')
+                continue
+            subcache_file = self._open_cache_file(subcache_path)
+            self._add_mappings(subcache_file, self._read_header(subcache_file))
+            self.subcaches.append(subcache_path)
+
+        self.mappings.sort(key=lambda m: m.address)
+        self._mapping_starts = [mapping.address for mapping in self.mappings]
+
+        self.images: List[cache_image] = self._load_image_list(main_file)
+        self._image_index: Dict[str, cache_image] = {image.install_name: image for image in self.images}
+        self._loaded_images: Dict[str, Image] = {}
+
+    def _open_cache_file(self, path: str) -> BackingFile:
+        backing_file = BackingFile(open(path, 'rb'), use_mmaped_io=self.use_mmaped_io)
+        self.files.append(backing_file)
+        return backing_file
+
+    @staticmethod
+    def _read_header(cache_file: BackingFile) -> dyld_cache_header:
+        magic = cache_file.read_bytes(0, 16)
+        if not magic.startswith(b'dyld_v'):
+            raise UnsupportedFiletypeException(f'Bad shared cache magic {magic}')
+        mapping_offset = cache_file.read_int(0x10, 4, 'little')
+        raw = cache_file.read_bytes(0, min(mapping_offset, dyld_cache_header.size()))
+        return Struct.create_with_bytes(dyld_cache_header, raw.ljust(dyld_cache_header.size(), b'\x00'))
+
+    def _add_mappings(self, cache_file: BackingFile, header: dyld_cache_header):
+        if header.mappingWithSlideCount:
+            for i in range(header.mappingWithSlideCount):
+                offset = header.mappingWithSlideOffset + i * dyld_cache_mapping_and_slide_info.size()
+                info = Struct.create_with_bytes(dyld_cache_mapping_and_slide_info,
+                                                cache_file.read_bytes(offset, dyld_cache_mapping_and_slide_info.size()))
+                slide = self._read_slide_info(cache_file, info.slideInfoFileOffset) \
+                    if info.slideInfoFileSize else None
+                self.mappings.append(cache_mapping(info.address, info.size, info.fileOffset, cache_file, slide))
+            return
+
+        for i in range(header.mappingCount):
+            offset = header.mappingOffset + i * dyld_cache_mapping_info.size()
+            info = Struct.create_with_bytes(dyld_cache_mapping_info,
+                                            cache_file.read_bytes(offset, dyld_cache_mapping_info.size()))
+            # before per-mapping slide info, the only slid mapping was the second (__DATA) one
+            slide = self._read_slide_info(cache_file, header.slideInfoOffsetUnused) \
+                if i == 1 and header.slideInfoSizeUnused else None
+            self.mappings.append(cache_mapping(info.address, info.size, info.fileOffset, cache_file, slide))
+
+    @staticmethod
+    def _read_slide_info(cache_file: BackingFile, offset: int) -> Union[slide_info, None]:
+        version = cache_file.read_int(offset, 4, 'little')
+        if version in (2, 4):
+            # dyld_cache_slide_info2 / 4 : ..., u64 delta_mask, u64 value_add
+            return slide_info(version, cache_file.read_int(offset + 0x18, 8, 'little'),
+                              cache_file.read_int(offset + 0x20, 8, 'little'))
+        if version in (3, 5):
+            # dyld_cache_slide_info3 / 5 : ..., u64 auth_value_add / value_add
+            return slide_info(version, 0, cache_file.read_int(offset + 0x10, 8, 'little'))
+        if version != 1:
+            log.warn(f'Unknown slide info version {version} in {cache_file.name}, pointers in it won\'t be decoded')
+        return None
+
+    def _subcache_suffixes(self) -> List[str]:
+        header = self.header
+        if header.mappingOffset <= _SUBCACHE_ARRAY_OFFSET or header.subCacheArrayCount == 0:
+            return []
+
+        main_file = self.files[0]
+        suffixes = []
+        if header.mappingOffset <= _CACHE_SUBTYPE:
+            entry_type = dyld_subcache_entry_v1
+        else:
+            entry_type = dyld_subcache_entry
+        for i in range(header.subCacheArrayCount):
+            offset = header.subCacheArrayOffset + i * entry_type.size()
+            entry = Struct.create_with_bytes(entry_type, main_file.read_bytes(offset, entry_type.size()))
+            suffixes.append(entry.fileSuffix if entry_type is dyld_subcache_entry else f'.{i + 1}')
+        return suffixes
+
+    def _load_image_list(self, main_file: BackingFile) -> List[cache_image]:
+        header = self.header
+        if header.mappingOffset > _IMAGES_OFFSET and header.imagesCount:
+            images_offset, images_count = header.imagesOffset, header.imagesCount
+        else:
+            images_offset, images_count = header.imagesOffsetOld, header.imagesCountOld
+
+        raw = main_file.read_bytes(images_offset, images_count * dyld_cache_image_info.size())
+        images = []
+        for i in range(images_count):
+            info = Struct.create_with_bytes(dyld_cache_image_info, raw[i * dyld_cache_image_info.size():])
+            path_end = main_file.file.find(b'\x00', info.pathFileOffset)
+            install_name = main_file.read_bytes(info.pathFileOffset, path_end - info.pathFileOffset).decode('utf-8')
+            images.append(cache_image(install_name, info.address, i))
+        return images
+
+    def translate(self, vm_address: int) -> cache_mapping:
+        """
+        Find the mapping a VM address falls in
+
+        :param vm_address: Address in the cache
+        :return: cache_mapping
+        :raises VMAddressingError: If the address isn't mapped by the cache or any loaded subcache
+        """
+        index = bisect_right(self._mapping_starts, vm_address) - 1
+        if index >= 0:
+            mapping = self.mappings[index]
+            if vm_address < mapping.address + mapping.size:
+                return mapping
+        raise VMAddressingError(f'Address {hex(vm_address)} is not mapped by {self.filename} or its subcaches')
+
+    def read_bytes(self, vm_address: int, count: int) -> bytes:
+        """
+        Read bytes from the cache by VM address. Reads stop at the end of the mapping vm_address is in.
+        """
+        mapping = self.translate(vm_address)
+        count = min(count, mapping.address + mapping.size - vm_address)
+        return mapping.file.read_bytes(mapping.file_offset + (vm_address - mapping.address), count)
+
+    def write_bytes(self, vm_address: int, data: bytes):
+        mapping = self.translate(vm_address)
+        mapping.file.write(mapping.file_offset + (vm_address - mapping.address), data)
+
+    def read_cstr(self, vm_address: int) -> str:
+        mapping = self.translate(vm_address)
+        start = mapping.file_offset + (vm_address - mapping.address)
+        end = mapping.file.file.find(b'\x00', start, mapping.file_offset + mapping.size)
+        if end == -1:
+            end = mapping.file_offset + mapping.size
+        return mapping.file.read_bytes(start, end - start).decode('utf-8', errors='replace')
+
+    def read_pointer(self, vm_address: int, ptr_size: int = 8) -> int:
+        """
+        Read a pointer out of the cache, undoing however it was encoded for sliding (see untag_pointer)
+
+        :param vm_address: Address of the pointer
+        :param ptr_size: Pointer size of the cache's dylibs
+        :return: Address it points to
+        """
+        mapping = self.translate(vm_address)
+        raw = mapping.file.read_int(mapping.file_offset + (vm_address - mapping.address), ptr_size, 'little')
+        return self.untag_pointer(raw, mapping.slide)
+
+    @staticmethod
+    def untag_pointer(raw: int, slide: Union[slide_info, None]) -> int:
+        """
+        Decode a pointer as stored in a mapping with the given slide info
+
+        :param raw: Pointer as stored in the cache file
+        :param slide: Slide info of the mapping the pointer is in
+        :return: Unslid address it points to
+        """
+        if slide is None:
+            return raw
+        if slide.version in (2, 4):
+            value = raw & ~slide.delta_mask
+            return value + slide.value_add if value else 0
+        if slide.version == 3:
+            if raw & (1 << 63):
+                return (raw & 0xffffffff) + slide.value_add
+            # 51 bit pointer value; top byte in 43..50, then the bottom 43 bits
+            return ((raw >> 43) & 0xff) << 56 | raw & 0x7ffffffffff
+        if slide.version == 5:
+            target = (raw & 0x3ffffffff) + slide.value_add
+            if not raw & (1 << 63):
+                target |= ((raw >> 34) & 0xff) << 56
+            return target
+        return raw
+
+    @property
+    def uuid(self) -> str:
+        return self.header.uuid.hex().upper()
+
+    @property
+    def install_names(self) -> List[str]:
+        return [image.install_name for image in self.images]
+
+    def __contains__(self, install_name: str) -> bool:
+        return install_name in self._image_index
+
+    def __len__(self):
+        return len(self.images)
+
+    def image(self, install_name: str) -> Image:
+        """
+        Get a dylib in the cache as an Image. It's loaded the first time it's asked for, and reused after that.
+
+        :param install_name: Install name of the dylib, e.g. /usr/lib/libobjc.A.dylib
+        :return: Loaded Image
+        :raises KeyError: If there's no dylib with that install name in the cache
+        """
+        loaded = self._loaded_images.get(install_name)
+        if loaded is None:
+            loaded = self._loaded_images[install_name] = self._load_image(self._image_index[install_name])
+        return loaded
+
+    def _load_image(self, cache_image_info: cache_image) -> Image:
+        image = MachOImageLoader.load(Slice(self, self.image_file(cache_image_info)))
+        image.pointer_decoder = self.decode_pointer
+        return image
+
+    def decode_pointer(self, vm_address: int, raw: int) -> int:
+        """
+        Decode a pointer already read out of the cache, per the slide info of the mapping it was read from
+
+        :param vm_address: Address the pointer was read from
+        :param raw: Pointer as stored in the cache file
+        :return: Address it points to
+        """
+        return self.untag_pointer(raw, self.translate(vm_address).slide)
+
+    def image_file(self, cache_image_info: cache_image) -> SharedCacheImageFile:
+        """
+        Get the view of the cache one of its dylibs is loaded from, without loading an Image from it
+
+        :param cache_image_info: Entry in .images for the dylib
+        :return: SharedCacheImageFile
+        """
+        header_address = cache_image_info.address
+        magic = int.from_bytes(self.read_bytes(header_address, 4), 'little')
+        if magic != MH_MAGIC_64 and magic != MH_MAGIC:
+            raise UnsupportedFiletypeException(f'{cache_image_info.install_name} has bad magic {hex(magic)}')
+        is64 = magic == MH_MAGIC_64
+        header_size = 0x20 if is64 else 0x1c
+        command_count = int.from_bytes(self.read_bytes(header_address + 0x10, 4), 'little')
+        commands_size = int.from_bytes(self.read_bytes(header_address + 0x14, 4), 'little')
+        header = bytearray(self.read_bytes(header_address, header_size + commands_size))
+
+        # segment command type, size of its address fields, and where its (and its sections') fields are
+        if is64:
+            segment_cmd, int_size, section_start, section_size = LOAD_COMMAND.SEGMENT_64.value, 8, 0x48, 0x50
+        else:
+            segment_cmd, int_size, section_start, section_size = LOAD_COMMAND.SEGMENT.value, 4, 0x38, 0x44
+        fields_start = 0x18
+
+        def field(offset, size=4):
+            return int.from_bytes(header[offset:offset + size], 'little')
+
+        def set_field(offset, value, size=4):
+            header[offset:offset + size] = value.to_bytes(size, 'little')
+
+        commands = []
+        cursor = header_size
+        for _ in range(command_count):
+            cmd, cmd_size = field(cursor), field(cursor + 4)
+            if cmd_size < 8 or cursor + cmd_size > len(header):
+                log.error(f'Malformed load command in {cache_image_info.install_name} @ {hex(cursor)}')
+                break
+            commands.append((cmd, cursor))
+            cursor += cmd_size
+
+        # Lay the segments out back to back, with whichever one holds the mach header first
+        segment_commands = [c for cmd, c in commands if cmd == segment_cmd]
+        segment_commands.sort(key=lambda c: field(c + fields_start, int_size) != header_address)
+        segments = []
+        linkedit = None
+        view_offset = 0
+        for c in segment_commands:
+            vm_address = field(c + fields_start, int_size)
+            file_offset = field(c + fields_start + 2 * int_size, int_size)
+            file_size = field(c + fields_start + 3 * int_size, int_size)
+            if file_size == 0:
+                continue
+            set_field(c + fields_start + 2 * int_size, view_offset, int_size)
+            for i in range(field(c + section_start - 8)):
+                section_offset = c + section_start + i * section_size + 0x20 + 2 * int_size
+                if field(section_offset):
+                    set_field(section_offset, field(section_offset) - file_offset + view_offset)
+            if header[c + 8:c + 0x18].rstrip(b'\x00') == b'__LINKEDIT':
+                linkedit = (file_offset, file_size, view_offset)
+            segments.append(_image_segment(view_offset, file_size, vm_address))
+            view_offset = (view_offset + file_size + _VIEW_SEGMENT_ALIGN - 1) & ~(_VIEW_SEGMENT_ALIGN - 1)
+
+        if not segments or segments[0].vm_address != header_address:
+            raise MalformedMachOException(f'{cache_image_info.install_name} has no segment holding its mach header')
+
+        if linkedit:
+            linkedit_start, linkedit_size, linkedit_view_offset = linkedit
+            for cmd, c in commands:
+                for offset in _LINKEDIT_OFFSET_FIELDS.get(cmd, ()):
+                    value = field(c + offset)
+                    if linkedit_start <= value < linkedit_start + linkedit_size:
+                        set_field(c + offset, value - linkedit_start + linkedit_view_offset)
+
+        image_file = SharedCacheImageFile(self, os.path.basename(cache_image_info.install_name), header, segments)
+        image_file.is64 = is64
+        image_file.load_commands = commands
+        return image_file
+
+    def close(self):
+        for cache_file in self.files:
+            cache_file.close()
@@ -37,3 +37,25 @@ class UnsupportedFiletypeException(Exception):
 class NoObjCMetadataException(Exception):
     """
     """
+
+
+class ProcessingTimeoutException(BaseException):
+    """
+    Raised from a SIGALRM handler when a file runs past its batch timeout. It isn't an Exception so that the
+    `except Exception` blocks that skip over bad metadata can't swallow it.
+    """
+
+
+class InvalidSnapshotException(Exception):
+    """
+    """
+
+
+class InvalidCacheIndexException(Exception):
+    """
+    """
+
+
+class UnsupportedArchiveException(Exception):
+    """
+    """
@@ -17,7 +17,7 @@ from collections import namedtuple
 
 from ktool_macho.structs import *
 from lib0cyn.log import log
-from ktool.loader import MachOImageLoader, SymbolType, Image
+from ktool.loader import SymbolType, Image
 from ktool.macho import Slice
 from ktool.objc import ObjCImage
 
@@ -113,6 +113,22 @@ class FatMachOGenerator:
 
         self.fat_head = fat_head
 
+    def write_to(self, fp):
+        """
+        Stream the fat MachO out to fp.
+
+        The fat header and arch table are written first, then each slice is copied straight into place, so nothing
+            but the header is ever built in memory.
+
+        :param fp: Writable file object, positioned where the fat MachO should start (usually 0)
+        """
+        fp.write(self.fat_head)
+        position = len(self.fat_head)
+        for arch in self.fat_archs:
+            fp.write(bytes(arch.offset - position))
+            arch.slice.write_to(fp)
+            position = arch.offset + arch.size
+
     @staticmethod
     def _fat_arch_for_slice(fat_slice: Slice, previous_fat_arch: fat_arch_for_slice) -> fat_arch_for_slice:
         """
@@ -123,9 +139,9 @@ class FatMachOGenerator:
         :return: fat_arch_for_slice item.
         :rtype: fat_arch_for_slice
         """
-        lib = MachOImageLoader.load(fat_slice)
-        cpu_type = lib.macho_header.dyld_header.cpu_type
-        cpu_subtype = lib.macho_header.dyld_header.cpu_subtype
+        header = fat_slice.read_struct(0, mach_header)
+        cpu_type = header.cpu_type
+        cpu_subtype = header.cpu_subtype
 
         if len(fat_slice.macho_file.slices) > 1:
             size = fat_slice.arch_struct.size
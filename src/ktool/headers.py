@@ -12,20 +12,57 @@
 #  Copyright (c) 0cyn 2021.
 #
 
-from typing import List, Dict
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+from collections import namedtuple, OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Iterator, Optional, Set, Tuple, Union
 
 from ktool.loader import SymbolType, Image
 from ktool.objc import ObjCImage, Class, Category, Protocol, Property, Method, Ivar
 
-from ktool.util import KTOOL_VERSION
+from ktool.util import KTOOL_VERSION, opts
+from lib0cyn.log import log
 
 from pygments import highlight
 from pygments.formatters.terminal import TerminalFormatter
+from pygments.formatters.terminal256 import Terminal256Formatter
 try:
     from pygments.lexers.objective import ObjectiveCLexer
 except ImportError:
     ObjectiveCLexer = None
 
+# Classes, categories and protocols handed to a header generation worker at once
+HEADERS_PER_TASK = 0x80
+# Below this many headers, starting a process pool costs more than it saves
+HEADER_PARALLEL_MIN_HEADERS = 0x400
+# Header files written per task by write_headers()
+HEADER_WRITES_PER_TASK = 0x40
+# Written into a header output directory by update_headers(), recording what each header was generated from
+HEADER_MANIFEST_NAME = '.ktool-headers.json'
+# Bump when header_hash() or the manifest layout changes, so old manifests are ignored
+HEADER_MANIFEST_VERSION = 1
+# Highlighted header texts kept by highlight_header_text()
+HIGHLIGHT_CACHE_SIZE = 0x40
+
+# Every kind of token the builtin highlighter colors. Headers only ever contain what ktool generates, so this
+#   doesn't have to handle ObjC in general.
+_OBJC_HEADER_TOKENS = re.compile(r'(?P<comment>//[^\n]*)'
+                                 r'|(?P<preproc>^#\w+)'
+                                 r'|(?P<string>"[^"\n]*"|(?<=#import )<[^>\n]*>)'
+                                 r'|(?P<keyword>@\w+)'
+                                 r'|(?P<type>\b(?:void|id|BOOL|char|short|int|long|unsigned|float|double|struct|union|'
+                                 r'const|SEL|Class|instancetype|NSInteger|NSUInteger|CGFloat|uint8_t)\b)', re.M)
+# (256 color, 16 color) for each kind of token
+_OBJC_HEADER_COLORS = {'comment': ('38;5;244', '37'), 'preproc': ('38;5;73', '36'), 'string': ('38;5;180', '33'),
+                       'keyword': ('38;5;110', '34'), 'type': ('38;5;115', '36')}
+
+# (highlighter, text) -> highlighted text, least recently used first
+_highlight_cache = OrderedDict()
+
 
 class HeaderUtils:
 
@@ -96,11 +133,34 @@ class TypeResolver:
         except AttributeError:
             pass
         self.classes = classes
-        self.local_classes = objc_image.classlist
-        self.local_protos = objc_image.protolist
+        self.local_classes = objc_image.classes_by_name
+        self.local_protos = objc_image.protos_by_name
+
+        # Install name each imported class resolves to, worked out once here rather than per lookup
+        self.import_install_names: Dict[str, Optional[str]] = {}
+        for classname, sym in self.classmap.items():
+            try:
+                name = objc_image.image.linked_images[int(sym.ordinal) - 1].install_name
+            except IndexError:
+                continue
+            except ValueError:
+                # opcode binds carry the install name they resolved to already
+                name = sym.ordinal
+            self.import_install_names[classname] = None if '.dylib' in name else name
 
         self._linked_cache = {'NSObject': '/System/Library/Frameworks/Foundation'}
 
+    def __getstate__(self):
+        # Copies (for header generation workers) don't get the image; find_linked() only needs the names in
+        #   the local indexes and the precomputed install names.
+        state = self.__dict__.copy()
+        state['objc_image'] = None
+        state['classes'] = []
+        state['classmap'] = {}
+        state['local_classes'] = dict.fromkeys(self.local_classes)
+        state['local_protos'] = dict.fromkeys(self.local_protos)
+        return state
+
     # noinspection PyTypeChecker
     def find_linked(self, classname: str):
         """
@@ -113,27 +173,15 @@ class TypeResolver:
         if classname in self._linked_cache:
             return self._linked_cache[classname]
 
-        for local in self.local_classes:
-            if local.name == classname:
-                self._linked_cache[classname] = ""
-                return ""
-        for local in self.local_protos:
-            if local.name == classname[1:-1]:
-                self._linked_cache[classname] = "-Protocol"
-                return "-Protocol"
-        if classname in self.classmap:
-            try:
-                name = self.objc_image.image.linked_images[int(self.classmap[classname].ordinal) - 1].install_name
-                if '.dylib' in name:
-                    self._linked_cache[classname] = None
-                    return None
-                self._linked_cache[classname] = name
-                return name
-            except IndexError:
-                pass
+        if classname in self.local_classes:
+            linked = ""
+        elif classname[1:-1] in self.local_protos:
+            linked = "-Protocol"
+        else:
+            linked = self.import_install_names.get(classname)
 
-        self._linked_cache[classname] = None
-        return None
+        self._linked_cache[classname] = linked
+        return linked
 
 
 class HeaderGenerator:
@@ -143,25 +191,373 @@ class HeaderGenerator:
         self.objc_image: ObjCImage = objc_image
         self.headers = {}
 
-        for objc_class in objc_image.classlist:
-            self.headers[objc_class.name + '.h'] = Header(self.objc_image, self.type_resolver, objc_class, forward_declare_private_includes)
-        for objc_cat in objc_image.catlist:
-            if objc_cat.classname != "":
-                self.headers[f'{objc_cat.classname}+{objc_cat.name}.h'] = CategoryHeader(self.objc_image, objc_cat)
-        for objc_proto in objc_image.protolist:
-            self.headers[objc_proto.name + '-Protocol.h'] = ProtocolHeader(self.objc_image, objc_proto)
+        head = HeaderUtils.header_head(objc_image.image)
+
+        for header_name, item in HeaderGenerator.header_items(objc_image):
+            self.headers[header_name] = header_for(item, objc_image, self.type_resolver,
+                                                   forward_declare_private_includes, head)
 
-        if self.objc_image.name == "":
-            image_name = self.objc_image.image.slice.macho_file.filename
+        self.headers.update(HeaderGenerator.image_headers(objc_image, self.headers))
+
+    @staticmethod
+    def header_items(objc_image: ObjCImage) -> List[Tuple[str, Union[Class, Category, Protocol]]]:
+        """
+        (header name, class/category/protocol) for each per-item header, in the order they're generated
+
+        :param objc_image: ObjC Image
+        :return:
+        """
+        items = [(objc_class.name + '.h', objc_class) for objc_class in objc_image.classlist]
+        items += [(f'{objc_cat.classname}+{objc_cat.name}.h', objc_cat) for objc_cat in objc_image.catlist
+                  if objc_cat.classname != ""]
+        items += [(objc_proto.name + '-Protocol.h', objc_proto) for objc_proto in objc_image.protolist]
+        return items
+
+    @staticmethod
+    def image_headers(objc_image: ObjCImage, headers: dict) -> dict:
+        """
+        The umbrella and struct headers, which go after every other header
+
+        :param objc_image: ObjC Image
+        :param headers: Every other header, by name
+        :return:
+        """
+        if objc_image.name == "":
+            image_name = objc_image.image.slice.macho_file.filename
         else:
-            image_name = self.objc_image.name
+            image_name = objc_image.name
 
-        if image_name + '.h' in self.headers:
-            self.headers[image_name + '-Umbrella.h'] = UmbrellaHeader(self.headers)
+        if image_name + '.h' in headers:
+            umbrella_name = image_name + '-Umbrella.h'
         else:
-            self.headers[image_name + '.h'] = UmbrellaHeader(self.headers)
+            umbrella_name = image_name + '.h'
+
+        return {umbrella_name: UmbrellaHeader(headers), image_name + '-Structs.h': StructHeader(objc_image)}
+
+
+class MemberRecord(namedtuple('MemberRecord', ['text', 'name', 'sel', 'type', 'is_id', 'ivarname', 'getter',
+                                                 'setter'])):
+    """
+    Compact, picklable copy of a method, property or ivar (or a reference to a class or protocol), holding just the
+        fields header text is generated from, and rendering as the original does.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return self.text
+
+    @staticmethod
+    def fields(member: Union[Method, Property, Ivar, Class, Protocol, str]) -> tuple:
+        """
+        The record's fields as a plain tuple, which pickles far faster than the record itself
+        """
+        if isinstance(member, Method):
+            return member.signature, '', member.sel, '?', False, '', '', ''
+        if isinstance(member, Property):
+            return str(member), member.name, '', member.type, member.is_id, member.ivarname, member.getter, \
+                member.setter
+        if isinstance(member, Ivar):
+            return str(member), member.name, '', member.type, member.is_id, '', '', ''
+        return str(member), getattr(member, 'name', str(member)), '', '?', False, '', '', ''
+
+
+class_record = namedtuple('class_record', ['name', 'superclass', 'load_errors', 'protocols', 'ivars', 'properties',
+                                           'methods'])
+category_record = namedtuple('category_record', ['name', 'classname', 'protocols', 'properties', 'methods'])
+protocol_record = namedtuple('protocol_record', ['name', 'properties', 'methods', 'opt_methods'])
+
+_MEMBER_FIELDS = ['protocols', 'ivars', 'properties', 'methods', 'opt_methods']
+
+
+def header_record(item: Union[Class, Category, Protocol]) -> Union[class_record, category_record, protocol_record]:
+    """
+    Compact, picklable copy of a class, category or protocol, for handing header generation to other processes
+        without the rest of the image.
+
+    Members are kept as MemberRecord.fields() tuples; pass the record through restore_members() before generating
+        a header from it.
+
+    :param item: Class, category or protocol
+    :return:
+    """
+    def members(items):
+        return [MemberRecord.fields(member) for member in items]
+
+    if isinstance(item, Class):
+        return class_record(item.name, item.superclass, list(item.load_errors), members(item.protocols),
+                            members(item.ivars), members(item.properties), members(item.methods))
+    if isinstance(item, Category):
+        return category_record(item.name, item.classname, members(item.protocols), members(item.properties),
+                               members(item.methods))
+    return protocol_record(item.name, members(item.properties), members(item.methods), members(item.opt_methods))
+
+
+def restore_members(record: Union[class_record, category_record, protocol_record]):
+    """
+    Turn a header_record()'s member tuples back into MemberRecords, which headers generate from as they would from
+        the original methods, properties and ivars.
+    """
+    return record._replace(**{field: [MemberRecord._make(member) for member in getattr(record, field)]
+                              for field in _MEMBER_FIELDS if field in record._fields})
+
+
+def header_for(item, objc_image: Optional[ObjCImage], type_resolver: TypeResolver, forward_declare_private_includes,
+               head: str) -> Union['Header', 'CategoryHeader', 'ProtocolHeader']:
+    """
+    Generate the header for one of the items from HeaderGenerator.header_items()
+
+    :param item: Class, category or protocol (or a header_record() of one)
+    :param objc_image: Image the item is from
+    :param type_resolver: TypeResolver for the image
+    :param forward_declare_private_includes: See HeaderGenerator
+    :param head: HeaderUtils.header_head() for the image
+    :return:
+    """
+    if hasattr(item, 'classname'):
+        return CategoryHeader(objc_image, item, head=head)
+    if hasattr(item, 'opt_methods'):
+        return ProtocolHeader(objc_image, item, head=head)
+    return Header(objc_image, type_resolver, item, forward_declare_private_includes, head=head)
+
+
+def _header_texts(context: tuple, records: List[tuple]) -> List[str]:
+    # context is (head, type resolver, forward_declare_private_includes). It's handed over with every task rather
+    #   than through the pool's initializer, as the executor only takes an initializer from 3.7 on.
+    head, type_resolver, forward_declare_private_includes = context
+    return [header_for(restore_members(record), None, type_resolver, forward_declare_private_includes, head).text
+            for record in records]
+
+
+def iter_header_texts(objc_image: ObjCImage, forward_declare_private_includes=False,
+                      header_names: Set[str] = None) -> Iterator[Tuple[str, str]]:
+    """
+    Generate the text of every header HeaderGenerator would (same names, same order), across a pool of processes
+        when there are enough of them to be worth it, yielding each header as soon as it's ready so it can be
+        written out (e.g. into an ArchiveWriter) without holding every header in memory.
+
+    Worker count comes from opts.HEADER_WORKERS (1, the default, always generates in this process; 0 uses every
+        core).
+
+    :param objc_image: ObjC Image
+    :param forward_declare_private_includes: See HeaderGenerator
+    :param header_names: Only generate these class/category/protocol headers. The umbrella and struct headers are
+        always generated.
+    :return: Iterator of (header name, header text)
+    """
+    all_items = HeaderGenerator.header_items(objc_image)
+    if header_names is None:
+        items = all_items
+    else:
+        items = [(header_name, item) for header_name, item in all_items if header_name in header_names]
+    workers = opts.HEADER_WORKERS or os.cpu_count()
+    head = HeaderUtils.header_head(objc_image.image)
+    done = 0
+
+    if workers > 1 and len(items) >= HEADER_PARALLEL_MIN_HEADERS:
+        records = [header_record(item) for _, item in items]
+        tasks = [records[i:i + HEADERS_PER_TASK] for i in range(0, len(records), HEADERS_PER_TASK)]
+        context = (head, TypeResolver(objc_image), forward_declare_private_includes)
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+                for task_texts in executor.map(_header_texts, [context] * len(tasks), tasks):
+                    for text in task_texts:
+                        yield items[done][0], text
+                        done += 1
+        except (OSError, NotImplementedError, BrokenProcessPool) as ex:
+            log.warn(f'Parallel header generation unavailable ({ex}), generating remaining headers serially')
+
+    if done < len(items):
+        type_resolver = TypeResolver(objc_image)
+        for header_name, item in items[done:]:
+            yield header_name, header_for(item, objc_image, type_resolver, forward_declare_private_includes,
+                                          head).text
+
+    # The umbrella header includes every header, generated this time or not
+    every_header = dict.fromkeys(header_name for header_name, _ in all_items)
+    for header_name, header in HeaderGenerator.image_headers(objc_image, every_header).items():
+        yield header_name, str(header)
+
+
+def generate_header_texts(objc_image: ObjCImage, forward_declare_private_includes=False,
+                          header_names: Set[str] = None) -> Dict[str, str]:
+    """
+    Every header from iter_header_texts(), collected into a dict
+
+    :param objc_image: ObjC Image
+    :param forward_declare_private_includes: See HeaderGenerator
+    :param header_names: See iter_header_texts
+    :return: Header text by header name
+    """
+    return dict(iter_header_texts(objc_image, forward_declare_private_includes, header_names))
+
+
+def header_hash(item: Union[Class, Category, Protocol], type_resolver: TypeResolver) -> str:
+    """
+    Hash of everything a class, category or protocol's header is generated from: its name, superclass, load errors,
+        protocol names, the selectors and type encodings of its methods, the names and encodings of its ivars and
+        the names and attribute strings of its properties, along with where each type it references resolves to.
+
+    Implementation addresses and ivar offsets aren't included, as they don't show up in headers and change with
+        every build.
+
+    :param item: Class, category or protocol
+    :param type_resolver: TypeResolver for the image the item is from
+    :return: Hex digest
+    """
+    def methods(items):
+        return [(method.meta, method.sel, method.type_string) for method in items]
+
+    def properties(items):
+        return [(objc_property.name, objc_property.attr_string) for objc_property in items]
+
+    if isinstance(item, Category):
+        content = ('category', item.classname, item.name, item.load_errors,
+                   [protocol.name for protocol in item.protocols], methods(item.methods), properties(item.properties))
+    elif isinstance(item, Protocol):
+        content = ('protocol', item.name, methods(item.methods), methods(item.opt_methods),
+                   properties(item.properties))
+    else:
+        type_names = [item.superclass.split('_')[-1]] if item.superclass != "" else []
+        type_names += [f'<{protocol.name}>' for protocol in item.protocols]
+        type_names += [ivar.type for ivar in item.ivars if ivar.is_id]
+        type_names += [objc_property.type for objc_property in item.properties if objc_property.is_id]
+        content = ('class', item.name, item.superclass, item.load_errors,
+                   [protocol.name for protocol in item.protocols],
+                   [(ivar.name, ivar.typestr) for ivar in item.ivars], methods(item.methods),
+                   properties(item.properties), [type_resolver.find_linked(type_name) for type_name in type_names])
+
+    return hashlib.sha1(repr(content).encode()).hexdigest()
+
+
+def update_headers(directory: str, objc_image: ObjCImage, forward_declare_private_includes=False) -> \
+        Tuple[List[str], List[str]]:
+    """
+    Bring a directory of headers (from an earlier dump of this image, or of another build of it) up to date,
+        only regenerating and rewriting the headers whose classes, categories or protocols changed.
+
+    What each header was generated from is recorded in a manifest (HEADER_MANIFEST_NAME) in the directory. Headers
+        the manifest lists that no longer exist in the image are removed; other files are left alone. Everything is
+        regenerated if there's no manifest, or the header preamble (ktool version, platform, OS and SDK versions)
+        or forward declaration setting differ from the last run.
+
+    :param directory: Output directory
+    :param objc_image: ObjC Image
+    :param forward_declare_private_includes: See HeaderGenerator
+    :return: (Names of headers written, names of stale headers removed)
+    """
+    manifest_path = os.path.join(directory, HEADER_MANIFEST_NAME)
+    context = [HEADER_MANIFEST_VERSION, HeaderUtils.header_head(objc_image.image), forward_declare_private_includes]
+
+    previous = {}
+    try:
+        with open(manifest_path) as fp:
+            manifest = json.load(fp)
+        if manifest['context'] == context and isinstance(manifest['headers'], dict):
+            previous = manifest['headers']
+    except FileNotFoundError:
+        pass
+    except (ValueError, KeyError, TypeError) as ex:
+        log.warn(f'Ignoring unreadable header manifest {manifest_path} ({ex}), regenerating every header')
+
+    type_resolver = TypeResolver(objc_image)
+    hashes = {header_name: header_hash(item, type_resolver)
+              for header_name, item in HeaderGenerator.header_items(objc_image)}
+    changed = {header_name for header_name, digest in hashes.items()
+               if previous.get(header_name) != digest or not os.path.exists(os.path.join(directory, header_name))}
+
+    headers = generate_header_texts(objc_image, forward_declare_private_includes, header_names=changed)
+    # The umbrella and struct headers are hashed by their text, and only rewritten if it changed
+    for header_name, text in list(headers.items()):
+        if header_name not in hashes:
+            hashes[header_name] = hashlib.sha1(text.encode()).hexdigest()
+            if previous.get(header_name) == hashes[header_name] and \
+                    os.path.exists(os.path.join(directory, header_name)):
+                del headers[header_name]
+
+    write_headers(directory, headers)
+
+    removed = [header_name for header_name in previous if header_name not in hashes]
+    for header_name in removed:
+        try:
+            os.remove(os.path.join(directory, header_name))
+        except FileNotFoundError:
+            pass
+
+    # Written last (and atomically), so an interrupted run is redone rather than trusted
+    with open(manifest_path + '.tmp', 'w') as fp:
+        json.dump({'context': context, 'headers': hashes}, fp)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+    return list(headers), removed
+
 
-        self.headers[image_name + '-Structs.h'] = StructHeader(objc_image)
+def write_headers(directory: str, headers: Dict[str, str]):
+    """
+    Write out headers (e.g. from generate_header_texts()) as files in directory, creating it if needed.
+
+    Files are written in batches across a pool of threads.
+
+    :param directory: Output directory
+    :param headers: Header text by file name
+    :return:
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    def write_batch(batch):
+        for header_name, text in batch:
+            with open(os.path.join(directory, header_name), 'w') as out:
+                out.write(text)
+
+    items = list(headers.items())
+    batches = [items[i:i + HEADER_WRITES_PER_TASK] for i in range(0, len(items), HEADER_WRITES_PER_TASK)]
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        # list() so a failed write is raised here
+        list(executor.map(write_batch, batches))
+
+
+def colorize_header_text(text: str, use_256=True) -> str:
+    """
+    Color a generated header with ANSI escapes, without pygments.
+
+    :param text: Header text
+    :param use_256: Use 256 color escapes rather than the basic 8
+    :return: Colored text
+    """
+    index = 0 if use_256 else 1
+
+    def color(match):
+        return f'\x1b[{_OBJC_HEADER_COLORS[match.lastgroup][index]}m{match.group()}\x1b[39m'
+
+    return _OBJC_HEADER_TOKENS.sub(color, text)
+
+
+def highlight_header_text(text: str, use_256=False) -> str:
+    """
+    Syntax highlight header text for a terminal, with pygments (or with colorize_header_text() if
+        opts.BUILTIN_HEADER_HIGHLIGHTING is set, or pygments has no ObjC lexer).
+
+    The last HIGHLIGHT_CACHE_SIZE results are cached, so flipping back and forth between headers doesn't highlight
+        them again each time.
+
+    :param text: Header text
+    :param use_256: Use 256 color escapes (Terminal256Formatter) rather than the basic 8 (TerminalFormatter)
+    :return: Highlighted text
+    """
+    builtin = opts.BUILTIN_HEADER_HIGHLIGHTING or ObjectiveCLexer is None
+    key = (builtin, use_256, text)
+    if key in _highlight_cache:
+        _highlight_cache.move_to_end(key)
+        return _highlight_cache[key]
+
+    if builtin:
+        highlighted = colorize_header_text(text, use_256)
+    else:
+        highlighted = highlight(text, ObjectiveCLexer(), Terminal256Formatter() if use_256 else TerminalFormatter())
+
+    _highlight_cache[key] = highlighted
+    if len(_highlight_cache) > HIGHLIGHT_CACHE_SIZE:
+        _highlight_cache.popitem(last=False)
+    return highlighted
 
 
 class StructHeader:
@@ -183,9 +579,18 @@ class StructHeader:
 
 
 class Header:
-    def __init__(self, objc_image: 'ObjCImage', type_resolver, objc_class: Class, forward_declare_private_imports):
+    def __init__(self, objc_image: 'ObjCImage', type_resolver, objc_class: Class, forward_declare_private_imports,
+                 head: str = None):
+        """
+        :param objc_image: Image the class is from
+        :param type_resolver: TypeResolver for the image
+        :param objc_class: Class (or a header_record() of one)
+        :param forward_declare_private_imports: Forward declare classes from private frameworks rather than importing
+        :param head: Comment block at the top of the header, if it's already been made for the image
+        """
         self.interface: Interface = Interface(objc_class)
         self.objc_image = objc_image
+        self.head = head if head is not None else HeaderUtils.header_head(objc_image.image)
         self.objc_class: Class = objc_class
 
         self.type_resolver: TypeResolver = type_resolver
@@ -202,21 +607,12 @@ class Header:
         self._process_import_section()
 
         self.text = self._generate_text()
-        self.highlighted_text = None
 
     def __str__(self):
         return self.text
 
     def generate_highlighted_text(self):
-        if ObjectiveCLexer is None:
-            return self.text
-        if self.highlighted_text:
-            return self.highlighted_text
-
-        formatter = TerminalFormatter()
-        self.highlighted_text = highlight(self.text, ObjectiveCLexer(), formatter)
-
-        return self.highlighted_text
+        return highlight_header_text(self.text)
 
     def generate_html(self, generate_address_links=False):
         text = [HeaderUtils.header_head_html(self.objc_image.image)]
@@ -267,7 +663,7 @@ class Header:
 
         :return: the header text
         """
-        text = [HeaderUtils.header_head(self.objc_image.image),
+        text = [self.head,
                 "#ifndef " + self.objc_class.name.upper() + "_H",
                 "#define " + self.objc_class.name.upper() + "_H",
                 ""]
@@ -405,9 +801,10 @@ class Header:
 
 
 class CategoryHeader:
-    def __init__(self, objc_image, objc_category: Category):
+    def __init__(self, objc_image, objc_category: Category, head: str = None):
         self.objc_image = objc_image
         self.category = objc_category
+        self.head = head if head is not None else HeaderUtils.header_head(objc_image.image)
 
         self.properties = objc_category.properties
         self.methods = objc_category.methods
@@ -426,7 +823,7 @@ class CategoryHeader:
 
         :return: category text
         """
-        text = [HeaderUtils.header_head(self.objc_image.image),
+        text = [self.head,
                 "",
                 str(self.interface),
                 "",
@@ -436,9 +833,10 @@ class CategoryHeader:
 
 
 class ProtocolHeader:
-    def __init__(self, objc_image, objc_protocol: Protocol):
+    def __init__(self, objc_image, objc_protocol: Protocol, head: str = None):
         self.objc_image = objc_image
         self.protocol: Protocol = objc_protocol
+        self.head = head if head is not None else HeaderUtils.header_head(objc_image.image)
 
         self.interface = ProtocolInterface(objc_protocol)
 
@@ -453,7 +851,7 @@ class ProtocolHeader:
 
         :return:
         """
-        text = [HeaderUtils.header_head(self.objc_image.image),
+        text = [self.head,
                 "",
                 str(self.interface),
                 "",
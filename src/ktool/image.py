@@ -1,13 +1,14 @@
 from collections import namedtuple
 from enum import Enum
-from typing import List, Dict, Union
+from typing import List, Dict, Union, Iterator, Tuple, Optional, Callable
 
-from ktool_macho import LOAD_COMMAND, dylib_command, dyld_info_command, Struct, CPUSubTypeARM64, CPUType, segment_command_64
+from ktool_macho import LOAD_COMMAND, dylib_command, dyld_info_command, Struct, segment_command_64
 from ktool_macho.base import Constructable
 from ktool.codesign import CodesignInfo
 from ktool.exceptions import VMAddressingError, MachOAlignmentError
-from ktool.util import bytes_to_hex, uint_to_int, Table, get_terminal_size
+from ktool.util import bytes_to_hex, uint_to_int, Table, VirtualRows, get_terminal_size
 from lib0cyn.log import log
+from lib0cyn.structs import uintptr_t
 from ktool.macho import Slice, SlicedBackingFile, MachOImageHeader, Segment, PlatformType, ToolType
 
 os_version = namedtuple("os_version", ["x", "y", "z"])
@@ -32,16 +33,23 @@ class VM:
         self.fallback: MisalignedVM = MisalignedVM()
 
         self.detag_kern_64 = False
-        self.detag_64 = False
 
-    def __str__(self):
+    def table(self) -> Table:
+        """
+        Table of the mapped segments (print it with .print_all())
+        """
+        def seg_row(seg):
+            vm_addr, (file_addr, size) = seg
+            return [hex(vm_addr), hex(vm_addr + size), hex(file_addr), hex(file_addr + size), hex(size)]
+
         table = Table(dividers=True, avoid_wrapping_titles=True)
         table.titles = ['VM Start', 'VM End', 'File Start', 'File End', 'Size']
         table.size_pinned_columns = [0, 1]
-        for vm_addr in self.segs.keys():
-            table.rows.append([hex(vm_addr), hex(vm_addr + self.segs[vm_addr][1]), hex(self.segs[vm_addr][0]),
-                               hex(self.segs[vm_addr][0] + self.segs[vm_addr][1]), hex(self.segs[vm_addr][1])])
-        return table.fetch_all(get_terminal_size().columns - 5)
+        table.rows = VirtualRows(list(self.segs.items()), seg_row)
+        return table
+
+    def __str__(self):
+        return self.table().fetch_all(get_terminal_size().columns - 5)
 
     def vm_check(self, address):
         try:
@@ -66,9 +74,6 @@ class VM:
         if self.detag_kern_64:
             address = address | (0xFFFF << 12 * 4)
 
-        if self.detag_64:
-            address = address & 0xFFFFFFFFF
-
         try:
             return self.tlb[address]
         except KeyError:
@@ -122,7 +127,6 @@ class MisalignedVM:
 
     def __init__(self):
         self.detag_kern_64 = False
-        self.detag_64 = False
 
         self.fallback = None
 
@@ -133,14 +137,22 @@ class MisalignedVM:
         self.sorted_map = {}
         self.cache = {}
 
-    def __str__(self):
+    def table(self) -> Table:
+        """
+        Table of the mapped segments (print it with .print_all())
+        """
+        def seg_row(seg):
+            vm_addr, (file_addr, size) = seg
+            return [hex(vm_addr), hex(vm_addr + size), hex(file_addr), hex(file_addr + size), hex(size)]
+
         table = Table(dividers=True, avoid_wrapping_titles=True)
         table.titles = ['VM Start', 'VM End', 'File Start', 'File End', 'Size']
         table.size_pinned_columns = [0, 1]
-        for vm_addr in self.segs.keys():
-            table.rows.append([hex(vm_addr), hex(vm_addr + self.segs[vm_addr][1]), hex(self.segs[vm_addr][0]),
-                               hex(self.segs[vm_addr][0] + self.segs[vm_addr][1]), hex(self.segs[vm_addr][1])])
-        return table.fetch_all(get_terminal_size().columns - 5)
+        table.rows = VirtualRows(list(self.segs.items()), seg_row)
+        return table
+
+    def __str__(self):
+        return self.table().fetch_all(get_terminal_size().columns - 5)
 
     def vm_check(self, vm_address):
         try:
@@ -154,9 +166,6 @@ class MisalignedVM:
         if self.detag_kern_64:
             vm_address = vm_address | (0xFFFF << 12 * 4)
 
-        if self.detag_64:
-            vm_address = vm_address & 0xFFFFFFFFF
-
         if vm_address in self.cache:
             return self.cache[vm_address]
 
@@ -313,15 +322,19 @@ class Image:
         self.binding_table = None
         self.weak_binding_table = None
         self.lazy_binding_table = None
+        self.rebase_table = None
         self.export_trie = None
 
         self.chained_fixups = None
 
+        # (address, raw pointer) -> target, for images whose pointers are encoded some other way (see decode_ptr)
+        self.pointer_decoder: Optional[Callable[[int, int], int]] = None
+
         self.symbol_table = None
 
         self.struct_cache: Dict[int, Struct] = {}
 
-    def serialize(self):
+    def _serialize_info(self):
         image_dict = {'macho_header': self.macho_header.serialize()}
 
         if self.install_name != "":
@@ -333,12 +346,6 @@ class Image:
 
         image_dict['linked'] = linked
 
-        segments = {}
-
-        for seg_name, seg in self.segments.items():
-            segments[seg_name] = seg.serialize()
-
-        image_dict['segments'] = segments
         if self.uuid:
             image_dict['uuid'] = bytes_to_hex(self.uuid)
 
@@ -349,37 +356,99 @@ class Image:
         if self.rpath:
             image_dict['rpath'] = self.rpath
 
+        image_dict['entry_point'] = self.entry_point
+
+        image_dict['thread_state'] = self.thread_state
+
+        image_dict['minos'] = f'{self.minos.x}.{self.minos.y}.{self.minos.z}'
+        image_dict['sdk_version'] = f'{self.sdk_version.x}.{self.sdk_version.y}.{self.sdk_version.z}'
+
+        return image_dict
+
+    def serialize(self):
+        image_dict = self._serialize_info()
+
+        segments = {}
+
+        for seg_name, seg in self.segments.items():
+            segments[seg_name] = seg.serialize()
+
+        image_dict['segments'] = segments
+
         image_dict['imports'] = [sym.serialize() for sym in self.imports]
         image_dict['exports'] = [sym.serialize() for sym in self.exports]
         image_dict['symbols'] = [sym.serialize() for sym in self.symbols.values()]
 
-        image_dict['entry_point'] = self.entry_point
+        image_dict['function_starts'] = list(self.function_starts)
+
+        return image_dict
 
-        image_dict['function_starts'] = self.function_starts
+    def serialize_records(self) -> Iterator[Tuple[str, dict]]:
+        """
+        Serialize the image as a flat stream of (record type, record) pairs.
 
-        image_dict['thread_state'] = self.thread_state
+        Unlike serialize(), this never builds the full tree; each segment, section, symbol, etc. is serialized only
+            when the consumer asks for it, so writers can stream huge images (kernel caches) out in flat memory.
 
-        image_dict['minos'] = f'{self.minos.x}.{self.minos.y}{self.minos.z}'
-        image_dict['sdk_version'] = f'{self.sdk_version.x}.{self.sdk_version.y}.{self.sdk_version.z}'
+        Record types: 'image', 'segment', 'section', 'import', 'export', 'symbol', 'function_start'. A segment record
+            lists the names of its sections, which follow it as records of their own.
 
-        return image_dict
+        :return: Iterator of (record type, record dict)
+        """
+        yield 'image', self._serialize_info()
+
+        for seg_name, seg in self.segments.items():
+            # noinspection PyProtectedMember
+            segment = seg._serialize_info()
+            segment['sections'] = list(seg.sections.keys())
+            yield 'segment', segment
+            for sect in seg.sections.values():
+                section = sect.serialize()
+                section['segment'] = seg_name
+                yield 'section', section
+
+        for sym in self.imports:
+            yield 'import', sym.serialize()
+        for sym in self.exports:
+            yield 'export', sym.serialize()
+        for sym in self.symbols.values():
+            yield 'symbol', sym.serialize()
+        for addr in self.function_starts:
+            yield 'function_start', {'address': addr}
+
+    def snapshot(self) -> bytearray:
+        """
+        Snapshot this image's processed tables (symbols, binding info, exports, function starts, fixups) into a
+            binary blob that Image.restore() can load back far faster than the image can be reparsed.
+
+        :return: Raw snapshot bytes
+        """
+        from ktool.snapshot import ImageSnapshot
+        return ImageSnapshot.from_image(self).raw
+
+    @classmethod
+    def restore(cls, macho_slice: Slice, snapshot) -> 'Image':
+        """
+        Restore an image from a snapshot taken with Image.snapshot()
+
+        :param macho_slice: Slice the snapshot was taken from
+        :param snapshot: bytes-like (or mmap) snapshot, or an ImageSnapshot
+        :return: Restored image
+        """
+        from ktool.snapshot import ImageSnapshot
+        if not isinstance(snapshot, ImageSnapshot):
+            snapshot = ImageSnapshot(snapshot)
+        return snapshot.restore(macho_slice)
 
     def vm_realign(self, yell_about_misalignment=True):
 
         align_by = 0x4000
         aligned = False
 
-        detag_64 = False
-
         segs = []
         for cmd in self.macho_header.load_commands:
             if cmd.cmd in [LOAD_COMMAND.SEGMENT.value, LOAD_COMMAND.SEGMENT_64.value]:
                 segs.append(cmd)
-            if cmd.cmd == LOAD_COMMAND.LC_DYLD_CHAINED_FIXUPS:
-                detag_64 = True
-
-        if self.slice.type == CPUType.ARM64 and self.slice.subtype == CPUSubTypeARM64.ARM64E:
-            detag_64 = True
 
         while not aligned:
             aligned = True
@@ -398,12 +467,10 @@ class Image:
         if align_by != 0:
             log.info(f'Aligned to {hex(align_by)} pages')
             self.vm: VM = VM(page_size=align_by)
-            self.vm.detag_64 = detag_64
         else:
             if yell_about_misalignment:
                 log.info("MachO cannot be aligned to 16k or 4k pages. Swapping to fallback mapping.")
             self.vm: MisalignedVM = MisalignedVM()
-            self.vm.detag_64 = detag_64
 
     def vm_check(self, address):
         return self.vm.vm_check(address)
@@ -425,10 +492,42 @@ class Image:
     def read_ptr(self, offset: int, vm=False):
         """ Read a ptr (uint of size self.ptr_size)
 
+        Pointers read by VM address are decoded with decode_ptr()
+
         :param offset:
         :param vm:
         """
-        return self.read_uint(offset, self.ptr_size, vm=vm)
+        if vm:
+            return self.decode_ptr(offset, self.read_uint(offset, self.ptr_size, vm=True))
+        return self.read_uint(offset, self.ptr_size)
+
+    def decode_ptr(self, address: int, raw: int) -> int:
+        """
+        Get what the pointer at `address` points to once the image is loaded (unslid), given its raw value.
+
+        Pointers in a shared cache are untagged through .pointer_decoder, and pointers in fixup chains (chained fixups,
+            or threaded rebases) resolve to their rebase target. Anything else, including everything LC_DYLD_INFO
+            rebase opcodes cover, already holds its target and is returned as-is.
+
+        :param address: VM address of the pointer
+        :param raw: Value stored there
+        :return: Address it points to
+        """
+        if self.pointer_decoder is not None:
+            return self.pointer_decoder(address, raw)
+        if self.chained_fixups is not None:
+            return self.chained_fixups.rebases.get(address, raw)
+        return raw
+
+    def _decode_struct_ptrs(self, address: int, struct: Struct):
+        # noinspection PyProtectedMember
+        for field, offset in struct._field_offsets.items():
+            # noinspection PyProtectedMember
+            if struct._field_sizes[field] is uintptr_t:
+                raw = getattr(struct, field)
+                value = self.decode_ptr(address + offset, raw)
+                if value != raw:
+                    setattr(struct, field, value)
 
     def read_int(self, offset: int, length: int, vm=False):
         return uint_to_int(self.read_uint(offset, length, vm), length * 8)
@@ -460,9 +559,12 @@ class Image:
         :return: Loaded struct
         """
         if address not in self.struct_cache or force_reload:
+            vm_address = address
             if vm:
                 address = self.vm.translate(address)
             struct = self.slice.read_struct(address, struct_type, endian)
+            if vm and (self.chained_fixups is not None or self.pointer_decoder is not None):
+                self._decode_struct_ptrs(vm_address, struct)
             self.struct_cache[address] = struct
             return struct
 
@@ -11,16 +11,28 @@
 #
 #  Copyright (c) 0cyn 2022.
 #
-from io import BytesIO
+from abc import ABC, abstractmethod
+from typing import Dict, List, Tuple, Union
+from xml.parsers.expat import ParserCreate
 
 import ktool
+from ktool_macho import MH_MAGIC, MH_MAGIC_64
 from lib0cyn.structs import *
 from ktool import MachOFile, Image
 from lib0cyn.log import log
 from ktool.loader import MachOImageHeader, MachOImageLoader
+from ktool.macho import Slice, SlicedBackingFile
+from ktool.util import opts
 import lib0cyn.kplistlib as plistlib
 from ktool.exceptions import UnsupportedFiletypeException
 
+# Keys kept from each _PrelinkInfoDictionary entry; the rest of the prelink info plist is skipped while it's parsed
+PRELINK_INFO_KEYS = frozenset({'CFBundleIdentifier', 'CFBundleExecutable', 'CFBundleName', 'CFBundleVersion',
+                               'CFBundlePackageType', 'CFBundleGetInfoString', '_PrelinkExecutableLoadAddr',
+                               '_PrelinkExecutableSize'})
+# Bytes of __PRELINK_INFO,__info handed to expat at a time
+PRELINK_INFO_CHUNK_SIZE = 0x100000
+
 
 class kmod_info_64(Struct):
     """
@@ -35,7 +47,7 @@ class kmod_info_64(Struct):
         super().__init__(fields=self._FIELDNAMES, sizes=self._SIZES, byte_order=byte_order)
 
 
-class Kext:
+class Kext(ABC):
     def __init__(self):
         self.prelink_info = {}
 
@@ -51,25 +63,70 @@ class Kext:
         self.info_string = ""
         self.version_str = ""
 
-        self.image = None
+        self._image = None
+
+    @property
+    def image(self) -> Image:
+        """
+        The kext's image. It's loaded the first time it's asked for.
+        """
+        if self._image is None:
+            self._image = self.load_image()
+        return self._image
+
+    @property
+    def image_loaded(self) -> bool:
+        return self._image is not None
+
+    @abstractmethod
+    def load_image(self) -> Image:
+        """
+        Load the kext's image
+
+        :return: Loaded image
+        """
 
 
 class EmbeddedKext(Kext):
     def __init__(self, image, prelink_info):
+        """
+        :param image: Kernel image
+        :param prelink_info: Prelink info dict for the kext
+        """
         super().__init__()
+        self.backing_image = image
         self.start_addr = prelink_info['_PrelinkExecutableLoadAddr']
         self.size = prelink_info['_PrelinkExecutableSize']
         self.name = prelink_info['CFBundleIdentifier']
         self.version = prelink_info['CFBundleVersion']
 
-        self.backing_file = BytesIO()
-        self.backing_file.write(image.read_bytearray(self.start_addr, self.size, vm=True))
-        self.backing_file.seek(0)
-        self.image = ktool.load_image(self.backing_file)
+        self._backing_file = None
+
+        # the image itself isn't loaded until it's needed, but we can at least tell whether there is one
+        if image.read_uint(self.start_addr, 4, vm=True) not in [MH_MAGIC, MH_MAGIC_64]:
+            raise UnsupportedFiletypeException(f'No mach header at {hex(self.start_addr)}')
+
+    @property
+    def backing_file(self) -> SlicedBackingFile:
+        """
+        The kext's bytes; a window onto the kernelcache, rather than a copy of the kext.
+        """
+        if self._backing_file is None:
+            kernel = self.backing_image
+            self._backing_file = SlicedBackingFile(kernel.slice.file, kernel.vm.translate(self.start_addr), self.size)
+        return self._backing_file
+
+    def load_image(self) -> Image:
+        return MachOImageLoader.load(Slice(self.backing_image.slice.macho_file, self.backing_file))
 
 
 class MergedKext(Kext):
     def __init__(self, image: Image, kmod_info, start_addr):
+        """
+        :param image: Kernel image
+        :param kmod_info: The kext's kmod_info
+        :param start_addr: Address of the kext's mach header
+        """
         super().__init__()
 
         self.backing_image = image
@@ -81,22 +138,219 @@ class MergedKext(Kext):
         self.start_addr = start_addr
         self.info = kmod_info
 
-        file_base_addr = image.vm.translate(start_addr)
+        self.mach_header = None
+
+    def load_image(self) -> Image:
+        file_base_addr = self.backing_image.vm.translate(self.start_addr)
 
         # cool. we have a basic set of stuff in place, lets bootstrap up an Image from it.
 
         self.mach_header = MachOImageHeader.from_image(self.backing_slice, file_base_addr)
-        self.image = Image(self.backing_slice)
-        self.image.macho_header = self.mach_header
-        self.image.vm_realign(yell_about_misalignment=False)
+        image = Image(self.backing_slice)
+        image.macho_header = self.mach_header
+        image.vm_realign(yell_about_misalignment=False)
 
         # noinspection PyProtectedMember
-        MachOImageLoader._parse_load_commands(self.image)
+        MachOImageLoader._parse_load_commands(image)
         # noinspection PyProtectedMember
-        MachOImageLoader._process_image(self.image)
+        MachOImageLoader._process_image(image)
 
-        for segment in image.segments.values():
-            segment.vm_address = segment.vm_address | 0xffff000000000000
+        return image
+
+
+class _PrelinkInfoParsed(Exception):
+    pass
+
+
+class _PrelinkInfoParser:
+    """
+    Incremental parser for the __PRELINK_INFO,__info plist.
+
+    Only the PRELINK_INFO_KEYS of each _PrelinkInfoDictionary entry are materialized; everything else is skipped as
+        expat streams past it. Scalars the kernel dedupes with ID/IDREF attributes are resolved.
+    """
+
+    _SCALARS = frozenset({'string', 'integer', 'real', 'true', 'false', 'data', 'date'})
+
+    def __init__(self, keys=PRELINK_INFO_KEYS):
+        self.keys = keys
+        self.bundles: List[dict] = []
+        # (start, end) of each bundle's <dict> element, as byte offsets into what's been fed
+        self.bundle_spans: List[Tuple[int, int]] = []
+        self.done = False
+
+        self._ids = {}
+        self._depth = 0
+        self._key = None
+        # Depth of the _PrelinkInfoDictionary array while we're inside it
+        self._items_depth = None
+        self._bundle = None
+        self._bundle_start = 0
+        # Character data of the element being kept, None while skipping
+        self._data = None
+        self._id = None
+        self._wanted = False
+
+        self.parser = ParserCreate()
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self._begin_element
+        self.parser.EndElementHandler = self._end_element
+        self.parser.CharacterDataHandler = self._handle_data
+        self.parser.EntityDeclHandler = self._handle_entity_decl
+
+    def feed(self, data) -> bool:
+        """
+        Parse the next chunk of the plist
+
+        :param data: bytes-like chunk
+        :return: False once the entries have all been parsed, and the rest of the plist needn't be fed
+        """
+        try:
+            self.parser.Parse(data, False)
+        except _PrelinkInfoParsed:
+            self.done = True
+        return not self.done
+
+    def close(self):
+        if not self.done:
+            self.parser.Parse(b'', True)
+
+    def _handle_entity_decl(self, *args):
+        raise plistlib.InvalidFileException("XML entity declarations are not supported in plist files")
+
+    def _begin_element(self, element, attrs):
+        if element == 'dict' or element == 'array':
+            if element == 'array' and self._depth == 1 and self._key == '_PrelinkInfoDictionary':
+                self._items_depth = self._depth + 1
+            elif element == 'dict' and self._depth == self._items_depth:
+                self._bundle = {}
+                self._bundle_start = self.parser.CurrentByteIndex
+            self._depth += 1
+        elif element == 'key':
+            if self._depth == 1 or (self._bundle is not None and self._depth == self._items_depth + 1):
+                self._data = []
+        elif element in self._SCALARS:
+            self._wanted = self._bundle is not None and self._depth == self._items_depth + 1 and self._key in self.keys
+            if 'IDREF' in attrs:
+                if self._wanted:
+                    self._bundle[self._key] = self._ids.get(attrs['IDREF'])
+                self._wanted = False
+            else:
+                self._id = attrs.get('ID')
+                if self._wanted or self._id is not None:
+                    self._data = []
+
+    def _end_element(self, element):
+        if element == 'dict' or element == 'array':
+            self._depth -= 1
+            if self._items_depth is not None:
+                if element == 'dict' and self._depth == self._items_depth:
+                    self.bundles.append(self._bundle)
+                    self.bundle_spans.append((self._bundle_start, self.parser.CurrentByteIndex + len('</dict>')))
+                    self._bundle = None
+                elif element == 'array' and self._depth + 1 == self._items_depth:
+                    raise _PrelinkInfoParsed()
+        elif self._data is None:
+            return
+        elif element == 'key':
+            self._key = ''.join(self._data)
+            self._data = None
+        else:
+            value = self._value(element, ''.join(self._data))
+            self._data = None
+            if self._id is not None:
+                self._ids[self._id] = value
+                self._id = None
+            if self._wanted:
+                self._bundle[self._key] = value
+
+    def _handle_data(self, data):
+        if self._data is not None:
+            self._data.append(data)
+
+    @staticmethod
+    def _value(element, text):
+        if element == 'integer':
+            if text == '':
+                return 0
+            return int(text, 16) if text.lower().startswith('0x') else int(text)
+        if element == 'true':
+            return True
+        if element == 'false':
+            return False
+        if element == 'real':
+            return float(text)
+        # noinspection PyProtectedMember
+        if element == 'data':
+            return plistlib._decode_base64(text)
+        # noinspection PyProtectedMember
+        if element == 'date':
+            return plistlib._date_from_string(text)
+        return text
+
+
+class _PrelinkBundleParser:
+    """
+    Parser for the whole of one _PrelinkInfoDictionary entry, nested dictionaries and all, given the IDs
+        _PrelinkInfoParser found while parsing the plist the first time.
+    """
+
+    def __init__(self, ids: dict):
+        self.ids = ids
+        self.value = None
+
+        self._containers = []
+        self._key = None
+        # Character data of the element being parsed, None between elements
+        self._data = None
+
+        self.parser = ParserCreate()
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self._begin_element
+        self.parser.EndElementHandler = self._end_element
+        self.parser.CharacterDataHandler = self._handle_data
+        self.parser.EntityDeclHandler = self._handle_entity_decl
+
+    def parse(self, data) -> dict:
+        self.parser.Parse(data, True)
+        return self.value
+
+    def _handle_entity_decl(self, *args):
+        raise plistlib.InvalidFileException("XML entity declarations are not supported in plist files")
+
+    def _add(self, value):
+        if not self._containers:
+            self.value = value
+        elif isinstance(self._containers[-1], dict):
+            self._containers[-1][self._key] = value
+        else:
+            self._containers[-1].append(value)
+
+    def _begin_element(self, element, attrs):
+        if element == 'dict' or element == 'array':
+            container = {} if element == 'dict' else []
+            self._add(container)
+            self._containers.append(container)
+        elif 'IDREF' in attrs:
+            self._add(self.ids.get(attrs['IDREF']))
+        else:
+            self._data = []
+
+    def _end_element(self, element):
+        if element == 'dict' or element == 'array':
+            self._containers.pop()
+        elif self._data is not None:
+            text = ''.join(self._data)
+            self._data = None
+            if element == 'key':
+                self._key = text
+            else:
+                # noinspection PyProtectedMember
+                self._add(_PrelinkInfoParser._value(element, text))
+
+    def _handle_data(self, data):
+        if self._data is not None:
+            self._data.append(data)
 
 
 class KernelCache:
@@ -111,6 +365,9 @@ class KernelCache:
         self.kexts = []
 
         self.prelink_info = {}
+        # File offsets of each bundle's entry in __PRELINK_INFO,__info, and the IDs it may refer to (see bundle_info)
+        self._prelink_info_spans: Dict[str, Tuple[int, int]] = {}
+        self._prelink_info_ids = {}
 
         if '__info' in self.mach_kernel.segments['__PRELINK_INFO'].sections:
             self._process_prelink_info()
@@ -135,6 +392,12 @@ class KernelCache:
 
         self._process_kexts()
 
+        self._kexts_by_executable: Dict[str, Kext] = {}
+        self._kexts_by_id: Dict[str, Kext] = {}
+        for kext in self.kexts:
+            self._kexts_by_executable.setdefault(kext.executable_name, kext)
+            self._kexts_by_id.setdefault(kext.id, kext)
+
     def _process_kexts_from_prelink_info(self):
         for kext_name, kext in self.prelink_info.items():
             try:
@@ -144,6 +407,15 @@ class KernelCache:
             except KeyError:
                 pass
 
+    def kext(self, name: str) -> Union[Kext, None]:
+        """
+        Find a kext by its executable name or bundle ID, without loading any kext images
+
+        :param name: Executable name (e.g. IOSurface) or bundle ID (e.g. com.apple.iokit.IOSurface)
+        :return: Kext, or None if there isn't one with that name
+        """
+        return self._kexts_by_executable.get(name, self._kexts_by_id.get(name))
+
     def _process_kexts(self):
         for kext in self.kexts:
             if kext.name in self.prelink_info.keys():
@@ -159,13 +431,45 @@ class KernelCache:
                 kext.prelink_info = self.prelink_info[kext.name]
 
     def _process_prelink_info(self):
-        address = self.mach_kernel.segments['__PRELINK_INFO'].sections['__info'].vm_address
-        prelink_info_str = f'<plist version="1.0">{self.mach_kernel.read_cstr(address, vm=True)}</plist>'
-        prelink_info_dat = prelink_info_str.encode('utf-8')
-        prelink_info = plistlib.readPlistFromBytes(prelink_info_dat)
-        items = prelink_info['_PrelinkInfoDictionary']
-        for bundle_dict in items:
+        section = self.mach_kernel.segments['__PRELINK_INFO'].sections['__info']
+        file = self.mach_kernel.slice.file
+        start = self.mach_kernel.vm.translate(section.vm_address)
+        end = file.find(b'\x00', start, start + section.size)
+        if end == -1:
+            end = start + section.size
+
+        # The section is a NUL terminated, unwrapped plist body; stream it to expat straight out of the file
+        parser = _PrelinkInfoParser()
+        plist_head = b'<plist version="1.0">'
+        parser.feed(plist_head)
+        for chunk_start in range(start, end, PRELINK_INFO_CHUNK_SIZE):
+            with file.view(chunk_start, min(PRELINK_INFO_CHUNK_SIZE, end - chunk_start)) as chunk:
+                if not parser.feed(chunk):
+                    break
+        if not parser.done:
+            parser.feed(b'</plist>')
+            parser.close()
+
+        for bundle_dict, (span_start, span_end) in zip(parser.bundles, parser.bundle_spans):
             self.prelink_info[bundle_dict['CFBundleIdentifier']] = bundle_dict
+            self._prelink_info_spans[bundle_dict['CFBundleIdentifier']] = (start + span_start - len(plist_head),
+                                                                           start + span_end - len(plist_head))
+        # noinspection PyProtectedMember
+        self._prelink_info_ids = parser._ids
+
+    def bundle_info(self, bundle_id: str) -> dict:
+        """
+        Get a kext's whole _PrelinkInfoDictionary entry.
+
+        Kext.prelink_info only keeps the PRELINK_INFO_KEYS; this parses the entry again out of __PRELINK_INFO, with
+            OSBundleLibraries, IOKitPersonalities and the rest.
+
+        :param bundle_id: Bundle ID of the kext
+        :return: Entry for the kext
+        """
+        start, end = self._prelink_info_spans[bundle_id]
+        with self.mach_kernel.slice.file.view(start, end - start) as data:
+            return _PrelinkBundleParser(self._prelink_info_ids).parse(data)
 
     def _process_merged_kexts(self):
         kext_starts = []
@@ -189,3 +493,6 @@ class KernelCache:
             start_addr = kext_starts[i]
             kext = MergedKext(self.mach_kernel, info, start_addr)
             self.kexts.append(kext)
+
+        for segment in self.mach_kernel.segments.values():
+            segment.vm_address = segment.vm_address | 0xffff000000000000
@@ -15,19 +15,24 @@
 #  Copyright (c) 0cyn 2021.
 #
 
-from typing import Dict, Union, BinaryIO, List
+from typing import Dict, Union, BinaryIO, Iterator, List, Tuple
 from io import BytesIO
 
+from ktool.dyld_cache import DyldSharedCache
 from ktool.loader import MachOImageLoader, Image
 from ktool.generator import TBDGenerator, FatMachOGenerator
 
 try:
-    from ktool.headers import HeaderGenerator, Header
+    from ktool.headers import HeaderGenerator, Header, generate_header_texts as _generate_header_texts, \
+        iter_header_texts as _iter_header_texts, update_headers as _update_headers
 except ModuleNotFoundError:
     # Maybe pygments wasn't installed and we're running in some weird context
     # So let whatever works, work
     Header = None
     HeaderGenerator = None
+    _generate_header_texts = None
+    _iter_header_texts = None
+    _update_headers = None
     pass
 from ktool.macho import Slice, MachOFile, SlicedBackingFile
 from ktool.objc import ObjCImage, MethodList
@@ -60,16 +65,33 @@ def load_macho_file(fp: Union[SlicedBackingFile, BinaryIO, BytesIO], use_mmaped_
     return MachOFile(fp, use_mmaped_io=use_mmaped_io)
 
 
-def reload_image(image: Image) -> Image:
+def load_shared_cache(path: str, use_mmaped_io=True) -> DyldSharedCache:
     """
-    Reload an image (properly updates internal representations after patches)
+    Open a dyld shared cache (and any subcaches beside it).
 
-    :param image:
-    :return:
+    Dylibs in it aren't loaded until they're asked for, with e.g. `cache.image('/usr/lib/libobjc.A.dylib')`
+
+    :param path: Path to the main cache file
+    :param use_mmaped_io: Should the cache files be mmaped? Only disable if your system doesn't support it
+    :return: DyldSharedCache
+    """
+    return DyldSharedCache(path, use_mmaped_io=use_mmaped_io)
+
+
+def reload_image(image: Image, full=False) -> Image:
     """
-    # This is going to be horribly slow. Dyld class needs refactored to have a better way to do this or ideally just
-    #   not fuck things up and require a reload every time we make a patch.
-    return load_image(image.slice)
+    Update an image's internal representations after patches.
+
+    By default only the load commands and tables the patches actually touched are reparsed (see
+        MachOImageLoader.resync), so scripts applying many patches don't pay for a full load after each one.
+
+    :param image: Image whose slice has been patched
+    :param full: Throw away the image and load it again from scratch instead
+    :return: Updated image. Unless a full reload was needed, this is the same object that was passed in.
+    """
+    if full:
+        return load_image(image.slice)
+    return MachOImageLoader.resync(image)
 
 
 def load_image(fp: Union[BinaryIO, MachOFile, Slice, BytesIO, SlicedBackingFile], slice_index=0, load_symtab=True,
@@ -139,15 +161,6 @@ def macho_verify(fp: Union[BinaryIO, MachOFile, Slice, Image]) -> None:
 
 
 def load_objc_metadata(image: Image) -> ObjCImage:
-    if image.chained_fixups is not None:
-        data_io = BytesIO()
-        data_io.write(image.slice.file.read_bytes(0, image.slice.file.size))
-        data_io.seek(0)
-        for rebase in image.chained_fixups.rebases.items():
-            data_io.seek(image.vm.translate(rebase[0]))
-            data_io.write(rebase[1].to_bytes(8, 'little'))
-        data_io.seek(0)
-        image = load_image(data_io)
     return ObjCImage.from_image(image)
 
 
@@ -155,18 +168,22 @@ def load_swift_metadata(objc_image: ObjCImage) -> SwiftImage:
     return SwiftImage.from_image(objc_image)
 
 
+def _sort_header_items(objc_image: 'ObjCImage'):
+    for objc_class in objc_image.classlist:
+        objc_class.methods.sort(key=lambda h: h.signature)
+        objc_class.properties.sort(key=lambda h: h.name)
+
+    for objc_proto in objc_image.protolist:
+        objc_proto.methods.sort(key=lambda h: h.signature)
+        objc_proto.opt_methods.sort(key=lambda h: h.signature)
+
+
 def generate_headers(objc_image: 'ObjCImage', sort_items=False, forward_declare_private_imports=False) -> Dict[
     str, Header]:
     out = {}
 
     if sort_items:
-        for objc_class in objc_image.classlist:
-            objc_class.methods.sort(key=lambda h: h.signature)
-            objc_class.properties.sort(key=lambda h: h.name)
-
-        for objc_proto in objc_image.protolist:
-            objc_proto.methods.sort(key=lambda h: h.signature)
-            objc_proto.opt_methods.sort(key=lambda h: h.signature)
+        _sort_header_items(objc_image)
 
     for header_name, header in HeaderGenerator(objc_image,
                                                forward_declare_private_includes=forward_declare_private_imports).headers.items():
@@ -175,20 +192,74 @@ def generate_headers(objc_image: 'ObjCImage', sort_items=False, forward_declare_
     return out
 
 
+def generate_header_texts(objc_image: 'ObjCImage', sort_items=False, forward_declare_private_imports=False) -> Dict[
+    str, str]:
+    """
+    Same headers as generate_headers(), as text, generated across a pool of processes for large images.
+
+    :param objc_image: ObjC Image
+    :param sort_items: Sort methods and properties
+    :param forward_declare_private_imports: Forward declare classes from private frameworks rather than importing them
+    :return: Header text by header name, in the same order as generate_headers()
+    """
+    if sort_items:
+        _sort_header_items(objc_image)
+
+    return _generate_header_texts(objc_image, forward_declare_private_includes=forward_declare_private_imports)
+
+
+def iter_header_texts(objc_image: 'ObjCImage', sort_items=False, forward_declare_private_imports=False) -> \
+        Iterator[Tuple[str, str]]:
+    """
+    Same headers as generate_header_texts(), yielded as (header name, text) as soon as each one is generated
+
+    :param objc_image: ObjC Image
+    :param sort_items: Sort methods and properties
+    :param forward_declare_private_imports: Forward declare classes from private frameworks rather than importing them
+    :return: Iterator of (header name, header text)
+    """
+    if sort_items:
+        _sort_header_items(objc_image)
+
+    return _iter_header_texts(objc_image, forward_declare_private_includes=forward_declare_private_imports)
+
+
+def update_headers(objc_image: 'ObjCImage', directory: str, sort_items=False, forward_declare_private_imports=False) \
+        -> Tuple[List[str], List[str]]:
+    """
+    Dump headers into directory, only regenerating and rewriting the ones that changed since the last dump into it,
+        and removing ones for classes, categories and protocols that are gone. See ktool.headers.update_headers
+
+    :param objc_image: ObjC Image
+    :param directory: Output directory
+    :param sort_items: Sort methods and properties
+    :param forward_declare_private_imports: Forward declare classes from private frameworks rather than importing them
+    :return: (Names of headers written, names of stale headers removed)
+    """
+    if sort_items:
+        _sort_header_items(objc_image)
+
+    return _update_headers(directory, objc_image, forward_declare_private_includes=forward_declare_private_imports)
+
+
 def generate_text_based_stub(image: Image, compatibility=True) -> str:
     generator = TBDGenerator(image, compatibility)
     return TapiYAMLWriter.write_out(generator.dict)
 
 
-def macho_combine(slices: List[Slice]) -> BytesIO:
-    fat_generator = FatMachOGenerator(slices)
+def macho_combine(slices: List[Slice], out: BinaryIO = None) -> BinaryIO:
+    """
+    Combine several slices into a fat MachO
 
-    fat_file = BytesIO()
-    fat_file.write(fat_generator.fat_head)
+    :param slices: Slices to combine
+    :param out: File to stream the fat MachO into. If not passed, it's built in (and returned as) a BytesIO.
+    :return: out (or the BytesIO), seeked back to the start of the fat MachO
+    """
+    fat_generator = FatMachOGenerator(slices)
 
-    for arch in fat_generator.fat_archs:
-        fat_file.seek(arch.offset)
-        fat_file.write(arch.slice.full_bytes_for_slice())
+    fat_file = out if out is not None else BytesIO()
+    start = fat_file.tell()
+    fat_generator.write_to(fat_file)
 
-    fat_file.seek(0)
+    fat_file.seek(start)
     return fat_file
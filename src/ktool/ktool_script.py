@@ -21,7 +21,6 @@ import sys
 import threading
 import urllib.request
 from argparse import ArgumentParser
-from collections import namedtuple
 from enum import Enum
 from typing import Union
 
@@ -43,10 +42,13 @@ from ktool.swift import *
 
 from ktool.exceptions import *
 from ktool.generator import FatMachOGenerator
-from ktool.util import opts, version_output, ktool_print, get_terminal_size
+from ktool.loader import SPECIAL_DYLIB_NAMES
+from ktool.util import opts, version_output, ktool_print, get_terminal_size, VirtualRows, ArchiveWriter, \
+    archive_format
 from ktool.window import KToolScreen, external_hard_fault_teardown
 
 from ktool.kcache import KernelCache, Kext, EmbeddedKext
+from ktool.batch import batch_process, BATCH_COMMANDS
 
 from ktool_macho.structs import *
 
@@ -172,8 +174,10 @@ def main():
     parser.add_argument('-f', dest='force_load', action='store_true')
     parser.add_argument('-V', dest='get_vers', action='store_true')
     parser.add_argument('--mmap', dest='mmap', action='store_true', help='Enable mmaped IO')
+    parser.add_argument('--fixup-jobs', dest='fixup_jobs', type=int,
+                        help='Processes used to decode chained fixups on large images (default: all cores, 1 disables)')
     parser.set_defaults(func=help_prompt, bench=False, membench=False, force_load=False, mmap=False, logging_level=1,
-                        get_vers=False)
+                        get_vers=False, fixup_jobs=0)
 
     subparsers = parser.add_subparsers(help='sub-command help')
 
@@ -190,9 +194,15 @@ def main():
     parser_json = subparsers.add_parser('json', help='Dump Image metadata as json')
 
     parser_json.add_argument('--with-objc', dest='with_objc', action='store_true')
+    parser_json.add_argument('--jsonl', dest='stream_jsonl', action='store_true',
+                             help='Stream one json record per line instead of a single document')
+    parser_json.add_argument('--msgpack', dest='stream_msgpack', action='store_true',
+                             help='Stream records as msgpack instead of json')
+    parser_json.add_argument('--out', dest='out', help='Output file (default: stdout)')
     parser_json.add_argument('filename', nargs='?', default='')
 
-    parser_json.set_defaults(func=commands.serialize, with_objc=False)
+    parser_json.set_defaults(func=commands.serialize, with_objc=False, stream_jsonl=False, stream_msgpack=False,
+                             out=None)
 
     # insert command: optool replacement
     parser_insert = subparsers.add_parser('insert', help='Insert data into MachO Binary')
@@ -249,14 +259,17 @@ def main():
     parser_dump.add_argument('--hard-fail', dest='hard_fail', action='store_true')
     parser_dump.add_argument('--sorted', dest='sort_headers', action='store_true')
     parser_dump.add_argument('--tbd', dest='do_tbd', action='store_true')
-    parser_dump.add_argument('--out', dest='outdir', help="Directory to dump headers into")
+    parser_dump.add_argument('--out', dest='outdir',
+                             help="Directory (or .zip/.tar/.tar.gz/.tar.zst archive) to dump headers into")
+    parser_dump.add_argument('--jobs', dest='header_jobs', type=int,
+                             help="Processes used to generate headers (default: all cores)")
     parser_dump.add_argument('--force-misaligned-vm', dest='force_misaligned', action="store_true",
                              help="Force misaligned VM")
     parser_dump.add_argument('filename', nargs='?', default='')
 
     parser_dump.set_defaults(func=commands.dump, do_headers=False, usfs=False, sort_headers=False, do_tbd=False,
                              slice_index=0, hard_fail=False, get_class=None, forward_declare=False,
-                             force_misaligned=False)
+                             force_misaligned=False, header_jobs=0)
 
     # list command: Lists lists of things contained in lists in the image.
     parser_list = subparsers.add_parser('list', help='Print various lists')
@@ -307,6 +320,19 @@ def main():
 
     parser_ent.set_defaults(func=commands.ent, get_ent=False, slice_index=0)
 
+    # batch command: run one of the other commands on every MachO in a directory tree
+    parser_batch = subparsers.add_parser('batch', help='Process every MachO in a directory')
+
+    parser_batch.add_argument('--cmd', dest='batch_cmd', choices=BATCH_COMMANDS, help='Command to run on each file')
+    parser_batch.add_argument('--jobs', dest='jobs', type=int, help='Worker process count (default: all cores)')
+    parser_batch.add_argument('--timeout', dest='timeout', type=int, help='Per-file timeout, in seconds')
+    parser_batch.add_argument('--out', dest='outdir',
+                              help='Directory (or .zip/.tar/.tar.gz/.tar.zst archive) to write per-file outputs into')
+    parser_batch.add_argument('--jsonl', dest='jsonl', help='Write all results to a single JSON-lines file')
+    parser_batch.add_argument('filename', nargs='?', default='')
+
+    parser_batch.set_defaults(func=commands.batch, batch_cmd=None, jobs=0, timeout=0, outdir=None, jsonl=None)
+
     # process the arguments the user passed us.
     # it is worth noting i set the default for `func` on each command parser to a function named without ();
     # this means when that command is used, calling args.func() will branch off to that function.
@@ -352,6 +378,8 @@ def main():
         global MMAP_ENABLED
         MMAP_ENABLED = True
 
+    opts.FIXUP_WORKERS = args.fixup_jobs
+
     if args.membench:
         import tracemalloc
         tracemalloc.start(10)
@@ -419,6 +447,9 @@ MachO Analysis ---
     symbols - Print various tables (Symbols, imports, exports)
     info - Print misc info about the target mach-o
 
+Batch Processing ---
+    batch - Run json/symbols/dump-headers/dump-tbd on every MachO in a directory
+
 Run `ktool [command]` for info/examples on using that command
 
 Global Flags:
@@ -438,6 +469,26 @@ def process_patches(image) -> 'Image':
                                                     "https://github.com/kritantadev/ktool.")
 
 
+def linked_image_name(image, ordinal) -> str:
+    """
+    Get the install name of the library an import's ordinal refers to
+
+    :param image: Image the import belongs to
+    :param ordinal: Symbol ordinal
+    :return: Install name, special dylib name (self, flat-namespace, etc.), or "ordinal: x" if it doesn't resolve
+    """
+    try:
+        ordinal = int(ordinal)
+    except ValueError:
+        # opcode binds carry the install name they resolved to already
+        return ordinal
+    if 0 < ordinal <= len(image.linked_images):
+        return image.linked_images[ordinal - 1].install_name
+    if ordinal in SPECIAL_DYLIB_NAMES:
+        return SPECIAL_DYLIB_NAMES[ordinal]
+    return f'ordinal: {ordinal}'
+
+
 class MachOFileCommands:
     @staticmethod
     def _open(args):
@@ -474,11 +525,21 @@ class MachOFileCommands:
     Dump image metadata including objc metadata
 
     > ktool json --with-objc [filename]
+
+    Stream records (one per segment, section, symbol, class, etc.) as json lines, or as msgpack.
+    These never hold the whole document in memory, so use them for huge files.
+
+    > ktool json --jsonl [--with-objc] [--out filename] [filename]
+    > ktool json --msgpack [--with-objc] --out <filename> [filename]
         """
         require_args(args, one_of=['filename'])
 
         log.LOG_LEVEL = LogLevel(-1)
 
+        if args.stream_jsonl or args.stream_msgpack:
+            MachOFileCommands._serialize_records(args)
+            return
+
         with open(args.filename, 'rb') as fp:
 
             macho_file = ktool.load_macho_file(fp, use_mmaped_io=MMAP_ENABLED)
@@ -503,6 +564,39 @@ class MachOFileCommands:
             else:
                 print(json.dumps(out_dict, indent=4, sort_keys=True))
 
+    @staticmethod
+    def _serialize_records(args):
+        if args.stream_msgpack:
+            out = open(args.out, 'wb') if args.out else sys.stdout.buffer
+            writer = ktool.util.MsgPackRecordWriter(out)
+        else:
+            out = open(args.out, 'w') if args.out else sys.stdout
+            writer = ktool.util.JSONLinesRecordWriter(out)
+
+        try:
+            with open(args.filename, 'rb') as fp:
+                macho_file = ktool.load_macho_file(fp, use_mmaped_io=MMAP_ENABLED)
+                writer.write('file', {'filetype': macho_file.type.name})
+
+                for index, macho_slice in enumerate(macho_file.slices):
+                    writer.write('slice', {'offset': macho_slice.offset, 'size': macho_slice.size,
+                                           'type': macho_slice.type.name, 'subtype': macho_slice.subtype.name},
+                                 slice=index)
+
+                    image = ktool.load_image(macho_slice)
+                    for record_type, record in image.serialize_records():
+                        writer.write(record_type, record, slice=index)
+
+                    if args.with_objc:
+                        objc_image = ktool.load_objc_metadata(image)
+                        for record_type, record in objc_image.serialize_records():
+                            writer.write(record_type, record, slice=index)
+        finally:
+            if args.out:
+                out.close()
+            else:
+                out.flush()
+
     @staticmethod
     def ent(args):
         """
@@ -549,11 +643,9 @@ class MachOFileCommands:
 
                 table = Table()
                 table.titles = ['Address', 'Symbol']
+                table.rows = VirtualRows(image.exports, lambda symbol: [hex(symbol.address), symbol.fullname])
 
-                for symbol in image.exports:
-                    table.rows.append([hex(symbol.address), symbol.fullname])
-
-                print(table.fetch_all(get_terminal_size().columns))
+                table.print_all(get_terminal_size().columns)
 
         if args.get_symtab:
             with open(args.filename, 'rb') as fd:
@@ -562,36 +654,24 @@ class MachOFileCommands:
 
                 table = Table()
                 table.titles = ['Address', 'Name']
+                table.rows = VirtualRows(image.symbol_table.table, lambda sym: [hex(sym.address), sym.fullname])
 
-                for sym in image.symbol_table.table:
-                    table.rows.append([hex(sym.address), sym.fullname])
-
-                print(table.fetch_all(get_terminal_size().columns - 1))
+                table.print_all(get_terminal_size().columns - 1)
 
         if args.get_imports:
             with open(args.filename, 'rb') as fd:
                 image = ktool.load_image(fd, args.slice_index, load_exports=False, load_symtab=False,
                                          use_mmaped_io=MMAP_ENABLED)
 
-                import_symbols = {}
-                symbol = namedtuple('symbol', ['addr', 'name', 'image', 'from_table'])
-
-                for addr, sym in image.import_table.items():
-                    try:
-                        import_symbols[hex(addr)] = symbol(hex(addr), sym.fullname,
-                                                              image.linked_images[int(sym.ordinal) - 1].install_name,
-                                                              sym.attr)
-                    except IndexError:
-                        import_symbols[hex(addr)] = symbol(hex(addr), sym.fullname,
-                                                              "ordinal: " + str(int(sym.ordinal)), sym.attr)
+                def import_row(item):
+                    addr, sym = item
+                    return [hex(addr), sym.fullname, linked_image_name(image, sym.ordinal), sym.attr]
 
                 table = Table()
                 table.titles = ['Addr', 'Symbol', 'Image', 'Binding']
+                table.rows = VirtualRows(list(image.import_table.items()), import_row)
 
-                for _, sym in import_symbols.items():
-                    table.rows.append([sym.addr, sym.name, sym.image, sym.from_table])
-
-                print(table.fetch_all(get_terminal_size().columns))
+                table.print_all(get_terminal_size().columns)
 
         elif args.get_actions:
             with open(args.filename, 'rb') as fd:
@@ -599,29 +679,20 @@ class MachOFileCommands:
 
                 print('\nBinding Info'.ljust(60, '-') + '\n')
                 for sym in image.binding_table.symbol_table:
-                    try:
-                        print(f'{hex(sym.address).ljust(15, " ")} | '
-                              f'{image.linked_images[int(sym.ordinal) - 1].install_name} | '
-                              f'{sym.name.ljust(20, " ")} | {sym.dec_type}')
-                    except IndexError:
-                        pass
+                    print(f'{hex(sym.address).ljust(15, " ")} | '
+                          f'{linked_image_name(image, sym.ordinal)} | '
+                          f'{sym.name.ljust(20, " ")} | {sym.dec_type}')
                 print('\nWeak Binding Info'.ljust(60, '-') + '\n')
                 for sym in image.weak_binding_table.symbol_table:
-                    try:
-                        print(f'{hex(sym.address).ljust(15, " ")} | '
-                              f'{image.linked_images[int(sym.ordinal) - 1].install_name} | '
-                              f'{sym.name.ljust(20, " ")} | {sym.dec_type}')
-                    except IndexError:
-                        pass
+                    print(f'{hex(sym.address).ljust(15, " ")} | '
+                          f'{linked_image_name(image, sym.ordinal)} | '
+                          f'{sym.name.ljust(20, " ")} | {sym.dec_type}')
                 print('\nLazy Binding Info'.ljust(60, '-') + '\n')
                 for sym in image.lazy_binding_table.symbol_table:
-                    try:
-                        print(f'{hex(sym.address).ljust(15, " ")} | '
-                              f'{image.linked_images[int(sym.ordinal) - 1].install_name} | '
-                              f'{sym.name.ljust(20, " ")} | '
-                              f'{sym.dec_type}')
-                    except IndexError:
-                        pass
+                    print(f'{hex(sym.address).ljust(15, " ")} | '
+                          f'{linked_image_name(image, sym.ordinal)} | '
+                          f'{sym.name.ljust(20, " ")} | '
+                          f'{sym.dec_type}')
 
     @staticmethod
     def insert(args):
@@ -676,13 +747,9 @@ class MachOFileCommands:
         with open(args.out, 'wb') as fd:
             if len(patched_libraries) > 1:
                 slices = [image.slice for image in patched_libraries]
-                fat_generator = FatMachOGenerator(slices)
-                fd.write(fat_generator.fat_head)
-                for arch in fat_generator.fat_archs:
-                    fd.seek(arch.offset)
-                    fd.write(arch.slice.full_bytes_for_slice())
+                FatMachOGenerator(slices).write_to(fd)
             else:
-                fd.write(patched_libraries[0].slice.full_bytes_for_slice())
+                patched_libraries[0].slice.write_to(fd)
 
     @staticmethod
     def edit(args):
@@ -719,13 +786,9 @@ class MachOFileCommands:
             with open(args.out, 'wb') as fd:
                 if len(patched_libraries) > 1:
                     slices = [image.slice for image in patched_libraries]
-                    fat_generator = FatMachOGenerator(slices)
-                    fd.write(fat_generator.fat_head)
-                    for arch in fat_generator.fat_archs:
-                        fd.seek(arch.offset)
-                        fd.write(arch.slice.full_bytes_for_slice())
+                    FatMachOGenerator(slices).write_to(fd)
                 else:
-                    fd.write(patched_libraries[0].slice.full_bytes_for_slice())
+                    patched_libraries[0].slice.write_to(fd)
 
     @staticmethod
     def lipo(args):
@@ -756,7 +819,7 @@ class MachOFileCommands:
                 slices.append(macho_file.slices[0])
 
             with open(output, 'wb') as fd:
-                fd.write(ktool.macho_combine(slices).read())
+                ktool.macho_combine(slices, fd)
 
         elif args.extract != "":
             with open(args.filename[0], 'rb') as fd:
@@ -767,7 +830,7 @@ class MachOFileCommands:
                 for macho_slice in macho_file.slices:
                     if macho_slice.type.name.lower() == args.extract:
                         with open(output, 'wb') as out:
-                            out.write(macho_slice.full_bytes_for_slice())
+                            macho_slice.write_to(out)
                         return
                 macho_slices_list = [macho_slice.type.name.lower() for macho_slice in macho_file.slices]
                 exit_with_error(KToolError.ArgumentError,
@@ -816,7 +879,7 @@ class MachOFileCommands:
                                                 LOAD_COMMAND.SUB_CLIENT]:
                         lc_dat += ' \n"' + image.read_cstr(lc.off + lc.size(), vm=False) + '"'
                     table.rows.append([str(i), LOAD_COMMAND(lc.cmd).name.ljust(15, ' '), lc_dat])
-                print(table.fetch_all(get_terminal_size().columns - 5))
+                table.print_all(get_terminal_size().columns - 5)
             elif args.get_classes:
                 for obj_class in objc_image.classlist:
                     print(f'{obj_class.name}')
@@ -860,7 +923,7 @@ class MachOFileCommands:
                                      use_mmaped_io=MMAP_ENABLED)
 
             if args.get_vm:
-                print(image.vm)
+                image.vm.table().print_all(get_terminal_size().columns - 5)
 
             elif args.get_fileinfo:
                 with open(args.filename, 'rb') as fp:
@@ -873,7 +936,7 @@ class MachOFileCommands:
                         table.rows.append(
                             [f'{hex(macho_slice.offset)}', f'{macho_slice.type.name}', f'{macho_slice.subtype.name}'])
 
-                    print(table.fetch_all(get_terminal_size().columns))
+                    table.print_all(get_terminal_size().columns)
 
             else:
                 message = (f'\x1b[38;5;109m{image.base_name} \x1b[38;5;110m--- \n'
@@ -899,6 +962,12 @@ class MachOFileCommands:
     To dump a full set of headers for a bin/framework
     > ktool dump --headers --fdec --out <directory> [filename]
 
+    Dumping into a directory that already has headers from an earlier dump only rewrites the headers that changed,
+        and removes ones for classes that are gone. Delete the directory's .ktool-headers.json to rewrite everything.
+
+    To stream headers straight into an archive (.zip, .tar, .tar.gz, or .tar.zst with the zstandard package)
+    > ktool dump --headers --out <file.tar.zst> [filename]
+
     To dump .tbd files for a framework
     > ktool dump --tbd [filename]
         """
@@ -935,6 +1004,14 @@ class MachOFileCommands:
             if args.usfs:
                 opts.USE_SYMTAB_INSTEAD_OF_SELECTORS = True
 
+            opts.HEADER_WORKERS = args.header_jobs
+
+            if args.outdir and archive_format(args.outdir):
+                try:
+                    ArchiveWriter.check_supported(args.outdir)
+                except UnsupportedArchiveException as ex:
+                    exit_with_error(KToolError.ArgumentError, str(ex))
+
             with open(args.filename, 'rb') as fp:
                 image = ktool.load_image(fp, args.slice_index, use_mmaped_io=MMAP_ENABLED)
 
@@ -943,20 +1020,22 @@ class MachOFileCommands:
 
                 objc_image = ktool.load_objc_metadata(image)
 
-                objc_headers = ktool.generate_headers(objc_image, sort_items=args.sort_headers,
-                                                      forward_declare_private_imports=args.forward_declare)
-
-                for header_name, header in objc_headers.items():
+                if args.outdir and archive_format(args.outdir):
+                    with ArchiveWriter(args.outdir) as archive:
+                        for header_name, header in ktool.iter_header_texts(
+                                objc_image, sort_items=args.sort_headers,
+                                forward_declare_private_imports=args.forward_declare):
+                            archive.add(header_name, header)
+                elif args.outdir and args.outdir != 'ndbg':
+                    written, removed = ktool.update_headers(objc_image, args.outdir, sort_items=args.sort_headers,
+                                                            forward_declare_private_imports=args.forward_declare)
+                    log.info(f'{len(written)} headers written, {len(removed)} stale headers removed')
+                else:
+                    objc_headers = ktool.generate_header_texts(objc_image, sort_items=args.sort_headers,
+                                                               forward_declare_private_imports=args.forward_declare)
                     if not args.outdir:
-                        print(f'\n\n{header_name}\n{header}')
-                    elif args.outdir == 'ndbg':
-                        pass
-                    else:
-                        os.makedirs(args.outdir, exist_ok=True)
-                        with open(args.outdir + '/' + header_name, 'w') as out:
-                            out.write(str(header))
-                    if args.bench:
-                        pass  # pprint(image.bench_stats)
+                        for header_name, header in objc_headers.items():
+                            print(f'\n\n{header_name}\n{header}')
         elif args.do_tbd:
             with open(args.filename, 'rb') as fp:
                 image = ktool.load_image(fp, args.slice_index, use_mmaped_io=MMAP_ENABLED)
@@ -992,16 +1071,7 @@ class MachOFileCommands:
                 print(f'{kext.name} -> {kext.executable_name} ({kext.version})')
 
         elif args.get_kext:
-            kext = None
-            for _kext in kernel_cache.kexts:
-                if args.get_kext == _kext.executable_name:
-                    kext = _kext
-                    break
-            if not kext:
-                for _kext in kernel_cache.kexts:
-                    if args.get_kext == _kext.id:
-                        kext = _kext
-                        break
+            kext = kernel_cache.kext(args.get_kext)
 
             if isinstance(kext, Kext):
                 bundle_text = f"Bundle ID: {kext.id}\nExecutable Name: {kext.executable_name}\n{kext.info_string}\n" \
@@ -1011,23 +1081,71 @@ class MachOFileCommands:
                 print('Kext Not Found')
 
         elif args.do_extract:
-            kext = None
-            for _kext in kernel_cache.kexts:
-                if args.do_extract == _kext.executable_name:
-                    kext = _kext
-                    break
-            if not kext:
-                for _kext in kernel_cache.kexts:
-                    if args.do_extract == _kext.id:
-                        kext = _kext
-                        break
+            kext = kernel_cache.kext(args.do_extract)
 
             if isinstance(kext, EmbeddedKext):
                 with open(kext.id.split('.')[-1], 'wb') as out:
-                    out.write(kext.image.slice.full_bytes_for_slice())
+                    kext.image.slice.write_to(out)
             else:
                 print('Kext Not Found')
 
+    @staticmethod
+    def batch(args):
+        """
+    ------
+    Run a command on every MachO in a directory tree, across a pool of worker processes
+
+    Dump json for every MachO in a directory into one JSON-lines file
+    > ktool batch --cmd json --jsonl [output.jsonl] [directory]
+
+    Dump headers for every MachO into per-file directories, with 8 workers and a 2 minute limit per file
+    > ktool batch --cmd dump-headers --jobs 8 --timeout 120 --out <directory> [directory]
+
+    Dump a .tbd for every MachO, streamed into a single archive (.zip, .tar, .tar.gz, or .tar.zst with zstandard)
+    > ktool batch --cmd dump-tbd --out <file.tar.zst> [directory]
+
+    Supported commands: json, symbols, dump-headers, dump-tbd
+    Results are streamed to stdout as JSON lines if neither --out nor --jsonl is passed.
+        """
+        require_args(args, always=['batch_cmd'])
+
+        if not os.path.isdir(args.filename):
+            exit_with_error(KToolError.ArgumentError, f'{args.filename} is not a directory')
+
+        if args.outdir and archive_format(args.outdir):
+            try:
+                ArchiveWriter.check_supported(args.outdir)
+            except UnsupportedArchiveException as ex:
+                exit_with_error(KToolError.ArgumentError, str(ex))
+
+        results = batch_process(args.filename, args.batch_cmd, jobs=args.jobs, timeout=args.timeout,
+                                outdir=args.outdir, force_load=args.force_load, use_mmaped_io=MMAP_ENABLED)
+
+        counts = {'ok': 0, 'error': 0, 'timeout': 0}
+
+        out = None
+        if args.jsonl:
+            out = open(args.jsonl, 'w')
+        elif not args.outdir:
+            out = sys.stdout
+
+        try:
+            for result in results:
+                counts[result.status] += 1
+                if out:
+                    out.write(json.dumps(result._asdict()) + '\n')
+                    out.flush()
+                elif result.status != 'ok':
+                    print(f'{result.path}: {result.status} ({result.error})', file=sys.stderr)
+                else:
+                    log.info(f'{result.path}: ok ({result.elapsed:.2f}s)')
+        finally:
+            if args.jsonl:
+                out.close()
+
+        print(f'Processed {sum(counts.values())} files: {counts["ok"]} ok, {counts["error"]} failed, '
+              f'{counts["timeout"]} timed out', file=sys.stderr)
+
 
 if __name__ == "__main__":
     main()
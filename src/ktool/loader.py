@@ -12,20 +12,25 @@
 #
 #  Copyright (c) 0cyn 2021.
 #
-from collections import namedtuple
-from typing import List, Union, Dict
+import concurrent.futures
+import os
+import struct
+from array import array
+from collections import namedtuple, Counter
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Union, Dict, Tuple, Iterator
 
 import ktool
-from ktool_macho import (MH_FLAGS, MH_FILETYPE, LOAD_COMMAND, BINDING_OPCODE, LOAD_COMMAND_MAP,
+from ktool_macho import (MH_FLAGS, MH_FILETYPE, LOAD_COMMAND, BINDING_OPCODE, REBASE_OPCODE, LOAD_COMMAND_MAP,
                     BIND_SUBOPCODE_THREADED_SET_BIND_ORDINAL_TABLE_SIZE_ULEB, BIND_SUBOPCODE_THREADED_APPLY,
                     MH_MAGIC_64, CPUType, CPUSubTypeARM64, MH_MAGIC)
 from ktool_macho.base import Constructable
 from ktool_macho.fixups import *
 from ktool.codesign import CodesignInfo
 from ktool.exceptions import MachOAlignmentError
-from ktool.macho import Segment, Slice, MachOImageHeader, PlatformType
+from ktool.macho import Segment, Slice, MachOImageHeader, PlatformType, patch_range
 from lib0cyn.log import log
-from ktool.util import macho_is_malformed, ignore, bytes_to_hex
+from ktool.util import macho_is_malformed, ignore, opts, bytes_to_hex
 from ktool.image import Image, os_version, LinkedImage, MisalignedVM
 
 
@@ -68,12 +73,179 @@ class MachOImageLoader:
         MachOImageLoader._process_image(image)
         return image
 
+    # Load commands that pull tables out of __LINKEDIT. These are what make loading an image expensive, so resync()
+    #   only reparses them if their command or the data they point at was patched.
+    TABLE_COMMANDS = [LOAD_COMMAND.SYMTAB.value, LOAD_COMMAND.DYLD_INFO.value, LOAD_COMMAND.DYLD_INFO_ONLY.value,
+                      LOAD_COMMAND.LC_DYLD_EXPORTS_TRIE.value, LOAD_COMMAND.LC_DYLD_CHAINED_FIXUPS.value,
+                      LOAD_COMMAND.FUNCTION_STARTS.value, LOAD_COMMAND.CODE_SIGNATURE.value]
+
+    SEGMENT_COMMANDS = [LOAD_COMMAND.SEGMENT.value, LOAD_COMMAND.SEGMENT_64.value]
+
+    # Export trie can come from either command; one being dirty means reloading both.
+    EXPORT_COMMANDS = [LOAD_COMMAND.DYLD_INFO.value, LOAD_COMMAND.DYLD_INFO_ONLY.value,
+                       LOAD_COMMAND.LC_DYLD_EXPORTS_TRIE.value]
+
+    @classmethod
+    def resync(cls, image: Image) -> Image:
+        """
+        Bring an image back in sync with its slice after Slice.patch() calls, reparsing only what the patches touched.
+
+        Load commands are matched up by their raw bytes, so commands that were only shifted around by an
+            insert/remove are left alone. If the header was patched, the load command list and the cheap per-command
+            info (linked images, uuid, versions, etc.) are reprocessed. Symbol tables, binding info, exports, fixups,
+            function starts and the code signature are only reparsed if their load command changed or their data
+            overlaps a patch. Patches that add, remove, move, or resize a segment fall back to a full reload.
+
+        :param image: Image previously loaded from image.slice
+        :return: The re-synced image. This is the same object unless a full reload was needed.
+        """
+        patches = image.slice.take_patches()
+        if len(patches) == 0:
+            return image
+
+        old_header = image.macho_header
+        header_touched = any(patch.offset < len(old_header.raw) for patch in patches)
+        new_header = MachOImageHeader.from_image(image.slice) if header_touched else old_header
+        header_end = max(len(old_header.raw), len(new_header.raw))
+
+        old_blobs = Counter(cls._command_bytes(old_header, cmd) for cmd in old_header.load_commands)
+        changed = []
+        changed_ids = set()
+        for cmd in new_header.load_commands:
+            blob = cls._command_bytes(new_header, cmd)
+            if old_blobs[blob] > 0:
+                old_blobs[blob] -= 1
+            else:
+                changed.append(cmd)
+                changed_ids.add(id(cmd))
+        removed = [int.from_bytes(blob[:4], 'little') for blob, count in old_blobs.items() if count > 0]
+
+        def segment_layout(header):
+            return [(cmd.segname, cmd.vmaddr, cmd.vmsize, cmd.fileoff, cmd.filesize)
+                    for cmd in header.load_commands if cmd.cmd in cls.SEGMENT_COMMANDS]
+
+        if segment_layout(old_header) != segment_layout(new_header):
+            log.info("Patches changed the segment layout, reloading image")
+            return cls.load(image.slice)
+
+        for patch in patches:
+            for addr in [addr for addr, struct in image.struct_cache.items()
+                         if addr < patch.offset + patch.size and addr + len(struct.raw) > patch.offset]:
+                del image.struct_cache[addr]
+
+        dirty = {cmd.cmd for cmd in changed if cmd.cmd in cls.TABLE_COMMANDS}
+        dirty.update(cmd for cmd in removed if cmd in cls.TABLE_COMMANDS)
+        data_patches = [patch for patch in patches if patch.offset + patch.size > header_end]
+        for cmd in new_header.load_commands:
+            if cmd.cmd in cls.TABLE_COMMANDS and cmd.cmd not in dirty:
+                if cls._overlaps(cls._table_ranges(image, cmd), data_patches):
+                    dirty.add(cmd.cmd)
+        if dirty.intersection(cls.EXPORT_COMMANDS):
+            dirty.update(cls.EXPORT_COMMANDS)
+
+        log.info(f'Re-syncing image after {len(patches)} patches; '
+                 f'{len(changed)} load commands changed, {len(dirty)} tables dirty')
+
+        image.macho_header = new_header
+        commands = []
+
+        if header_touched:
+            for cmd in new_header.load_commands:
+                if cmd.cmd in cls.SEGMENT_COMMANDS:
+                    name = cmd.segname
+                    if id(cmd) in changed_ids:
+                        # Same layout, but section headers may have changed
+                        image.segments[name] = Segment(image, cmd)
+                    else:
+                        image.segments[name].cmd = cmd
+                elif cmd.cmd in cls.TABLE_COMMANDS:
+                    if cmd.cmd in [LOAD_COMMAND.DYLD_INFO.value, LOAD_COMMAND.DYLD_INFO_ONLY.value]:
+                        image.info = cmd
+                    elif cmd.cmd == LOAD_COMMAND.CODE_SIGNATURE.value:
+                        image._codesign_cmd = cmd
+                else:
+                    commands.append(cmd)
+
+            image.linked_images = []
+            image.dylib = None
+            image.uuid = None
+            image.allowed_clients = []
+            image.rpath = None
+            image.platform = PlatformType.UNK
+            image.minos = os_version(0, 0, 0)
+            image.sdk_version = os_version(0, 0, 0)
+            image.thread_state = []
+            image._entry_off = 0
+
+        if LOAD_COMMAND.SYMTAB.value in dirty:
+            image.symbol_table = None
+        if dirty.intersection(cls.EXPORT_COMMANDS):
+            image.info = None
+            image.binding_table = None
+            image.weak_binding_table = None
+            image.lazy_binding_table = None
+            image.rebase_table = None
+            image.export_trie = None
+        if LOAD_COMMAND.LC_DYLD_CHAINED_FIXUPS.value in dirty:
+            image.chained_fixups = None
+        if LOAD_COMMAND.FUNCTION_STARTS.value in dirty:
+            image.function_starts = []
+        if LOAD_COMMAND.CODE_SIGNATURE.value in dirty:
+            image.codesign_info = None
+            image._codesign_cmd = None
+
+        commands += [cmd for cmd in new_header.load_commands if cmd.cmd in dirty]
+        cls._parse_load_commands(image, commands=commands)
+
+        if len(dirty) > 0:
+            image.imports = []
+            image.exports = []
+            image.symbols = {}
+            image.import_table = {}
+            image.export_table = {}
+            cls._process_image(image)
+        else:
+            cls._process_image_info(image)
+
+        return image
+
+    @staticmethod
+    def _command_bytes(header: MachOImageHeader, cmd) -> bytes:
+        return bytes(header.raw[cmd.off:cmd.off + cmd.cmdsize])
+
+    @staticmethod
+    def _table_ranges(image: Image, cmd) -> List[Tuple[int, int]]:
+        if cmd.cmd == LOAD_COMMAND.SYMTAB.value:
+            nlist_size = 16 if image.macho_header.is64 else 12
+            return [(cmd.symoff, cmd.nsyms * nlist_size), (cmd.stroff, cmd.strsize)]
+        if cmd.cmd in [LOAD_COMMAND.DYLD_INFO.value, LOAD_COMMAND.DYLD_INFO_ONLY.value]:
+            return [(cmd.rebase_off, cmd.rebase_size), (cmd.bind_off, cmd.bind_size),
+                    (cmd.weak_bind_off, cmd.weak_bind_size),
+                    (cmd.lazy_bind_off, cmd.lazy_bind_size), (cmd.export_off, cmd.export_size)]
+        ranges = [(cmd.dataoff, cmd.datasize)]
+        if cmd.cmd == LOAD_COMMAND.LC_DYLD_CHAINED_FIXUPS.value:
+            # The chains themselves are threaded through the pointers being fixed up
+            ranges += [(segment.file_address, segment.file_size) for segment in image.segments.values()
+                       if segment.name != '__LINKEDIT']
+        return ranges
+
+    @staticmethod
+    def _overlaps(ranges: List[Tuple[int, int]], patches: List[patch_range]) -> bool:
+        for start, size in ranges:
+            for patch in patches:
+                if patch.offset < start + size and start < patch.offset + patch.size:
+                    return True
+        return False
+
     @classmethod
-    def _parse_load_commands(cls, image: Image, load_symtab=True, load_imports=True, load_exports=True) -> None:
+    def _parse_load_commands(cls, image: Image, load_symtab=True, load_imports=True, load_exports=True,
+                             load_function_starts=True, commands=None) -> None:
         # noinspection PyUnusedLocal
         fixups = None
+        if commands is None:
+            commands = image.macho_header.load_commands
         log.info(f'registered {len(image.macho_header.load_commands)} Load Commands')
-        for cmd in image.macho_header.load_commands:
+        for cmd in commands:
             try:
                 load_command = LOAD_COMMAND(cmd.cmd)
             except ValueError:
@@ -114,7 +286,10 @@ class MachOImageLoader:
                     log.info("Loading Binding Info")
                     image.binding_table = BindingTable(image, cmd.bind_off, cmd.bind_size)
                     image.weak_binding_table = BindingTable(image, cmd.weak_bind_off, cmd.weak_bind_size)
-                    image.lazy_binding_table = BindingTable(image, cmd.lazy_bind_off, cmd.lazy_bind_size)
+                    image.lazy_binding_table = BindingTable(image, cmd.lazy_bind_off, cmd.lazy_bind_size, lazy=True)
+                    image.rebase_table = RebaseTable.from_image(image, cmd.rebase_off, cmd.rebase_size)
+                    if image.binding_table.bind_info.threaded_starts:
+                        image.chained_fixups = ChainedFixups.from_threaded_binds(image, image.binding_table)
 
                 if load_exports:
                     log.info("Loading Export Trie")
@@ -125,6 +300,8 @@ class MachOImageLoader:
                         image.export_trie = None
 
             elif load_command == LOAD_COMMAND.FUNCTION_STARTS:
+                if not load_function_starts:
+                    continue
                 fs_start = cmd.dataoff
                 fs_size = cmd.datasize
                 read_head = fs_start
@@ -137,8 +314,9 @@ class MachOImageLoader:
                     image.function_starts.append(fs_addr)
 
             elif load_command == LOAD_COMMAND.LC_DYLD_EXPORTS_TRIE:
-                log.info("Loading Export Trie")
-                image.export_trie = ExportTrie.from_image(image, cmd.dataoff, cmd.datasize)
+                if load_exports:
+                    log.info("Loading Export Trie")
+                    image.export_trie = ExportTrie.from_image(image, cmd.dataoff, cmd.datasize)
 
             elif load_command == LOAD_COMMAND.LC_DYLD_CHAINED_FIXUPS:
                 if load_imports:
@@ -212,14 +390,7 @@ class MachOImageLoader:
         :param image:
         :return:
         """
-        if image.dylib is not None:
-            image.name = image.dylib.install_name.split('/')[-1]
-            image.base_name = image.dylib.install_name.split('/')[-1]
-            image.install_name = image.dylib.install_name
-        else:
-            image.name = ""
-            image.base_name = image.slice.file.name
-            image.install_name = ""
+        MachOImageLoader._process_image_info(image)
 
         if image.export_trie:
             for symbol in image.export_trie.symbols:
@@ -250,6 +421,23 @@ class MachOImageLoader:
             for symbol in image.symbol_table.table:
                 image.symbols[symbol.address] = symbol
 
+    @staticmethod
+    def _process_image_info(image: Image) -> None:
+        """
+        The part of _process_image that doesn't touch any symbol tables (names, entry point)
+
+        :param image:
+        :return:
+        """
+        if image.dylib is not None:
+            image.name = image.dylib.install_name.split('/')[-1]
+            image.base_name = image.dylib.install_name.split('/')[-1]
+            image.install_name = image.dylib.install_name
+        else:
+            image.name = ""
+            image.base_name = image.slice.file.name
+            image.install_name = ""
+
         # noinspection PyProtectedMember
         if len(image.thread_state) > 0:
             image.entry_point = image.thread_state[-4] if image.macho_header.is64 else image.thread_state[-2]
@@ -377,9 +565,6 @@ class ChainedFixups(Constructable):
     @classmethod
     def from_image(cls, image: Image, chained_fixup_cmd: linkedit_data_command):
 
-        syms = []
-        rebases = {}
-
         fixup_header = image.read_struct(chained_fixup_cmd.dataoff, dyld_chained_fixups_header)
         log.debug_tm(f'{fixup_header.render_indented()}')
 
@@ -418,51 +603,27 @@ class ChainedFixups(Constructable):
             seg_info_offsets.append(image.read_uint(cursor, 4))
             cursor += 4
 
+        fixups = cls([])
+        fixups.import_table = import_table
+        segments = []
+
         for off in seg_info_offsets:
             if off == 0:
                 continue
             segstarts_addr = fixup_starts_address + off
             starts = image.read_struct(segstarts_addr, dyld_chained_starts_in_segment, endian="little")
 
-            stride_size: int = 0
-            ptr_format: ChainedFixupPointerGeneric = ChainedFixupPointerGeneric.Error
-
-            log.debug_tm(f"Pointer Format: {ptr_format.name}")
-            if starts.pointer_format in [dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E.value,
-                                         dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E_USERLAND.value,
-                                         dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E_USERLAND24.value]:
-                stride_size = 8
-                ptr_format = ChainedFixupPointerGeneric.GenericArm64eFixupFormat
-            elif starts.pointer_format == dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E_KERNEL.value:
-                stride_size = 4
-                ptr_format = ChainedFixupPointerGeneric.GenericArm64eFixupFormat
-            elif starts.pointer_format in [dyld_chained_ptr_format.DYLD_CHAINED_PTR_64.value,
-                                           dyld_chained_ptr_format.DYLD_CHAINED_PTR_64_OFFSET.value,
-                                           dyld_chained_ptr_format.DYLD_CHAINED_PTR_64_KERNEL_CACHE.value]:
-                stride_size = 4
-                ptr_format = ChainedFixupPointerGeneric.Generic64FixupFormat
-            elif starts.pointer_format in [dyld_chained_ptr_format.DYLD_CHAINED_PTR_32.value,
-                                           dyld_chained_ptr_format.DYLD_CHAINED_PTR_32_CACHE.value]:
-                stride_size = 4
-                ptr_format = ChainedFixupPointerGeneric.Generic32FixupFormat
-            elif starts.pointer_format == dyld_chained_ptr_format.DYLD_CHAINED_PTR_32_FIRMWARE.value:
-                stride_size = 4
-                ptr_format = ChainedFixupPointerGeneric.Generic64FixupFormat
-            elif starts.pointer_format == dyld_chained_ptr_format.DYLD_CHAINED_PTR_x86_64_KERNEL_CACHE.value:
-                stride_size = 1
-                ptr_format = ChainedFixupPointerGeneric.Generic64FixupFormat
-            else:
+            if starts.pointer_format not in _CHAINED_PTR_STRIDES:
                 log.error(f"Unsupported Pointer Format {starts.pointer_format}")
                 log.error(f'{hex(fixup_header.off)} @ {fixup_header.render_indented()}')
                 log.error(f"{starts.render_indented()}")
                 return cls([])
-            log.debug_tm(f"Stride Size: {stride_size}")
+            log.debug_tm(f"Pointer Format: {dyld_chained_ptr_format(starts.pointer_format).name}")
 
+            page_start_table_start_address = segstarts_addr + 22
+            page_start_table = image.read_bytearray(page_start_table_start_address, starts.page_count * 2)
             page_start_offsets: List[List[int]] = []
-            for i in range(0, starts.page_count):
-                page_start_table_start_address = segstarts_addr + 22
-                i_addr = page_start_table_start_address + (2 * i)
-                start = image.read_uint(i_addr, 2)
+            for start, in _UINT16.iter_unpack(page_start_table):
                 if (start & DYLD_CHAINED_PTR_START_MULTI) and (start != DYLD_CHAINED_PTR_START_NONE):
                     overflow_index = start & ~DYLD_CHAINED_PTR_START_MULTI
                     page_start_sub_starts: List[int] = []
@@ -480,108 +641,81 @@ class ChainedFixups(Constructable):
                 else:
                     page_start_offsets.append([start])
 
-            i = -1
-            for page_starts in page_start_offsets:
-                i += 1
+            pages = []
+            for i, page_starts in enumerate(page_start_offsets):
+                page_starts = [start for start in page_starts if start != DYLD_CHAINED_PTR_START_NONE]
+                if not page_starts:
+                    continue
                 page_addr = starts.segment_offset + (i * starts.page_size)
-                for start in page_starts:
-                    if start == DYLD_CHAINED_PTR_START_NONE:
-                        continue
-                    chain_entry_address = page_addr + start
-                    fixups_done = False
-                    while not fixups_done:
-                        cursor = chain_entry_address
-                        mapped_cursor = image.vm.de_translate(cursor)
-                        pointer32: ChainedFixupPointer32 = None
-                        pointer64: ChainedFixupPointer64 = None
-
-                        if ptr_format in [ChainedFixupPointerGeneric.Generic32FixupFormat,
-                                          ChainedFixupPointerGeneric.Firmware32FixupFormat]:
-                            pointer32 = image.read_struct(cursor, ChainedFixupPointer32)
-                        else:
-                            pointer64 = image.read_struct(cursor, ChainedFixupPointer64)
-
-                        bind: bool = False
-                        next_entry_stride_count = 0
-                        if ptr_format == ChainedFixupPointerGeneric.Generic32FixupFormat:
-                            bind = pointer32.generic32.dyld_chained_ptr_32_bind.bind != 0
-                            next_entry_stride_count = pointer32.generic32.dyld_chained_ptr_32_rebase.next
-                        elif ptr_format == ChainedFixupPointerGeneric.Generic64FixupFormat:
-                            bind = pointer64.generic64.ChainedPointerGeneric64.dyld_chained_ptr_64_bind.bind != 0
-                            next_entry_stride_count = pointer64.generic64.ChainedPointerGeneric64.dyld_chained_ptr_64_rebase.next
-                        elif ptr_format == ChainedFixupPointerGeneric.GenericArm64eFixupFormat:
-                            bind = pointer64.generic64.ChainedPointerArm64E.dyld_chained_ptr_arm64e_bind.bind != 0
-                            next_entry_stride_count = pointer64.generic64.ChainedPointerArm64E.dyld_chained_ptr_arm64e_bind.next
-                        elif ptr_format == ChainedFixupPointerGeneric.Firmware32FixupFormat:
-                            bind = False
-                            next_entry_stride_count = pointer32.generic32.dyld_chained_ptr_32_firmware_rebase
-                        else:
-                            log.error("unreachable")
-                            return cls([])
-
-                        if bind:
-                            ordinal = 0
-                            if starts.pointer_format in [dyld_chained_ptr_format.DYLD_CHAINED_PTR_64.value,
-                                dyld_chained_ptr_format.DYLD_CHAINED_PTR_64_OFFSET.value]:
-                                ordinal = pointer64.generic64.ChainedPointerGeneric64.dyld_chained_ptr_64_bind.ordinal
-                            elif starts.pointer_format in [  # i swear this looks better in c++
-                                dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E.value,
-                                dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E_USERLAND.value,
-                                dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E_KERNEL.value]:
-                                if (pointer64.generic64.ChainedPointerArm64E.dyld_chained_ptr_arm64e_bind.auth != 0):
-                                    ordinal = pointer64.generic64.ChainedPointerArm64E.dyld_chained_ptr_arm64e_auth_bind24.ordinal if starts.pointer_format == dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E_USERLAND24 else pointer64.generic64.ChainedPointerArm64E.dyld_chained_ptr_arm64e_auth_bind.ordinal
-                                else:
-                                    ordinal = pointer64.generic64.ChainedPointerArm64E.dyld_chained_ptr_arm64e_bind24.ordinal if starts.pointer_format == dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E_USERLAND24 else pointer64.generic64.ChainedPointerArm64E.dyld_chained_ptr_arm64e_bind.ordinal
-                            elif starts.pointer_format == dyld_chained_ptr_format.DYLD_CHAINED_PTR_32.value:
-                                ordinal = pointer32.generic32.dyld_chained_ptr_32_bind.ordinal
-
-                            else:
-                                log.error("Unknown bind pointer format")
-                                return cls([])
-
-                            if ordinal < len(import_table):
-                                entry = import_table[ordinal]
-                                target_addr = mapped_cursor
-                                sym = Symbol.from_values(entry.name, target_addr, external=True, ordinal=entry.ord)
-                                syms.append(sym)
-
-                        else: #rebase
-                            entry_offset = 0
-                            if dyld_chained_ptr_format(starts.pointer_format) in [dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E,
-                                                         dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E_KERNEL,
-                                                         dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E_USERLAND,
-                                                         dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E_USERLAND24]:
-                                if pointer64.generic64.ChainedPointerArm64E.dyld_chained_ptr_arm64e_auth_rebase.auth == 1:
-                                    entry_offset = pointer64.generic64.ChainedPointerArm64E.dyld_chained_ptr_arm64e_auth_rebase.target
-                                else:
-                                    entry_offset = pointer64.generic64.ChainedPointerArm64E.dyld_chained_ptr_arm64e_rebase.target
-
-                                if dyld_chained_ptr_format(starts.pointer_format) != dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E or pointer64.generic64.ChainedPointerArm64E.dyld_chained_ptr_arm64e_auth_rebase.auth:
-                                    entry_offset += image.vm.vm_base_addr
-                            elif dyld_chained_ptr_format(starts.pointer_format) == dyld_chained_ptr_format.DYLD_CHAINED_PTR_64:
-                                entry_offset = pointer64.generic64.ChainedPointerGeneric64.dyld_chained_ptr_64_rebase.target
-                            elif dyld_chained_ptr_format(starts.pointer_format) == dyld_chained_ptr_format.DYLD_CHAINED_PTR_64_OFFSET:
-                                entry_offset = pointer64.generic64.ChainedPointerGeneric64.dyld_chained_ptr_64_rebase.target + image.vm.vm_base_addr
-                            #elif starts.pointer_format == dyld_chained_ptr_format.DYLD_CHAINED_PTR_64_KERNEL_CACHE or \
-                            #    starts.pointer_format == dyld_chained_ptr_format.DYLD_CHAINED_PTR_X86_64_KERNEL_CACHE:
-                            #    entry_offset = pointer64.
-                            elif dyld_chained_ptr_format(starts.pointer_format) == dyld_chained_ptr_format.DYLD_CHAINED_PTR_32 or dyld_chained_ptr_format(starts.pointer_format) == dyld_chained_ptr_format.DYLD_CHAINED_PTR_32_CACHE:
-                                entry_offset = pointer32.generic32.dyld_chained_ptr_32_rebase.target
-                            elif dyld_chained_ptr_format(starts.pointer_format) == dyld_chained_ptr_format.DYLD_CHAINED_PTR_32_CACHE:
-                                entry_offset = pointer32.generic32.dyld_chained_ptr_32_firmware_rebase.target
-                            else:
-                                print(f"Unknown rebase pointer format {starts.pointer_format}")
-
-                            rebases[pointer64.off + image.vm.vm_base_addr] = entry_offset
-
-                        chain_entry_address += next_entry_stride_count * stride_size
-                        if (chain_entry_address > page_addr + starts.page_size):
-                            log.error("Pointer left page, bailing fixup processing, binary is malformed")
-                            fixups_done = True
-                        if next_entry_stride_count == 0:
-                            fixups_done = True
-
-        return cls(syms, rebases)
+                # File -> VM translation is constant across a page, so translate once and offset from there.
+                first_pointer = page_addr + page_starts[0]
+                vm_delta = image.vm.de_translate(first_pointer) - first_pointer
+                pages.append(fixup_page(page_addr, page_starts, page_addr + vm_delta))
+            if pages:
+                segments.append((starts.page_size, starts.pointer_format, pages))
+
+        for rebase_addresses, rebase_targets, bind_addresses, bind_imports, bad_chains in \
+                _decode_fixup_pages(image, segments):
+            if bad_chains:
+                log.error("Pointer left page, bailing fixup processing, binary is malformed")
+            fixups.rebase_addresses.extend(rebase_addresses)
+            fixups.rebase_targets.extend(rebase_targets)
+            fixups.bind_addresses.extend(bind_addresses)
+            fixups.bind_imports.extend(bind_imports)
+
+        import_count = len(import_table)
+        for address, import_index in zip(fixups.bind_addresses, fixups.bind_imports):
+            if import_index < import_count:
+                entry = import_table[import_index]
+                fixups.symbols.append(Symbol.from_values(entry.name, address, external=True, ordinal=entry.ord))
+
+        return fixups
+
+    @classmethod
+    def from_threaded_binds(cls, image: Image, binding_table: 'BindingTable') -> 'ChainedFixups':
+        """
+        Walk the pointer chains of an image using threaded binds (arm64e, before LC_DYLD_CHAINED_FIXUPS). They're the
+            same chains DYLD_CHAINED_PTR_ARM64E describes, starting wherever the bind opcodes applied them.
+
+        :param image: Image
+        :param binding_table: The image's BindingTable, run over bind info that uses threaded binds
+        :return: ChainedFixups with the chains' rebases, and a Symbol for each bind
+        """
+        info = binding_table.bind_info
+        fixups = cls([])
+        segment_data = {}
+
+        for start in info.threaded_starts:
+            segment = next((seg for seg in image.segments.values()
+                            if seg.vm_address <= start < seg.vm_address + seg.file_size), None)
+            if segment is None:
+                log.error(f'Threaded bind chain at {hex(start)} isn\'t in a segment')
+                macho_is_malformed()
+                continue
+            if segment.name not in segment_data:
+                segment_data[segment.name] = image.read_bytearray(segment.file_address, segment.file_size)
+
+            rebase_offsets, rebase_targets, bind_offsets, bind_imports = array('Q'), array('Q'), array('Q'), array('I')
+            data = segment_data[segment.name]
+            if not walk_fixup_chain(data, start - segment.vm_address, len(data), _PTR_ARM64E, image.vm.vm_base_addr,
+                                    rebase_offsets, rebase_targets, bind_offsets, bind_imports):
+                log.error(f'Threaded bind chain at {hex(start)} runs past the end of {segment.name}')
+                macho_is_malformed()
+            fixups.rebase_addresses.extend(segment.vm_address + offset for offset in rebase_offsets)
+            fixups.rebase_targets.extend(rebase_targets)
+            fixups.bind_addresses.extend(segment.vm_address + offset for offset in bind_offsets)
+            fixups.bind_imports.extend(bind_imports)
+
+        table_size = len(info.threaded_symbols)
+        for address, index in zip(fixups.bind_addresses, fixups.bind_imports):
+            if index < table_size:
+                ordinal = info.threaded_ordinals[index]
+                # noinspection PyProtectedMember
+                libname = binding_table._libname(ordinal) if ordinal > 0 else str(ordinal)
+                fixups.symbols.append(Symbol.from_values(info.names[info.threaded_symbols[index]], address,
+                                                         external=True, ordinal=libname))
+
+        return fixups
 
     @classmethod
     def from_values(cls, *args, **kwargs):
@@ -591,10 +725,223 @@ class ChainedFixups(Constructable):
         pass
 
     def __init__(self, symbols, rebases=None):
-        if rebases is None:
-            rebases = {}
         self.symbols = symbols
-        self.rebases = rebases
+        self.import_table = []
+
+        # Every fixup found, in chain order. rebase_addresses/bind_addresses are VM addresses of the pointers,
+        #   rebase_targets what they point to, and bind_imports the import table index each one binds to.
+        self.rebase_addresses = array('Q')
+        self.rebase_targets = array('Q')
+        self.bind_addresses = array('Q')
+        self.bind_imports = array('I')
+
+        self._rebases = rebases
+
+    @property
+    def rebases(self) -> Dict[int, int]:
+        """
+        pointer address -> rebased value
+        """
+        if self._rebases is None:
+            self._rebases = dict(zip(self.rebase_addresses, self.rebase_targets))
+        return self._rebases
+
+
+# pointer_format -> how many bytes one unit of a pointer's "next" field is
+_CHAINED_PTR_STRIDES = {
+    dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E.value: 8,
+    dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E_USERLAND.value: 8,
+    dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E_USERLAND24.value: 8,
+    dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E_KERNEL.value: 4,
+    dyld_chained_ptr_format.DYLD_CHAINED_PTR_64.value: 4,
+    dyld_chained_ptr_format.DYLD_CHAINED_PTR_64_OFFSET.value: 4,
+    dyld_chained_ptr_format.DYLD_CHAINED_PTR_64_KERNEL_CACHE.value: 4,
+    dyld_chained_ptr_format.DYLD_CHAINED_PTR_x86_64_KERNEL_CACHE.value: 1,
+    dyld_chained_ptr_format.DYLD_CHAINED_PTR_32.value: 4,
+    dyld_chained_ptr_format.DYLD_CHAINED_PTR_32_CACHE.value: 4,
+    dyld_chained_ptr_format.DYLD_CHAINED_PTR_32_FIRMWARE.value: 4,
+}
+
+_PTR_ARM64E = dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E.value
+_PTR_ARM64E_USERLAND24 = dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E_USERLAND24.value
+_PTR_64_OFFSET = dyld_chained_ptr_format.DYLD_CHAINED_PTR_64_OFFSET.value
+_PTR_32_CACHE = dyld_chained_ptr_format.DYLD_CHAINED_PTR_32_CACHE.value
+_PTR_32_FIRMWARE = dyld_chained_ptr_format.DYLD_CHAINED_PTR_32_FIRMWARE.value
+
+_ARM64E_PTR_FORMATS = {dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E.value,
+                       dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E_USERLAND.value,
+                       dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E_USERLAND24.value,
+                       dyld_chained_ptr_format.DYLD_CHAINED_PTR_ARM64E_KERNEL.value}
+_64_PTR_FORMATS = {dyld_chained_ptr_format.DYLD_CHAINED_PTR_64.value,
+                   dyld_chained_ptr_format.DYLD_CHAINED_PTR_64_OFFSET.value}
+_KERNEL_CACHE_PTR_FORMATS = {dyld_chained_ptr_format.DYLD_CHAINED_PTR_64_KERNEL_CACHE.value,
+                             dyld_chained_ptr_format.DYLD_CHAINED_PTR_x86_64_KERNEL_CACHE.value}
+
+_UINT16 = struct.Struct('<H')
+_UINT32 = struct.Struct('<I')
+_UINT64 = struct.Struct('<Q')
+
+
+def walk_fixup_chain(page, offset: int, page_size: int, pointer_format: int, vm_base_addr: int,
+                     rebase_offsets: array, rebase_targets: array, bind_offsets: array, bind_imports: array) -> bool:
+    """
+    Follow one chain of fixups through a page, decoding each pointer straight from its integer value.
+
+    Rebases and binds are appended to the passed arrays; the offsets recorded are relative to the start of `page`.
+
+    :param page: Raw page contents
+    :param offset: Offset of the first pointer in the chain
+    :param page_size: Size of the page (`page` itself may run a little past it)
+    :param pointer_format: dyld_chained_ptr_format value for this segment
+    :param vm_base_addr: Image base, for formats whose rebase targets are relative to it
+    :return: False if the chain left the page or ran off the end of the data
+    """
+    stride = _CHAINED_PTR_STRIDES[pointer_format]
+    is_arm64e = pointer_format in _ARM64E_PTR_FORMATS
+    is_64 = pointer_format in _64_PTR_FORMATS
+    is_kernel_cache = pointer_format in _KERNEL_CACHE_PTR_FORMATS
+
+    unpack, ptr_size = (_UINT64.unpack_from, 8) if is_arm64e or is_64 or is_kernel_cache else (_UINT32.unpack_from, 4)
+    # plain arm64e rebases hold a VM address, everything else in the family is an offset from the image base
+    arm64e_base = 0 if pointer_format == _PTR_ARM64E else vm_base_addr
+    ordinal_mask = 0xFFFFFF if pointer_format == _PTR_ARM64E_USERLAND24 else 0xFFFF
+    offset_base = vm_base_addr if pointer_format == _PTR_64_OFFSET else 0
+
+    rebase_offsets_append = rebase_offsets.append
+    rebase_targets_append = rebase_targets.append
+    bind_offsets_append = bind_offsets.append
+    bind_imports_append = bind_imports.append
+    end = len(page)
+
+    while True:
+        if offset + ptr_size > end:
+            return False
+        raw, = unpack(page, offset)
+
+        if is_arm64e:
+            next_count = (raw >> 51) & 0x7FF
+            if raw & (1 << 62):
+                bind_offsets_append(offset)
+                bind_imports_append(raw & ordinal_mask)
+            else:
+                rebase_offsets_append(offset)
+                if raw >> 63:
+                    rebase_targets_append((raw & 0xFFFFFFFF) + vm_base_addr)
+                else:
+                    rebase_targets_append((raw & 0x7FFFFFFFFFF) + arm64e_base)
+        elif is_64:
+            next_count = (raw >> 51) & 0xFFF
+            if raw >> 63:
+                bind_offsets_append(offset)
+                bind_imports_append(raw & 0xFFFFFF)
+            else:
+                rebase_offsets_append(offset)
+                rebase_targets_append((raw & 0xFFFFFFFFF) + offset_base)
+        elif is_kernel_cache:
+            next_count = (raw >> 51) & 0xFFF
+            rebase_offsets_append(offset)
+            rebase_targets_append((raw & 0x3FFFFFFF) + vm_base_addr)
+        elif pointer_format == _PTR_32_CACHE:
+            next_count = raw >> 30
+            rebase_offsets_append(offset)
+            rebase_targets_append((raw & 0x3FFFFFFF) + vm_base_addr)
+        elif pointer_format == _PTR_32_FIRMWARE:
+            next_count = (raw >> 26) & 0x3F
+            rebase_offsets_append(offset)
+            rebase_targets_append(raw & 0x3FFFFFF)
+        else:
+            next_count = (raw >> 26) & 0x1F
+            if raw >> 31:
+                bind_offsets_append(offset)
+                bind_imports_append(raw & 0xFFFFF)
+            else:
+                rebase_offsets_append(offset)
+                rebase_targets_append(raw & 0x3FFFFFF)
+
+        if next_count == 0:
+            return True
+        offset += next_count * stride
+        if offset > page_size:
+            return False
+
+
+fixup_page = namedtuple('fixup_page', ['file_address', 'starts', 'vm_address'])
+
+
+def walk_fixup_pages(data, data_address: int, pages: List[fixup_page], page_size: int, pointer_format: int,
+                     vm_base_addr: int):
+    """
+    Decode every chain in a run of fixup pages. This is the unit of work handed to each worker when decoding
+        in parallel, so it only deals in plain bytes and arrays.
+
+    :param data: Raw bytes covering every page in `pages`, plus a pointer's worth past the last one
+    :param data_address: File address `data` starts at
+    :param pages: Pages to decode
+    :param page_size: Size of each page
+    :param pointer_format: dyld_chained_ptr_format value for the segment the pages belong to
+    :param vm_base_addr: Image base
+    :return: (rebase addresses, rebase targets, bind addresses, bind import indexes, count of malformed chains)
+    """
+    rebase_addresses, rebase_targets = array('Q'), array('Q')
+    bind_addresses, bind_imports = array('Q'), array('I')
+    bad_chains = 0
+    view = memoryview(data)
+
+    for page in pages:
+        page_offset = page.file_address - data_address
+        page_data = view[page_offset:page_offset + page_size + 8]
+        rebase_count = len(rebase_addresses)
+        bind_count = len(bind_addresses)
+        for start in page.starts:
+            if not walk_fixup_chain(page_data, start, page_size, pointer_format, vm_base_addr, rebase_addresses,
+                                    rebase_targets, bind_addresses, bind_imports):
+                bad_chains += 1
+
+        # chain offsets are page relative, rebase it all in one pass
+        for index in range(rebase_count, len(rebase_addresses)):
+            rebase_addresses[index] += page.vm_address
+        for index in range(bind_count, len(bind_addresses)):
+            bind_addresses[index] += page.vm_address
+
+    return rebase_addresses, rebase_targets, bind_addresses, bind_imports, bad_chains
+
+
+# Pages handed to a worker at once
+FIXUP_PAGES_PER_TASK = 0x100
+# Below this many pages, starting a process pool costs more than it saves
+FIXUP_PARALLEL_MIN_PAGES = 0x1000
+
+
+def _decode_fixup_pages(image: Image, segments: List[Tuple[int, int, List[fixup_page]]]) -> List[tuple]:
+    """
+    Decode fixup pages, across a pool of processes if there are enough of them to be worth it.
+
+    Worker count comes from opts.FIXUP_WORKERS (1, the default, always decodes in this process; 0 uses every core).
+
+    :param image: Image the pages belong to
+    :param segments: (page size, pointer format, pages) for each segment with fixups
+    :return: walk_fixup_pages() results, in page order
+    """
+    tasks = []
+    for page_size, pointer_format, pages in segments:
+        for i in range(0, len(pages), FIXUP_PAGES_PER_TASK):
+            chunk = pages[i:i + FIXUP_PAGES_PER_TASK]
+            data_address = chunk[0].file_address
+            data = image.read_bytearray(data_address, chunk[-1].file_address + page_size + 8 - data_address)
+            tasks.append((data, data_address, chunk, page_size, pointer_format, image.vm.vm_base_addr))
+
+    workers = opts.FIXUP_WORKERS or os.cpu_count()
+    page_count = sum(len(pages) for _, _, pages in segments)
+
+    if workers > 1 and len(tasks) > 1 and page_count >= FIXUP_PARALLEL_MIN_PAGES:
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+                return list(executor.map(walk_fixup_pages, *zip(*tasks)))
+        except (OSError, NotImplementedError, BrokenProcessPool) as ex:
+            # no working multiprocessing here (sandboxes, some embedded interpreters); it'll just be slower
+            log.warn(f'Parallel fixup decoding unavailable ({ex}), decoding serially')
+
+    return [walk_fixup_pages(*task) for task in tasks]
 
 
 export_node = namedtuple("export_node", ['text', 'offset', 'flags'])
@@ -605,8 +952,8 @@ class ExportTrie(Constructable):
     def from_image(cls, image: Image, export_start: int, export_size: int) -> 'ExportTrie':
         trie = ExportTrie()
 
-        endpoint = export_start + export_size
-        nodes = ExportTrie.read_node(image, export_start, '', export_start, endpoint)
+        trie.raw = image.read_bytearray(export_start, export_size)
+        nodes = list(ExportTrie.walk(trie.raw))
         symbols = []
 
         for node in nodes:
@@ -615,7 +962,6 @@ class ExportTrie(Constructable):
 
         trie.nodes = nodes
         trie.symbols = symbols
-        trie.raw = image.read_bytearray(export_start, export_size)
 
         return trie
 
@@ -631,205 +977,520 @@ class ExportTrie(Constructable):
         self.nodes: List[export_node] = []
         self.symbols: List[Symbol] = []
 
-    @classmethod
-    def read_node(cls, image: Image, trie_start: int, string: str, cursor: int, endpoint: int) -> List[export_node]:
+    def lookup(self, name: str) -> Union[export_node, None]:
+        """
+        Check whether a symbol is exported, following only the trie edges that match it.
 
-        if cursor > endpoint:
-            log.error("Node offset greater than size of export trie")
-            macho_is_malformed()
+        :param name: Full symbol name (e.g. _main)
+        :return: Node for the symbol, or None if it isn't exported
+        """
+        return ExportTrie.find(self.raw, name)
 
-        start = cursor
-        terminal_size, cursor = image.read_uleb128(cursor)
-        results = []
-        log.debug_tm(f'@ {hex(start)} node: {hex(terminal_size)} current_symbol: {string}')
-        child_start = cursor + terminal_size
-        if terminal_size != 0:
-            log.debug_tm(f'TERM: 0')
-            size, cursor = image.read_uleb128(cursor)
-            flags = image.read_uint(cursor, 1)
-            log.debug_tm(f'FLAGS: {hex(flags)}')
-            cursor += 1
-            offset, cursor = image.read_uleb128(cursor)
-            results.append(export_node(string, offset, flags))
-        cursor = child_start
-        branches = image.read_uint(cursor, 1)
-        log.debug_tm(f'BRAN {branches}')
-        for i in range(0, branches):
-            if i == 0:
+    @staticmethod
+    def walk(raw: bytes, cursor: int = 0, prefix: str = '') -> Iterator[export_node]:
+        """
+        Walk an export trie depth first, yielding a node for every terminal (every exported symbol), in trie order.
+
+        This is iterative, so deep tries can't run into the recursion limit.
+
+        :param raw: Raw bytes of the export trie
+        :param cursor: Offset of the node to start at, 0 being the root
+        :param prefix: Symbol text leading up to that node
+        :return: Iterator of export_node
+        """
+        size = len(raw)
+        # an empty trie (or a start past the end of it) just has nothing exported
+        if cursor >= size:
+            return
+        stack = [(cursor, prefix.encode('utf-8'))]
+        visited = {cursor}
+
+        while stack:
+            cursor, text = stack.pop()
+
+            try:
+                terminal_size, cursor = _read_uleb(raw, cursor)
+                child_start = cursor + terminal_size
+                if terminal_size != 0:
+                    flags, cursor = _read_uleb(raw, cursor)
+                    offset, cursor = _read_uleb(raw, cursor)
+                    yield export_node(text.decode('utf-8', errors='replace'), offset, flags)
+
+                cursor = child_start
+                branches = raw[cursor]
                 cursor += 1
-            proc_str = image.read_cstr(cursor)
-            cursor += len(proc_str) + 1
-            offset, cursor = image.read_uleb128(cursor)
-            log.debug_tm(f'({i}) string: {string + proc_str} next_node: {hex(trie_start + offset)}')
-            results += ExportTrie.read_node(image, trie_start, string + proc_str, trie_start + offset, endpoint)
+                children = []
+                for _ in range(branches):
+                    edge_end = raw.index(0, cursor)
+                    edge = raw[cursor:edge_end]
+                    child, cursor = _read_uleb(raw, edge_end + 1)
+                    if child >= size or child in visited:
+                        log.error(f'Bad export trie node offset {hex(child)} (trie size {hex(size)})')
+                        macho_is_malformed()
+                        continue
+                    visited.add(child)
+                    children.append((child, text + edge))
+            except (IndexError, ValueError):
+                log.error(f'Export trie node at {hex(cursor)} runs past the end of the trie')
+                macho_is_malformed()
+                continue
+
+            # reversed, so children come off the stack (and out of the walk) in the order they're listed in
+            stack.extend(reversed(children))
 
-        return results
+    @staticmethod
+    def find(raw: bytes, name: str) -> Union[export_node, None]:
+        """
+        Look up a single symbol in a raw export trie, without decoding any of the rest of it.
+
+        :param raw: Raw bytes of the export trie
+        :param name: Full symbol name
+        :return: Node for the symbol, or None if the trie doesn't contain it
+        """
+        if not raw:
+            return None
+        target = name.encode('utf-8')
+        cursor = 0
+        matched = 0
+
+        try:
+            # every edge followed consumes at least one character of the name
+            for _ in range(len(target) + 1):
+                terminal_size, info = _read_uleb(raw, cursor)
+                if matched == len(target):
+                    if terminal_size == 0:
+                        return None
+                    flags, info = _read_uleb(raw, info)
+                    offset, _ = _read_uleb(raw, info)
+                    return export_node(name, offset, flags)
+
+                cursor = info + terminal_size
+                branches = raw[cursor]
+                cursor += 1
+                for _ in range(branches):
+                    edge_end = raw.index(0, cursor)
+                    edge = raw[cursor:edge_end]
+                    child, cursor = _read_uleb(raw, edge_end + 1)
+                    if len(edge) > 0 and target.startswith(edge, matched):
+                        matched += len(edge)
+                        cursor = child
+                        break
+                else:
+                    return None
+        except (IndexError, ValueError):
+            log.error(f'Malformed export trie while looking up {name}')
+
+        return None
+
+    @classmethod
+    def read_node(cls, image: Image, trie_start: int, string: str, cursor: int, endpoint: int) -> List[export_node]:
+        return list(ExportTrie.walk(image.read_bytearray(trie_start, endpoint - trie_start), cursor - trie_start,
+                                    string))
+
+
+def _read_uleb(data, cursor: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[cursor]
+        cursor += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, cursor
+        shift += 7
 
 
 action = namedtuple("action", ["vmaddr", "libname", "item"])
 record = namedtuple("record", ["off", "seg_index", "seg_offset", "lib_ordinal", "type", "flags", "name", "addend",
     "special_dylib"])
 
+_ADDRESS_MASK = 0xFFFFFFFFFFFFFFFF
+
+# Special (negative) dylib ordinals, see BIND_SPECIAL_DYLIB_* in mach-o/loader.h
+SPECIAL_DYLIB_NAMES = {0: 'self', -1: 'main-executable', -2: 'flat-namespace', -3: 'weak'}
+
+
+def _read_sleb(data, cursor: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[cursor]
+        cursor += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            if byte & 0x40:
+                value -= 1 << shift
+            return value, cursor
+
+
+class BindInfo:
+    """
+    Compact result of running a set of bind opcodes.
+
+    Every bind is one entry across the parallel arrays; .names holds each distinct symbol name once, and .symbols
+        indexes into it.
+    """
+
+    def __init__(self):
+        self.addresses = array('Q')
+        self.ordinals = array('q')
+        self.symbols = array('I')
+        self.addends = array('q')
+        self.types = array('B')
+        self.flags = array('B')
+        self.segments = array('B')
+        self.opcode_offsets = array('I')
+        self.names: List[str] = []
+
+        # Threaded binds (arm64e images from before chained fixups) only list symbols here, as the "bind ordinal
+        #   table" indexed by binds in the pointer chains, and where each of those chains starts.
+        self.threaded_ordinals = array('q')
+        self.threaded_symbols = array('I')
+        self.threaded_starts = array('Q')
+
+    def __len__(self):
+        return len(self.addresses)
+
+
+def run_bind_opcodes(data: bytes, segment_addresses: List[int], ptr_size: int, lazy=False) -> BindInfo:
+    """
+    Interpret a bind/weak bind/lazy bind opcode stream (the tables pointed to by LC_DYLD_INFO)
+
+    Threaded binds (BIND_OPCODE_THREADED) don't bind anything themselves; their symbols and chain starts are
+        collected into .threaded_* for ChainedFixups.from_threaded_binds() to walk the chains with.
+
+    :param data: Raw opcode bytes
+    :param segment_addresses: VM address of each segment, in load command order
+    :param ptr_size: Pointer size of the image
+    :param lazy: Lazy bind info is a series of independent entries each ending in DONE, rather than one stream
+    :return: BindInfo
+    """
+    info = BindInfo()
+    name_indexes: Dict[str, int] = {}
+
+    # local aliases, this loop runs once per opcode byte
+    addresses_append = info.addresses.append
+    ordinals_append = info.ordinals.append
+    symbols_append = info.symbols.append
+    addends_append = info.addends.append
+    types_append = info.types.append
+    flags_append = info.flags.append
+    segments_append = info.segments.append
+    offsets_append = info.opcode_offsets.append
+    segment_count = len(segment_addresses)
+
+    size = len(data)
+    cursor = 0
+
+    seg_index = 0
+    seg_offset = 0
+    ordinal = 0
+    bind_type = 0
+    sym_flags = 0
+    sym_index = -1
+    addend = 0
+    threaded = False
+
+    def bind(at):
+        if sym_index < 0 or seg_index >= segment_count:
+            log.error(f'Bind at opcode offset {hex(at)} has no symbol or a bad segment index ({seg_index})')
+            macho_is_malformed()
+            return
+        addresses_append((segment_addresses[seg_index] + seg_offset) & _ADDRESS_MASK)
+        ordinals_append(ordinal)
+        symbols_append(sym_index)
+        addends_append(addend)
+        types_append(bind_type)
+        flags_append(sym_flags)
+        segments_append(seg_index)
+        offsets_append(at)
+
+    try:
+        while cursor < size:
+            opcode_start = cursor
+            byte = data[cursor]
+            cursor += 1
+            opcode = byte & 0xF0
+            imm = byte & 0x0F
+
+            if opcode == _BIND_DONE:
+                if not lazy:
+                    break
+                seg_index = seg_offset = ordinal = bind_type = sym_flags = addend = 0
+                sym_index = -1
+
+            elif opcode == _BIND_SET_DYLIB_ORDINAL_IMM:
+                ordinal = imm
+            elif opcode == _BIND_SET_DYLIB_ORDINAL_ULEB:
+                ordinal, cursor = _read_uleb(data, cursor)
+            elif opcode == _BIND_SET_DYLIB_SPECIAL_IMM:
+                # sign extended 4 bit immediate
+                ordinal = (imm | ~0xF) if imm else 0
+
+            elif opcode == _BIND_SET_SYMBOL_TRAILING_FLAGS_IMM:
+                sym_flags = imm
+                name_end = data.index(0, cursor)
+                name = bytes(data[cursor:name_end]).decode('utf-8', errors='replace')
+                cursor = name_end + 1
+                sym_index = name_indexes.get(name, -1)
+                if sym_index < 0:
+                    sym_index = name_indexes[name] = len(info.names)
+                    info.names.append(name)
+
+            elif opcode == _BIND_SET_TYPE_IMM:
+                bind_type = imm
+            elif opcode == _BIND_SET_ADDEND_SLEB:
+                addend, cursor = _read_sleb(data, cursor)
+            elif opcode == _BIND_SET_SEGMENT_AND_OFFSET_ULEB:
+                seg_index = imm
+                seg_offset, cursor = _read_uleb(data, cursor)
+            elif opcode == _BIND_ADD_ADDR_ULEB:
+                delta, cursor = _read_uleb(data, cursor)
+                seg_offset = (seg_offset + delta) & _ADDRESS_MASK
+
+            elif opcode == _BIND_DO_BIND:
+                if threaded:
+                    info.threaded_ordinals.append(ordinal)
+                    info.threaded_symbols.append(sym_index)
+                else:
+                    bind(opcode_start)
+                    seg_offset += ptr_size
+            elif opcode == _BIND_DO_BIND_ADD_ADDR_ULEB:
+                bind(opcode_start)
+                delta, cursor = _read_uleb(data, cursor)
+                seg_offset = (seg_offset + delta + ptr_size) & _ADDRESS_MASK
+            elif opcode == _BIND_DO_BIND_ADD_ADDR_IMM_SCALED:
+                bind(opcode_start)
+                seg_offset += imm * ptr_size + ptr_size
+            elif opcode == _BIND_DO_BIND_ULEB_TIMES_SKIPPING_ULEB:
+                count, cursor = _read_uleb(data, cursor)
+                skip, cursor = _read_uleb(data, cursor)
+                for _ in range(count):
+                    bind(opcode_start)
+                    seg_offset += skip + ptr_size
+
+            elif opcode == _BIND_THREADED:
+                if imm == BIND_SUBOPCODE_THREADED_SET_BIND_ORDINAL_TABLE_SIZE_ULEB:
+                    _, cursor = _read_uleb(data, cursor)
+                    threaded = True
+                elif imm == BIND_SUBOPCODE_THREADED_APPLY and seg_index < segment_count:
+                    info.threaded_starts.append((segment_addresses[seg_index] + seg_offset) & _ADDRESS_MASK)
+
+            else:
+                log.error(f'Unknown bind opcode {hex(byte)} at offset {hex(opcode_start)}')
+                macho_is_malformed()
+                break
+    except (IndexError, ValueError):
+        log.error('Bind opcodes run past the end of their table')
+        macho_is_malformed()
+
+    return info
+
+
+def run_rebase_opcodes(data: bytes, segment_addresses: List[int], ptr_size: int) -> Tuple[array, array]:
+    """
+    Interpret a rebase opcode stream (LC_DYLD_INFO rebase_off)
+
+    :param data: Raw opcode bytes
+    :param segment_addresses: VM address of each segment, in load command order
+    :param ptr_size: Pointer size of the image
+    :return: (addresses, types); the VM address of every rebased pointer, and the REBASE_TYPE of each
+    """
+    addresses = array('Q')
+    types = array('B')
+    segment_count = len(segment_addresses)
+
+    size = len(data)
+    cursor = 0
+    rebase_type = 0
+    seg_index = 0
+    seg_offset = 0
+
+    def rebase(count, stride):
+        nonlocal seg_offset
+        if seg_index >= segment_count:
+            log.error(f'Rebase uses bad segment index {seg_index}')
+            macho_is_malformed()
+            return
+        base = segment_addresses[seg_index]
+        for _ in range(count):
+            addresses.append((base + seg_offset) & _ADDRESS_MASK)
+            types.append(rebase_type)
+            seg_offset += stride
+
+    try:
+        while cursor < size:
+            byte = data[cursor]
+            cursor += 1
+            opcode = byte & 0xF0
+            imm = byte & 0x0F
+
+            if opcode == _REBASE_DONE:
+                break
+            elif opcode == _REBASE_SET_TYPE_IMM:
+                rebase_type = imm
+            elif opcode == _REBASE_SET_SEGMENT_AND_OFFSET_ULEB:
+                seg_index = imm
+                seg_offset, cursor = _read_uleb(data, cursor)
+            elif opcode == _REBASE_ADD_ADDR_ULEB:
+                delta, cursor = _read_uleb(data, cursor)
+                seg_offset = (seg_offset + delta) & _ADDRESS_MASK
+            elif opcode == _REBASE_ADD_ADDR_IMM_SCALED:
+                seg_offset += imm * ptr_size
+            elif opcode == _REBASE_DO_REBASE_IMM_TIMES:
+                rebase(imm, ptr_size)
+            elif opcode == _REBASE_DO_REBASE_ULEB_TIMES:
+                count, cursor = _read_uleb(data, cursor)
+                rebase(count, ptr_size)
+            elif opcode == _REBASE_DO_REBASE_ADD_ADDR_ULEB:
+                delta, cursor = _read_uleb(data, cursor)
+                rebase(1, delta + ptr_size)
+            elif opcode == _REBASE_DO_REBASE_ULEB_TIMES_SKIPPING_ULEB:
+                count, cursor = _read_uleb(data, cursor)
+                skip, cursor = _read_uleb(data, cursor)
+                rebase(count, skip + ptr_size)
+            else:
+                log.error(f'Unknown rebase opcode {hex(byte)} at offset {hex(cursor - 1)}')
+                macho_is_malformed()
+                break
+    except IndexError:
+        log.error('Rebase opcodes run past the end of their table')
+        macho_is_malformed()
+
+    return addresses, types
+
+
+_BIND_DONE = BINDING_OPCODE.DONE.value
+_BIND_SET_DYLIB_ORDINAL_IMM = BINDING_OPCODE.SET_DYLIB_ORDINAL_IMM.value
+_BIND_SET_DYLIB_ORDINAL_ULEB = BINDING_OPCODE.SET_DYLIB_ORDINAL_ULEB.value
+_BIND_SET_DYLIB_SPECIAL_IMM = BINDING_OPCODE.SET_DYLIB_SPECIAL_IMM.value
+_BIND_SET_SYMBOL_TRAILING_FLAGS_IMM = BINDING_OPCODE.SET_SYMBOL_TRAILING_FLAGS_IMM.value
+_BIND_SET_TYPE_IMM = BINDING_OPCODE.SET_TYPE_IMM.value
+_BIND_SET_ADDEND_SLEB = BINDING_OPCODE.SET_ADDEND_SLEB.value
+_BIND_SET_SEGMENT_AND_OFFSET_ULEB = BINDING_OPCODE.SET_SEGMENT_AND_OFFSET_ULEB.value
+_BIND_ADD_ADDR_ULEB = BINDING_OPCODE.ADD_ADDR_ULEB.value
+_BIND_DO_BIND = BINDING_OPCODE.DO_BIND.value
+_BIND_DO_BIND_ADD_ADDR_ULEB = BINDING_OPCODE.DO_BIND_ADD_ADDR_ULEB.value
+_BIND_DO_BIND_ADD_ADDR_IMM_SCALED = BINDING_OPCODE.DO_BIND_ADD_ADDR_IMM_SCALED.value
+_BIND_DO_BIND_ULEB_TIMES_SKIPPING_ULEB = BINDING_OPCODE.DO_BIND_ULEB_TIMES_SKIPPING_ULEB.value
+_BIND_THREADED = BINDING_OPCODE.THREADED.value
+
+_REBASE_DONE = REBASE_OPCODE.DONE.value
+_REBASE_SET_TYPE_IMM = REBASE_OPCODE.SET_TYPE_IMM.value
+_REBASE_SET_SEGMENT_AND_OFFSET_ULEB = REBASE_OPCODE.SET_SEGMENT_AND_OFFSET_ULEB.value
+_REBASE_ADD_ADDR_ULEB = REBASE_OPCODE.ADD_ADDR_ULEB.value
+_REBASE_ADD_ADDR_IMM_SCALED = REBASE_OPCODE.ADD_ADDR_IMM_SCALED.value
+_REBASE_DO_REBASE_IMM_TIMES = REBASE_OPCODE.DO_REBASE_IMM_TIMES.value
+_REBASE_DO_REBASE_ULEB_TIMES = REBASE_OPCODE.DO_REBASE_ULEB_TIMES.value
+_REBASE_DO_REBASE_ADD_ADDR_ULEB = REBASE_OPCODE.DO_REBASE_ADD_ADDR_ULEB.value
+_REBASE_DO_REBASE_ULEB_TIMES_SKIPPING_ULEB = REBASE_OPCODE.DO_REBASE_ULEB_TIMES_SKIPPING_ULEB.value
+
 
 class BindingTable:
     """
     The binding table contains a ton of information related to the binding info in the image
 
+    .bind_info - Compact arrays (address, ordinal, symbol index, addend, ...) of every bind in the table
+
     .lookup_table - Contains a map of address -> Symbol declarations which should be used for processing off-image
     symbol decorations
 
     .symbol_table - Contains a full list of symbols declared in the binding info. Avoid iterating through this for
     speed purposes.
 
-    .actions - contains a list of, you guessed it, actions.
+    .actions - contains a list of, you guessed it, actions. Built on first access.
 
-    .import_stack - contains a fairly raw unprocessed list of binding info commands
+    .import_stack - contains a fairly raw unprocessed list of binding info commands. Built on first access.
 
     """
 
-    def __init__(self, image: Image, table_start: int, table_size: int):
+    def __init__(self, image: Image, table_start: int, table_size: int, lazy=False):
         """
         Pass a image to be processed
 
         :param image: image to be processed
         :type image: Image
+        :param lazy: Table is lazy binding info
         """
         self.image = image
-        self.import_stack = self._load_binding_info(table_start, table_size)
-        self.actions = self._create_action_list()
+        self._segment_addresses = [segment.vm_address for segment in image.segments.values()]
+        data = image.read_bytearray(table_start, table_size) if table_size > 0 else b''
+        self._table_start = table_start
+        self.bind_info = run_bind_opcodes(data, self._segment_addresses, image.ptr_size, lazy)
         self.lookup_table = {}
         self.link_table = {}
         self.symbol_table = self._load_symbol_table()
 
+    def _libname(self, ordinal: int) -> str:
+        if ordinal <= 0:
+            return SPECIAL_DYLIB_NAMES.get(ordinal, str(ordinal))
+        try:
+            return self.image.linked_images[ordinal - 1].install_name
+        except IndexError:
+            return str(ordinal)
+
     def _load_symbol_table(self) -> List[Symbol]:
         table = []
-        for act in self.actions:
-            if act.item:
-                sym = Symbol.from_values(act.item, act.vmaddr, external=True, ordinal=act.libname)
-                table.append(sym)
-                self.lookup_table[act.vmaddr] = sym
+        info = self.bind_info
+        names = info.names
+        libnames = {}
+        for address, ordinal, sym_index in zip(info.addresses, info.ordinals, info.symbols):
+            name = names[sym_index]
+            if not name:
+                continue
+            libname = libnames.get(ordinal)
+            if libname is None:
+                # callers expect a symbol's ordinal to be int()-able, so special ordinals stay numeric here
+                libname = libnames[ordinal] = self._libname(ordinal) if ordinal > 0 else str(ordinal)
+            sym = Symbol.from_values(name, address, external=True, ordinal=libname)
+            table.append(sym)
+            self.lookup_table[address] = sym
         return table
 
-    def _create_action_list(self) -> List[action]:
-        actions = []
-        for bind_command in self.import_stack:
-            segment = list(self.image.segments.values())[bind_command.seg_index]
-            vm_address = segment.vm_address + bind_command.seg_offset
-            try:
-                lib = self.image.linked_images[bind_command.lib_ordinal - 1].install_name
-            except IndexError:
-                lib = str(bind_command.lib_ordinal)
-            item = bind_command.name
-            actions.append(action(vm_address & 0xFFFFFFFFF, lib, item))
-        return actions
-
-    def _load_binding_info(self, table_start: int, table_size: int) -> List[record]:
-        read_address = table_start
-        import_stack = []
-        threaded_stack = []
-        uses_threaded_bind = False
-        while True:
-            if read_address - table_size >= table_start:
-                break
-            seg_index = 0x0
-            seg_offset = 0x0
-            lib_ordinal = 0x0
-            btype = 0x0
-            flags = 0x0
-            name = ""
-            addend = 0x0
-            special_dylib = 0x0
-            while True:
-                # There are 0xc opcodes total
-                # Bitmask opcode byte with 0xF0 to get opcode, 0xF to get value
-                binding_opcode = self.image.read_uint(read_address, 1) & 0xF0
-                value = self.image.read_uint(read_address, 1) & 0x0F
-                log.debug_tm(f'{BINDING_OPCODE(binding_opcode).name}: {hex(value)}')
-                cmd_start_addr = read_address
-                read_address += 1
-
-                # this is a strenuous calc to be running rn, so only do it if we HAVE TO
-                if log.LOG_LEVEL == ktool.LogLevel.DEBUG_TOO_MUCH:
-                    segment = list(self.image.segments.values())[seg_index]
-                    vm_address = segment.vm_address + seg_offset
-                    log.debug_tm(f'@ {hex(cmd_start_addr)} (-> {hex(vm_address)}) op->{BINDING_OPCODE(binding_opcode).name} current->{name}')
-
-                if binding_opcode == BINDING_OPCODE.THREADED:
-                    if value == BIND_SUBOPCODE_THREADED_SET_BIND_ORDINAL_TABLE_SIZE_ULEB:
-                        a_table_size, read_address = self.image.read_uleb128(read_address)
-                        uses_threaded_bind = True
-                    elif value == BIND_SUBOPCODE_THREADED_APPLY:
-                        pass
-
-                if binding_opcode == BINDING_OPCODE.DONE:
-                    import_stack.append(
-                        record(cmd_start_addr, seg_index, seg_offset, lib_ordinal, btype, flags, name, addend,
-                               special_dylib))
-                    break
+    @property
+    def actions(self) -> List[action]:
+        info = self.bind_info
+        return [action(address, self._libname(ordinal), info.names[sym_index])
+                for address, ordinal, sym_index in zip(info.addresses, info.ordinals, info.symbols)]
+
+    @property
+    def import_stack(self) -> List[record]:
+        info = self.bind_info
+        stack = []
+        for i in range(len(info)):
+            seg_index = info.segments[i]
+            ordinal = info.ordinals[i]
+            stack.append(record(self._table_start + info.opcode_offsets[i], seg_index,
+                                info.addresses[i] - self._segment_addresses[seg_index], ordinal, info.types[i],
+                                info.flags[i], info.names[info.symbols[i]], info.addends[i], int(ordinal <= 0)))
+        return stack
+
+
+class RebaseTable:
+    """
+    Locations of every pointer the rebase info (LC_DYLD_INFO) says needs sliding.
 
-                elif binding_opcode == BINDING_OPCODE.SET_DYLIB_ORDINAL_IMM:
-                    lib_ordinal = value
-
-                elif binding_opcode == BINDING_OPCODE.SET_DYLIB_ORDINAL_ULEB:
-                    lib_ordinal, read_address = self.image.read_uleb128(read_address)
-
-                elif binding_opcode == BINDING_OPCODE.SET_DYLIB_SPECIAL_IMM:
-                    special_dylib = 0x1
-                    lib_ordinal = value
-
-                elif binding_opcode == BINDING_OPCODE.SET_SYMBOL_TRAILING_FLAGS_IMM:
-                    flags = value
-                    name = self.image.read_cstr(read_address)
-                    read_address += len(name) + 1
-
-                elif binding_opcode == BINDING_OPCODE.SET_TYPE_IMM:
-                    btype = value
-
-                elif binding_opcode == BINDING_OPCODE.SET_ADDEND_SLEB:
-                    addend, read_address = self.image.read_uleb128(read_address)
-
-                elif binding_opcode == BINDING_OPCODE.SET_SEGMENT_AND_OFFSET_ULEB:
-                    seg_index = value
-                    seg_offset, read_address = self.image.read_uleb128(read_address)
-
-                elif binding_opcode == BINDING_OPCODE.ADD_ADDR_ULEB:
-                    o, read_address = self.image.read_uleb128(read_address)
-                    seg_offset += o
-
-                elif binding_opcode == BINDING_OPCODE.DO_BIND_ADD_ADDR_ULEB:
-                    import_stack.append(
-                        record(cmd_start_addr, seg_index, seg_offset, lib_ordinal, btype, flags, name, addend,
-                               special_dylib))
-                    seg_offset += self.image.ptr_size
-                    o, read_address = self.image.read_uleb128(read_address)
-                    seg_offset += o
-
-                elif binding_opcode == BINDING_OPCODE.DO_BIND_ADD_ADDR_IMM_SCALED:
-                    import_stack.append(
-                        record(cmd_start_addr, seg_index, seg_offset, lib_ordinal, btype, flags, name, addend,
-                               special_dylib))
-                    seg_offset = seg_offset + (value * self.image.ptr_size) + self.image.ptr_size
-
-                elif binding_opcode == BINDING_OPCODE.DO_BIND_ULEB_TIMES_SKIPPING_ULEB:
-                    count, read_address = self.image.read_uleb128(read_address)
-                    skip, read_address = self.image.read_uleb128(read_address)
-
-                    for i in range(0, count):
-                        import_stack.append(
-                            record(cmd_start_addr, seg_index, seg_offset, lib_ordinal, btype, flags, name, addend,
-                                   special_dylib))
-                        seg_offset += skip + self.image.ptr_size
-
-                elif binding_opcode == BINDING_OPCODE.DO_BIND:
-                    if not uses_threaded_bind:
-                        import_stack.append(
-                            record(cmd_start_addr, seg_index, seg_offset, lib_ordinal, btype, flags, name, addend,
-                                   special_dylib))
-                        seg_offset += self.image.ptr_size
-                    else:
-                        threaded_stack.append(
-                            record(cmd_start_addr, seg_index, seg_offset, lib_ordinal, btype, flags, name, addend,
-                                   special_dylib))
-                        seg_offset += self.image.ptr_size
+    .addresses - VM addresses of each rebased pointer, in opcode order
 
-        return import_stack
+    .types - REBASE_TYPE of each
+    """
+
+    @classmethod
+    def from_image(cls, image: Image, table_start: int, table_size: int) -> 'RebaseTable':
+        segment_addresses = [segment.vm_address for segment in image.segments.values()]
+        data = image.read_bytearray(table_start, table_size) if table_size > 0 else b''
+        return cls(*run_rebase_opcodes(data, segment_addresses, image.ptr_size))
+
+    def __init__(self, addresses, types):
+        self.addresses = addresses
+        self.types = types
+        self._lookup = None
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def __contains__(self, address: int) -> bool:
+        if self._lookup is None:
+            self._lookup = set(self.addresses)
+        return address in self._lookup
@@ -15,6 +15,7 @@
 import os
 from enum import Enum
 from io import BytesIO
+from collections import namedtuple
 from typing import Tuple, Dict, Union, BinaryIO, List
 
 from ktool_macho import *
@@ -28,11 +29,72 @@ from ktool.util import ignore
 mmap = None
 
 
+patch_range = namedtuple('patch_range', ['offset', 'size'])
+
+
 class MachOFileType(Enum):
     FAT = 0
     THIN = 1
 
 
+def _bulk_write(buffer, size, writes: List[Tuple[int, bytes]]):
+    # Works for both bytearray and mmap storage; slice assignment copies the whole run in one go instead of
+    #   a python-level loop per byte.
+    for location, data in writes:
+        if location < 0 or location + len(data) > size:
+            raise IndexError(f'Write of {hex(len(data))} bytes at {hex(location)} runs outside of file (size {hex(size)})')
+    with memoryview(buffer) as view:
+        for location, data in writes:
+            view[location:location + len(data)] = data
+
+
+_WRITE_CHUNK_SIZE = 0x1000000
+
+
+def _write_region(buffer, fp, location, count):
+    with memoryview(buffer) as view:
+        for chunk_start in range(location, location + count, _WRITE_CHUNK_SIZE):
+            with view[chunk_start:min(chunk_start + _WRITE_CHUNK_SIZE, location + count)] as chunk:
+                fp.write(chunk)
+
+
+def _copy_file_region(source_fp, location, count, fp) -> int:
+    """
+    Copy a region of one file into another at fp's current position, kernel-side where the platform allows it
+        (copy_file_range, or sendfile on platforms that support file to file sendfile).
+
+    :return: Bytes copied. This can be short (0 if neither file has a real descriptor or the platform can't do it);
+        the caller is expected to copy whatever's left itself.
+    """
+    try:
+        source_fd = source_fp.fileno()
+        fp.flush()
+        dest_fd = fp.fileno()
+        dest_offset = fp.tell()
+    except (AttributeError, OSError, ValueError):
+        return 0
+
+    copied = 0
+    try:
+        while copied < count:
+            if hasattr(os, 'copy_file_range'):
+                sent = os.copy_file_range(source_fd, dest_fd, count - copied, location + copied, dest_offset + copied)
+            elif hasattr(os, 'sendfile'):
+                os.lseek(dest_fd, dest_offset + copied, os.SEEK_SET)
+                sent = os.sendfile(dest_fd, source_fd, location + copied, count - copied)
+            else:
+                break
+            if sent == 0:
+                break
+            copied += sent
+    except OSError:
+        # e.g. EXDEV on older kernels, ENOTSOCK from macOS sendfile; fall back to copying through userspace
+        pass
+
+    fp.seek(dest_offset + copied)
+    return copied
+
+
 class BackingFile:
     def __init__(self, fp: Union[BinaryIO, BytesIO], use_mmaped_io=False):
         self.fp = fp
@@ -63,47 +125,158 @@ class BackingFile:
             assert len(self.file) > 0
             self.size = len(self.file)
 
+        # Whether our copy differs from the file on disk, i.e. whether write_to() can copy straight from fp
+        self.modified = False
+
     def read_bytes(self, location, count):
         return bytes(self.file[location:location + count])
 
     def read_int(self, location, count, endian="big"):
         return int.from_bytes(self.read_bytes(location, count), endian)
 
-    def write(self, location, data: bytes):
-        data = bytearray(data)
+    def view(self, location, count) -> memoryview:
+        """
+        Zero-copy view of a region of the file. Release it (or use it as a context manager) once done with it.
 
-        if isinstance(self.file, bytearray):
-            count = len(data)
-            for i in range(count):
-                self.file[location + i] = data[i]
+        :param location: Start of the region
+        :param count: Size of the region
+        """
+        return memoryview(self.file)[location:location + count]
 
-        else:
-            # noinspection PyUnresolvedReferences
-            assert isinstance(self.file, mmap.mmap)
-            self.file.seek(location)
-            self.file.write(data)
-            self.file.seek(0)
+    def find(self, pattern: bytes, start: int = 0, end: int = None) -> int:
+        return self.file.find(pattern, start, self.size if end is None else end)
+
+    def write(self, location, data: bytes):
+        _bulk_write(self.file, self.size, [(location, data)])
+        self.modified = True
+
+    def write_many(self, writes: List[Tuple[int, bytes]]):
+        """
+        Apply several writes at once. Every write is bounds checked before any of them are applied.
+
+        :param writes: List of (location, data)
+        """
+        _bulk_write(self.file, self.size, writes)
+        self.modified = True
+
+    def write_to(self, fp, location=0, count=None):
+        """
+        Write a region of this file out to fp without making an intermediate copy of it
+
+        If nothing has been written to this file, the region is copied file-to-file by the kernel where possible.
+
+        :param fp: Writable file object
+        :param location: Start of the region
+        :param count: Size of the region, defaults to the rest of the file
+        """
+        if count is None:
+            count = self.size - location
+        copied = 0 if self.modified else _copy_file_region(self.fp, location, count, fp)
+        if copied < count:
+            _write_region(self.file, fp, location + copied, count - copied)
 
     def close(self):
         self.fp.close()
 
 
+class FileWindow:
+    """
+    Read-only, buffer-like view of a region of a backing file.
+
+    Supports what Slice needs from a buffer (indexing, slicing and find()), without copying the region.
+    """
+
+    def __init__(self, backing_file: Union[BackingFile, 'SlicedBackingFile'], offset, size):
+        self.backing_file = backing_file
+        self.offset = offset
+        self.size = size
+        # mmap / bytearray of the whole file, where there is one to index into directly
+        self._buffer = backing_file.file if isinstance(backing_file, BackingFile) else None
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, _ = item.indices(self.size)
+            return self.backing_file.read_bytes(self.offset + start, max(0, stop - start))
+        if item < 0:
+            item += self.size
+        if not 0 <= item < self.size:
+            raise IndexError(f'{hex(item)} is outside of the window (size {hex(self.size)})')
+        if self._buffer is not None:
+            return self._buffer[self.offset + item]
+        return self.backing_file.read_bytes(self.offset + item, 1)[0]
+
+    def __bytes__(self):
+        return self.backing_file.read_bytes(self.offset, self.size)
+
+    def find(self, pattern: bytes, start: int = 0, end: int = None) -> int:
+        end = self.size if end is None else min(end, self.size)
+        if self._buffer is None:
+            found = self[start:end].find(pattern)
+            return found + start if found != -1 else -1
+        found = self._buffer.find(pattern, self.offset + start, self.offset + end)
+        return found - self.offset if found != -1 else -1
+
+
 class SlicedBackingFile:
     def __init__(self, backing_file: BackingFile, offset, size):
-        self.file = bytearray(backing_file.read_bytes(offset, size))
+        self.backing_file = backing_file
+        self.offset = offset
         self.size = size
         self.name = backing_file.name
+        self._file = None
+        self._window = FileWindow(backing_file, offset, size)
+
+    @property
+    def file(self) -> Union[bytearray, FileWindow]:
+        # The slice only gets its own copy of its bytes once something writes to them; until then this is a window
+        #   onto the backing file, so slices that are only read from (or never looked at) never get copied.
+        if self._file is None:
+            return self._window
+        return self._file
+
+    def _writable(self) -> bytearray:
+        if self._file is None:
+            self._file = bytearray(self.backing_file.read_bytes(self.offset, self.size))
+        return self._file
 
     def read_bytes(self, location, count):
-        return bytes(self.file[location:location + count])
+        if self._file is None:
+            count = max(0, min(count, self.size - location))
+            return self.backing_file.read_bytes(self.offset + location, count)
+        return bytes(self._file[location:location + count])
 
     def read_int(self, location, count, endian="big"):
         return int.from_bytes(self.read_bytes(location, count), endian)
 
+    def view(self, location, count) -> memoryview:
+        count = max(0, min(count, self.size - location))
+        if self._file is None:
+            return self.backing_file.view(self.offset + location, count)
+        return memoryview(self._file)[location:location + count]
+
+    def find(self, pattern: bytes, start: int = 0, end: int = None) -> int:
+        end = self.size if end is None else min(end, self.size)
+        if self._file is None:
+            found = self.backing_file.find(pattern, self.offset + start, self.offset + end)
+            return found - self.offset if found != -1 else -1
+        return self._file.find(pattern, start, end)
+
     def write(self, location, data: bytes):
-        count = len(data)
-        for i in range(count):
-            self.file[location + i] = data[i]
+        _bulk_write(self._writable(), self.size, [(location, data)])
+
+    def write_many(self, writes: List[Tuple[int, bytes]]):
+        _bulk_write(self._writable(), self.size, writes)
+
+    def write_to(self, fp, location=0, count=None):
+        if count is None:
+            count = self.size - location
+        if self._file is None:
+            self.backing_file.write_to(fp, self.offset + location, count)
+        else:
+            _write_region(self._file, fp, location, count)
 
 
 class MachOFile:
@@ -222,9 +395,12 @@ class Segment:
     def __str__(self):
         return f'Segment {self.name} at {hex(self.vm_address)}\n'
 
-    def serialize(self):
-        segment = {'command': self.cmd.serialize(), 'name': self.name, 'vm_address': self.vm_address,
+    def _serialize_info(self):
+        return {'command': self.cmd.serialize(), 'name': self.name, 'vm_address': self.vm_address,
             'file_address': self.file_address, 'size': self.size, 'type': self.type.name, }
+
+    def serialize(self):
+        segment = self._serialize_info()
         sects = {}
         for section_name, sect in self.sections.items():
             sects[section_name] = sect.serialize()
@@ -273,10 +449,58 @@ class Slice:
 
         self._cstring_cache = {}
 
+        # Ranges written by patch() that images loaded from this slice haven't re-synced yet
+        self.patches: List[patch_range] = []
+
     def patch(self, address: int, raw: bytes):
         log.debug_tm(f'Wrote {str(raw)} @ {address}')
         self.file.write(address, raw)
         assert self.file.read_bytes(address, len(raw)) == raw
+        self.patches.append(patch_range(address, len(raw)))
+        self._invalidate_cstrings(address, address + len(raw))
+
+    def patch_many(self, patches: List[Tuple[int, bytes]]):
+        """
+        Apply several patches in one batch.
+
+        :param patches: List of (address, raw)
+        """
+        patches = list(patches)
+        self.file.write_many(patches)
+        for address, raw in patches:
+            log.debug_tm(f'Wrote {str(raw)} @ {address}')
+            self.patches.append(patch_range(address, len(raw)))
+            self._invalidate_cstrings(address, address + len(raw))
+
+    def write_to(self, fp):
+        """
+        Write this slice's (possibly patched) bytes to fp, without building a copy of the whole slice in memory first
+
+        :param fp: Writable file object
+        """
+        self.file.write_to(fp, 0, self.size)
+
+    def take_patches(self) -> List[patch_range]:
+        """
+        Get every range patched since the last call, with overlapping/adjacent ranges merged, and reset the list.
+
+        :return: Sorted list of patch_range
+        """
+        merged = []
+        for offset, size in sorted(self.patches):
+            if merged and offset <= merged[-1].offset + merged[-1].size:
+                last = merged[-1]
+                merged[-1] = patch_range(last.offset, max(last.size, offset + size - last.offset))
+            else:
+                merged.append(patch_range(offset, size))
+        self.patches = []
+        return merged
+
+    def _invalidate_cstrings(self, start: int, end: int):
+        # A cached string starting before the patch can still run into it, so check the whole string, not just its start
+        for addr in [addr for addr, text in self._cstring_cache.items()
+                     if addr < end and addr + len(text.encode('utf-8', errors='surrogateescape')) + 1 > start]:
+            del self._cstring_cache[addr]
 
     def full_bytes_for_slice(self):
         return bytes(self.file.read_bytes(0, self.file.size))
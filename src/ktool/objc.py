@@ -26,9 +26,10 @@
 #
 from collections import namedtuple
 from enum import Enum
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterator, Tuple
 
 from ktool_macho.base import Constructable
+from ktool_swift.demangle import demangle
 from ktool.loader import Image
 from ktool.exceptions import VMAddressingError
 from ktool.structs import *
@@ -109,7 +110,7 @@ class ObjCImage(Constructable):
             for i in range(0, cnt):
                 ptr = sect.vm_address + i * image.ptr_size
                 if objc_image.vm_check(ptr):
-                    loc = image.read_ptr(ptr)
+                    loc = image.read_ptr(ptr, vm=True)
                     try:
                         proto = image.read_struct(loc, objc2_prot, vm=True)
                         item = QueueItem()
@@ -173,11 +174,58 @@ class ObjCImage(Constructable):
         self.cat_map: Dict[int, 'Category'] = {}
         self.prot_map: Dict[int, 'Protocol'] = {}
 
+        self._classes_by_name: Optional[Dict[str, 'Class']] = None
+        self._protos_by_name: Optional[Dict[str, 'Protocol']] = None
+        self._swift_classes_by_name: Optional[Dict[str, Tuple[str, 'Class']]] = None
+
+    @property
+    def classes_by_name(self) -> Dict[str, 'Class']:
+        """
+        Classes in this image by name. Built on first use, so populate classlist before reading this.
+        """
+        if self._classes_by_name is None:
+            # Iterating in reverse lets the first class with a given name win, as a scan of classlist would
+            self._classes_by_name = {objc_class.name: objc_class for objc_class in reversed(self.classlist)}
+        return self._classes_by_name
+
+    @property
+    def protos_by_name(self) -> Dict[str, 'Protocol']:
+        """
+        Protocols in this image by name. Built on first use, so populate protolist before reading this.
+        """
+        if self._protos_by_name is None:
+            self._protos_by_name = {objc_proto.name: objc_proto for objc_proto in reversed(self.protolist)}
+        return self._protos_by_name
+
+    @property
+    def swift_classes_by_name(self) -> Dict[str, Tuple[str, 'Class']]:
+        """
+        (module, class) for the classes in this image by demangled (Swift) type name, so each class name is only
+            demangled once. Built on first use, so populate classlist before reading this.
+        """
+        if self._swift_classes_by_name is None:
+            self._swift_classes_by_name = {}
+            for objc_class in reversed(self.classlist):
+                module, type_name = demangle(objc_class.name)
+                self._swift_classes_by_name[type_name] = (module, objc_class)
+        return self._swift_classes_by_name
+
     def serialize(self):
         return {'classes': [cls.serialize() for cls in self.classlist],
             'categories': [cat.serialize() for cat in self.catlist],
             'protocols': [prot.serialize() for prot in self.protolist]}
 
+    def serialize_records(self) -> Iterator[Tuple[str, dict]]:
+        """
+        Serialize as a flat stream of ('class' | 'category' | 'protocol', record) pairs. See Image.serialize_records
+        """
+        for cls in self.classlist:
+            yield 'class', cls.serialize()
+        for cat in self.catlist:
+            yield 'category', cat.serialize()
+        for prot in self.protolist:
+            yield 'protocol', prot.serialize()
+
     def vm_check(self, address):
         return self.image.vm.vm_check(address)
 
@@ -467,7 +515,6 @@ class MethodList:
     CUSTOM_RMS_BASE = None
 
     def __init__(self, image: ObjCImage, methlist_head, base_meths, class_meta, class_name):
-        base_meths = base_meths & 0xFFFFFFFFF
         log.info(f'Opening method list ({str(methlist_head)}) at {hex(base_meths)}')
         self.objc_image = image
         self.methlist_head = methlist_head
@@ -500,9 +547,9 @@ class MethodList:
                 imp = self.objc_image.read_uint(ea + 8, 4, vm=False)
                 imp = usi32_to_si32(imp)
             else:
-                sel = self.objc_image.read_ptr(ea, vm=False)
-                types = self.objc_image.read_ptr(ea + self.objc_image.image.ptr_size, vm=False)
-                imp = self.objc_image.read_ptr(ea + self.objc_image.image.ptr_size * 2, vm=False)
+                sel = self.objc_image.read_ptr(vm_ea, vm=True)
+                types = self.objc_image.read_ptr(vm_ea + self.objc_image.image.ptr_size, vm=True)
+                imp = self.objc_image.read_ptr(vm_ea + self.objc_image.image.ptr_size * 2, vm=True)
 
             try:
                 method = Method.from_image(self.objc_image, sel, types, imp, self.meta, vm_ea, uses_relative_methods,
@@ -665,22 +712,13 @@ class Class(Constructable):
 
         load_errors = []
         struct_list = []
-        # FIXME REBASE OPCODES PLEASEEE
-        class_ptr = class_ptr & 0xFFFFFFFFF
 
         if not meta:
             log.debug_more(f'Loading Class From {hex(class_ptr)}')
         else:
             log.debug_more(f'Loading metaclass From {hex(class_ptr)}')
         if not class_ptr_is_direct:
-            if not objc_image.vm_check(class_ptr):
-                # k this just looks wrong, like this isn't how it works, something is WEIRD here
-                # maybe this is like me horribly misunderstanding chainedfixup rebase opcodes at the time
-                # and it works by some stroke of horrible luck??
-                # TODO RANCID HORRIBLE FIX THIS IMPLEMENT REBASE OPCODES
-                objc2_class_location = objc_image.read_ptr(class_ptr, vm=False)
-            else:
-                objc2_class_location = objc_image.read_ptr(class_ptr, vm=True)
+            objc2_class_location = objc_image.read_ptr(class_ptr, vm=True)
         else:
             objc2_class_location = class_ptr
 
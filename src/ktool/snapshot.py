@@ -0,0 +1,638 @@
+#
+#  ktool | ktool
+#  snapshot.py
+#
+#  Snapshots of a loaded Image's processed tables, which can be restored without reparsing.
+#
+#  A snapshot is a flat little-endian binary layout:
+#
+#       header:     magic 'KTSNAPSH' | u32 version | u32 table count
+#       directory:  (4s tag | u32 count | u64 offset | u64 size) * table count
+#       tables:     8 byte aligned
+#
+#  Symbol-ish tables (symtab, imports, exports, export trie nodes) are stored column-wise
+#       (u64 address[n] | i64 ordinal[n] | u32 name[n] | u32 flags[n]), names being indexes into a shared string table,
+#       so a restored image can read them straight out of the (possibly mmaped) snapshot buffer,
+#       and only create Symbol objects for the entries that are actually looked at.
+#
+#  The BindInfo of each binding table is stored the same way, widest columns first:
+#       (u64 address[n] | i64 ordinal[n] | i64 addend[n] | u64 threaded_start[s] | i64 threaded_ordinal[t] |
+#        u32 symbol[n] | u32 opcode_offset[n] | u32 threaded_symbol[t] | u32 name[m] | u8 type[n] | u8 flags[n] |
+#        u8 segment[n])
+#
+#  This file is part of ktool. ktool is free software that
+#  is made available under the MIT license. Consult the
+#  file "LICENSE" that is distributed together with this file
+#  for the exact licensing terms.
+#
+#  Copyright (c) 0cyn 2022.
+#
+
+import hashlib
+import mmap
+import struct
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+from typing import Dict, List, Union
+
+from ktool_macho import LOAD_COMMAND
+from ktool_macho.base import Constructable
+from ktool.exceptions import InvalidSnapshotException
+from ktool.image import Image
+from ktool.loader import MachOImageLoader, Symbol, ChainedFixups, ExportTrie, RebaseTable, BindingTable, BindInfo, \
+    export_node
+from ktool.macho import Slice
+from lib0cyn.kmsgpack import packb, unpackb
+from lib0cyn.log import log
+
+SNAPSHOT_MAGIC = b'KTSNAPSH'
+SNAPSHOT_VERSION = 3
+
+_HEADER = struct.Struct('<8sII')
+_DIRECTORY_ENTRY = struct.Struct('<4sIQQ')
+_SEGMENT_RECORD = struct.Struct('<16sQQQI4x')
+_SECTION_RECORD = struct.Struct('<16s16sQQQ')
+
+# Symbol flags
+_SYM_EXTERNAL = 1 << 0
+_SYM_ORDINAL_IS_STR = 1 << 1
+_SYM_TYPE_SHIFT = 8
+_SYM_TYPES = ['N_UNDF', 'N_ABS', 'N_SECT', 'N_PBUD', 'N_INDR']
+_SYM_ATTR_SHIFT = 16
+_SYM_ATTRS = [None, '', 'Weak', 'Lazy']
+
+_NEEDS_BYTESWAP = sys.byteorder != 'little'
+
+
+def _column(buffer, offset: int, count: int, typecode: str):
+    """
+    Get a read-only, indexable view of `count` items of `typecode` starting at `offset`.
+
+    On little endian hosts (all of the ones we care about) this is a view of the underlying buffer, no copying.
+    """
+    size = array(typecode).itemsize
+    view = memoryview(buffer)[offset:offset + size * count]
+    if _NEEDS_BYTESWAP:
+        col = array(typecode)
+        col.frombytes(view)
+        col.byteswap()
+        return col
+    return view.cast(typecode)
+
+
+class _StringTable:
+    def __init__(self, buffer, offsets_offset: int, count: int, data_offset: int):
+        self.buffer = buffer
+        self.offsets = _column(buffer, offsets_offset, count + 1, 'I')
+        self.data_offset = data_offset
+        self.cache: Dict[int, str] = {}
+
+    def __getitem__(self, index: int) -> str:
+        if index in self.cache:
+            return self.cache[index]
+        start = self.data_offset + self.offsets[index]
+        end = self.data_offset + self.offsets[index + 1]
+        string = bytes(self.buffer[start:end]).decode('utf-8', errors='surrogateescape')
+        self.cache[index] = string
+        return string
+
+
+class _SymbolColumns:
+    def __init__(self, buffer, offset: int, count: int, strings: _StringTable):
+        self.count = count
+        self.address = _column(buffer, offset, count, 'Q')
+        self.ordinal = _column(buffer, offset + 8 * count, count, 'q')
+        self.name = _column(buffer, offset + 16 * count, count, 'I')
+        self.flags = _column(buffer, offset + 20 * count, count, 'I')
+        self.strings = strings
+        self.cache: Dict[int, Symbol] = {}
+
+    def symbol(self, index: int) -> Symbol:
+        if index in self.cache:
+            return self.cache[index]
+
+        flags = self.flags[index]
+        ordinal = self.ordinal[index]
+        if flags & _SYM_ORDINAL_IS_STR:
+            ordinal = self.strings[ordinal]
+
+        sym = Symbol.from_values(self.strings[self.name[index]], self.address[index],
+                                 external=bool(flags & _SYM_EXTERNAL), ordinal=ordinal)
+        for bit, name in enumerate(_SYM_TYPES):
+            if flags & (1 << (_SYM_TYPE_SHIFT + bit)):
+                sym.types.append(name)
+        sym.attr = _SYM_ATTRS[(flags >> _SYM_ATTR_SHIFT) & 0x3]
+
+        self.cache[index] = sym
+        return sym
+
+
+class SnapshotSymbolList(Sequence):
+    """
+    List of Symbols backed by a snapshot's columns. Symbols are created the first time they're accessed.
+    """
+
+    def __init__(self, columns: _SymbolColumns, start: int = 0, stop: int = None):
+        self.columns = columns
+        self.start = start
+        self.stop = columns.count if stop is None else stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('symbol index out of range')
+        return self.columns.symbol(self.start + index)
+
+    def addresses(self):
+        return self.columns.address[self.start:self.stop]
+
+
+class SnapshotSymbolMap(Mapping):
+    """
+    address -> Symbol map over a SnapshotSymbolList.
+
+    The address index is only built the first time it's needed, and as with the dicts built by the loader,
+    the last symbol at a given address wins.
+    """
+
+    def __init__(self, symbols: SnapshotSymbolList):
+        self.symbols = symbols
+        self._index = None
+
+    @property
+    def index(self) -> Dict[int, int]:
+        if self._index is None:
+            self._index = dict(zip(self.symbols.addresses(), range(len(self.symbols))))
+        return self._index
+
+    def __getitem__(self, address):
+        return self.symbols[self.index[address]]
+
+    def __contains__(self, address):
+        return address in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+
+class SnapshotIntMap(Mapping):
+    """
+    int -> int map (chained fixup rebases) over two snapshot columns.
+    """
+
+    def __init__(self, keys, values):
+        self.keys_col = keys
+        self.values_col = values
+        self._index = None
+
+    @property
+    def index(self) -> Dict[int, int]:
+        if self._index is None:
+            self._index = dict(zip(self.keys_col, self.values_col))
+        return self._index
+
+    def items(self):
+        if self._index is None:
+            return zip(self.keys_col, self.values_col)
+        return self._index.items()
+
+    def __getitem__(self, key):
+        return self.index[key]
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.keys_col)
+
+
+class _RestoredSymbolTable:
+    def __init__(self, table: SnapshotSymbolList):
+        self.table = table
+
+    @property
+    def ext(self) -> List[Symbol]:
+        return [sym for sym in self.table if sym.external]
+
+
+class _RestoredBindingTable(BindingTable):
+    """
+    BindingTable whose symbols are read out of a snapshot, and whose BindInfo is only rebuilt from it when it's used
+        (by .actions, .import_stack, or directly).
+    """
+
+    # noinspection PyMissingConstructor
+    def __init__(self, image: Image, symbol_table: SnapshotSymbolList, snapshot: 'ImageSnapshot', tag: bytes,
+                 counts: List[int]):
+        self.image = image
+        self._segment_addresses = [segment.vm_address for segment in image.segments.values()]
+        self._table_start = counts[0]
+        self.symbol_table = symbol_table
+        self.lookup_table = SnapshotSymbolMap(symbol_table)
+        self.link_table = {}
+
+        self._snapshot = snapshot
+        self._tag = tag
+        self._counts = counts
+        self._bind_info = None
+
+    @property
+    def bind_info(self) -> BindInfo:
+        if self._bind_info is None:
+            self._bind_info = self._snapshot.bind_info(self._tag, self._counts)
+        return self._bind_info
+
+
+class _RestoredExportTrie:
+    def __init__(self, symbols: SnapshotSymbolList, node_columns: _SymbolColumns, image: Image, start, size):
+        self.symbols = symbols
+        self._node_columns = node_columns
+        self._image = image
+        self._start = start
+        self._size = size
+
+    @property
+    def nodes(self) -> List[export_node]:
+        cols = self._node_columns
+        return [export_node(cols.strings[cols.name[i]], cols.address[i], cols.flags[i]) for i in range(cols.count)]
+
+    @property
+    def raw(self):
+        return self._image.read_bytearray(self._start, self._size)
+
+    def raw_bytes(self):
+        return self.raw
+
+    def lookup(self, name: str) -> Union[export_node, None]:
+        return ExportTrie.find(self.raw, name)
+
+
+class ImageSnapshot(Constructable):
+    """
+    A snapshot of an Image's processed tables.
+
+    Take one with ImageSnapshot.from_image(image) (or image.snapshot()), save .raw wherever,
+        and later ImageSnapshot(raw).restore(macho_slice) (or Image.restore()) to get an equivalent Image back
+        without reparsing the symbol table, binding info, export trie, function starts, or chained fixups.
+
+    The snapshot is tied to the file it was taken from; restoring against a slice with a different header or
+        __LINKEDIT raises InvalidSnapshotException. Patches anywhere else (e.g. to chained fixup pointers in __DATA)
+        are not detected.
+    """
+
+    @classmethod
+    def from_image(cls, image: Image) -> 'ImageSnapshot':
+        writer = _SnapshotWriter()
+
+        meta = {
+            'fingerprint': ImageSnapshot.fingerprint(image),
+            'misaligned_vm': image.vm.__class__.__name__ == 'MisalignedVM',
+            'has_symtab': image.symbol_table is not None,
+            'has_binding_tables': image.binding_table is not None,
+            'has_export_trie': image.export_trie is not None,
+            'has_chained_fixups': image.chained_fixups is not None,
+            'has_rebase_table': image.rebase_table is not None,
+        }
+
+        if image.export_trie is not None:
+            meta['export_trie_range'] = [0, 0]
+            for cmd in image.macho_header.load_commands:
+                if cmd.cmd == LOAD_COMMAND.DYLD_INFO_ONLY.value:
+                    meta['export_trie_range'] = [cmd.export_off, cmd.export_size]
+                elif cmd.cmd == LOAD_COMMAND.LC_DYLD_EXPORTS_TRIE.value:
+                    meta['export_trie_range'] = [cmd.dataoff, cmd.datasize]
+
+        segments = bytearray()
+        sections = bytearray()
+        for seg_name, seg in image.segments.items():
+            segments += _SEGMENT_RECORD.pack(seg_name.encode('utf-8')[:16], seg.vm_address, seg.file_address,
+                                             seg.size, len(seg.sections))
+            for sect_name, sect in seg.sections.items():
+                sections += _SECTION_RECORD.pack(seg_name.encode('utf-8')[:16], sect_name.encode('utf-8')[:16],
+                                                 sect.vm_address, sect.file_address, sect.size)
+        writer.add(b'SEGS', len(image.segments), segments)
+        writer.add(b'SECT', len(sections) // _SECTION_RECORD.size, sections)
+
+        if image.symbol_table is not None:
+            writer.add_symbols(b'SYMS', image.symbol_table.table)
+        writer.add_symbols(b'EXPS', image.exports)
+
+        if image.export_trie is not None:
+            nodes = image.export_trie.nodes
+            writer.add_columns(b'EXPN', [n.offset for n in nodes], [0] * len(nodes),
+                               [writer.string(n.text) for n in nodes], [n.flags for n in nodes])
+
+        # imports are stored in load order; keep track of where each source table's run starts and stops so
+        #   the individual binding tables can be recreated as views over them.
+        import_counts = [0, 0, 0, 0]
+        if image.binding_table is not None:
+            import_counts[0] = len(image.binding_table.symbol_table)
+            import_counts[1] = len(image.weak_binding_table.symbol_table)
+            import_counts[2] = len(image.lazy_binding_table.symbol_table)
+        if image.chained_fixups is not None:
+            import_counts[3] = len(image.chained_fixups.symbols)
+        meta['import_counts'] = import_counts
+        writer.add_symbols(b'IMPS', image.imports)
+
+        if image.binding_table is not None:
+            meta['bind_info_counts'] = []
+            for tag, table in [(b'BND0', image.binding_table), (b'BND1', image.weak_binding_table),
+                               (b'BND2', image.lazy_binding_table)]:
+                # noinspection PyProtectedMember
+                meta['bind_info_counts'].append(writer.add_bind_info(tag, table.bind_info, table._table_start))
+
+        writer.add(b'FSTR', len(image.function_starts), array('Q', image.function_starts))
+
+        if image.chained_fixups is not None:
+            rebases = image.chained_fixups.rebases
+            writer.add(b'RBAS', len(rebases), array('Q', rebases.keys()).tobytes() +
+                       array('Q', rebases.values()).tobytes())
+
+        if image.rebase_table is not None:
+            writer.add(b'RBOP', len(image.rebase_table), array('Q', image.rebase_table.addresses).tobytes() +
+                       array('B', image.rebase_table.types).tobytes())
+
+        writer.add(b'META', 1, packb(meta))
+
+        return cls(writer.finish())
+
+    @classmethod
+    def from_values(cls, raw) -> 'ImageSnapshot':
+        return cls(raw)
+
+    @classmethod
+    def from_file(cls, filename: str) -> 'ImageSnapshot':
+        """
+        Open a snapshot saved to disk. The file is mmaped, nothing is read until it's used.
+        """
+        with open(filename, 'rb') as fp:
+            return cls(mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def raw_bytes(self):
+        return bytes(self.raw)
+
+    @staticmethod
+    def fingerprint(image: Image) -> str:
+        """
+        Hash the parts of an image's slice a snapshot depends on; the mach header + load commands, and __LINKEDIT.
+        """
+        digest = hashlib.sha1(image.macho_header.raw)
+        linkedit = image.segments.get('__LINKEDIT', None)
+        if linkedit:
+            end = min(linkedit.file_address + linkedit.cmd.filesize, image.slice.size)
+            digest.update(image.slice.read_bytearray(linkedit.file_address, end - linkedit.file_address))
+        return digest.hexdigest() + f':{hex(image.slice.size)}'
+
+    def __init__(self, raw: Union[bytes, bytearray, memoryview, mmap.mmap]):
+        self.raw = raw
+
+        if len(raw) < _HEADER.size:
+            raise InvalidSnapshotException('Snapshot is truncated')
+        magic, version, table_count = _HEADER.unpack_from(raw, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise InvalidSnapshotException('Not a ktool image snapshot')
+        if version != SNAPSHOT_VERSION:
+            raise InvalidSnapshotException(f'Snapshot version {version} is not supported (expected {SNAPSHOT_VERSION})')
+
+        self.tables = {}
+        for i in range(table_count):
+            tag, count, offset, size = _DIRECTORY_ENTRY.unpack_from(raw, _HEADER.size + i * _DIRECTORY_ENTRY.size)
+            if offset + size > len(raw):
+                raise InvalidSnapshotException(f'Snapshot table {tag} is truncated')
+            self.tables[tag] = (count, offset, size)
+
+        self.meta = unpackb(self._table_view(b'META'))
+
+        count, offset, _ = self.tables[b'STRO']
+        self.strings = _StringTable(raw, offset, count, self.tables[b'STRD'][1])
+
+    def _table_view(self, tag):
+        _, offset, size = self.tables[tag]
+        return memoryview(self.raw)[offset:offset + size]
+
+    def _symbols(self, tag) -> Union[SnapshotSymbolList, None]:
+        if tag not in self.tables:
+            return None
+        count, offset, _ = self.tables[tag]
+        return SnapshotSymbolList(_SymbolColumns(self.raw, offset, count, self.strings))
+
+    def bind_info(self, tag: bytes, counts: List[int]) -> BindInfo:
+        """
+        Rebuild the BindInfo of a binding table. Its arrays are views of the snapshot buffer.
+
+        :param tag: Table the BindInfo was stored in
+        :param counts: (table start, names, threaded symbols, threaded starts) as _SnapshotWriter.add_bind_info()
+            returned them
+        :return: BindInfo
+        """
+        count, offset, _ = self.tables[tag]
+        _, name_count, threaded_count, start_count = counts
+        info = BindInfo()
+        columns = [('addresses', 'Q', count), ('ordinals', 'q', count), ('addends', 'q', count),
+                   ('threaded_starts', 'Q', start_count), ('threaded_ordinals', 'q', threaded_count),
+                   ('symbols', 'I', count), ('opcode_offsets', 'I', count), ('threaded_symbols', 'I', threaded_count),
+                   ('names', 'I', name_count), ('types', 'B', count), ('flags', 'B', count),
+                   ('segments', 'B', count)]
+        for attribute, typecode, column_count in columns:
+            setattr(info, attribute, _column(self.raw, offset, column_count, typecode))
+            offset += array(typecode).itemsize * column_count
+        info.names = [self.strings[index] for index in info.names]
+        return info
+
+    @property
+    def segments(self) -> List[dict]:
+        """
+        Segment layout recorded in the snapshot, usable without a MachO on hand.
+        """
+        count, offset, _ = self.tables[b'SEGS']
+        sect_count, sect_offset, _ = self.tables[b'SECT']
+        sections = [_SECTION_RECORD.unpack_from(self.raw, sect_offset + i * _SECTION_RECORD.size)
+                    for i in range(sect_count)]
+        segments = []
+        for i in range(count):
+            name, vm_address, file_address, size, _ = _SEGMENT_RECORD.unpack_from(self.raw,
+                                                                                  offset + i * _SEGMENT_RECORD.size)
+            name = name.rstrip(b'\x00').decode('utf-8')
+            segments.append({'name': name, 'vm_address': vm_address, 'file_address': file_address, 'size': size,
+                             'sections': [{'name': s[1].rstrip(b'\x00').decode('utf-8'), 'vm_address': s[2],
+                                           'file_address': s[3], 'size': s[4]}
+                                          for s in sections if s[0].rstrip(b'\x00').decode('utf-8') == name]})
+        return segments
+
+    def restore(self, macho_slice: Slice, verify=True) -> Image:
+        """
+        Create an Image for macho_slice using the tables in this snapshot.
+
+        Only the load commands are parsed; symbol lists and tables read directly out of the snapshot buffer.
+
+        :param macho_slice: The slice the snapshot was taken from
+        :param verify: Check the slice matches the one the snapshot was taken from
+        :return: Restored Image
+        """
+        meta = self.meta
+
+        image = Image(macho_slice, meta['misaligned_vm'])
+        MachOImageLoader._parse_load_commands(image, load_symtab=False, load_imports=False, load_exports=False,
+                                              load_function_starts=False)
+
+        if verify and ImageSnapshot.fingerprint(image) != meta['fingerprint']:
+            raise InvalidSnapshotException('Snapshot was not taken from this MachO (or it has since been modified)')
+
+        return self.restore_into(image)
+
+    def restore_into(self, image: Image) -> Image:
+        """
+        Fill in the tables of an image whose load commands have already been parsed (without its tables), e.g. one
+            whose header isn't at the start of its slice.
+
+        The image isn't checked against the snapshot.
+
+        :param image: Image to restore the snapshot's tables into
+        :return: The same image
+        """
+        meta = self.meta
+
+        count, offset, _ = self.tables[b'FSTR']
+        image.function_starts = _column(self.raw, offset, count, 'Q')
+
+        if meta['has_symtab']:
+            image.symbol_table = _RestoredSymbolTable(self._symbols(b'SYMS'))
+            image.symbols = SnapshotSymbolMap(image.symbol_table.table)
+
+        image.exports = self._symbols(b'EXPS')
+        image.export_table = SnapshotSymbolMap(image.exports)
+        if meta['has_export_trie']:
+            start, size = meta.get('export_trie_range', [0, 0])
+            image.export_trie = _RestoredExportTrie(image.exports, self._symbols(b'EXPN').columns, image, start,
+                                                    size)
+
+        image.imports = self._symbols(b'IMPS')
+        image.import_table = SnapshotSymbolMap(image.imports)
+
+        bind_count, weak_count, lazy_count, chained_count = meta['import_counts']
+        cursor = 0
+        if meta['has_binding_tables']:
+            tables = []
+            for tag, count, counts in zip([b'BND0', b'BND1', b'BND2'], [bind_count, weak_count, lazy_count],
+                                          meta['bind_info_counts']):
+                tables.append(_RestoredBindingTable(image, SnapshotSymbolList(image.imports.columns, cursor,
+                                                                              cursor + count), self, tag, counts))
+                cursor += count
+            image.binding_table, image.weak_binding_table, image.lazy_binding_table = tables
+
+        if meta['has_chained_fixups']:
+            count, offset, _ = self.tables[b'RBAS']
+            rebases = SnapshotIntMap(_column(self.raw, offset, count, 'Q'),
+                                     _column(self.raw, offset + 8 * count, count, 'Q'))
+            image.chained_fixups = ChainedFixups(SnapshotSymbolList(image.imports.columns, cursor,
+                                                                    cursor + chained_count), rebases)
+            image.chained_fixups.rebase_addresses = rebases.keys_col
+            image.chained_fixups.rebase_targets = rebases.values_col
+
+        if meta.get('has_rebase_table'):
+            count, offset, _ = self.tables[b'RBOP']
+            image.rebase_table = RebaseTable(_column(self.raw, offset, count, 'Q'),
+                                             _column(self.raw, offset + 8 * count, count, 'B'))
+
+        MachOImageLoader._process_image_info(image)
+
+        log.info(f'Restored image {image.name} from snapshot')
+        return image
+
+
+class _SnapshotWriter:
+    def __init__(self):
+        self.tables = []
+        self.strings: Dict[str, int] = {}
+        self.string_data = bytearray()
+        self.string_offsets = array('I', [0])
+
+    def string(self, string: str) -> int:
+        if string in self.strings:
+            return self.strings[string]
+        index = len(self.strings)
+        self.strings[string] = index
+        self.string_data += string.encode('utf-8', errors='surrogateescape')
+        self.string_offsets.append(len(self.string_data))
+        return index
+
+    def add(self, tag: bytes, count: int, data):
+        if isinstance(data, array):
+            data = data.tobytes()
+        self.tables.append((tag, count, bytes(data)))
+
+    def add_columns(self, tag: bytes, addresses, ordinals, names, flags):
+        self.add(tag, len(addresses), array('Q', addresses).tobytes() + array('q', ordinals).tobytes() +
+                 array('I', names).tobytes() + array('I', flags).tobytes())
+
+    def add_symbols(self, tag: bytes, symbols):
+        addresses = []
+        ordinals = []
+        names = []
+        flags = []
+        for sym in symbols:
+            sym_flags = 0
+            if sym.external:
+                sym_flags |= _SYM_EXTERNAL
+            ordinal = sym.ordinal
+            if isinstance(ordinal, str):
+                sym_flags |= _SYM_ORDINAL_IS_STR
+                ordinal = self.string(ordinal)
+            for bit, name in enumerate(_SYM_TYPES):
+                if name in sym.types:
+                    sym_flags |= 1 << (_SYM_TYPE_SHIFT + bit)
+            sym_flags |= _SYM_ATTRS.index(sym.attr if sym.attr in _SYM_ATTRS else None) << _SYM_ATTR_SHIFT
+            addresses.append(sym.address)
+            ordinals.append(int(ordinal))
+            names.append(self.string(sym.fullname))
+            flags.append(sym_flags)
+        self.add_columns(tag, addresses, ordinals, names, flags)
+
+    def add_bind_info(self, tag: bytes, info: BindInfo, table_start: int) -> List[int]:
+        """
+        Add a binding table's BindInfo
+
+        :return: (table start, names, threaded symbols, threaded starts); what ImageSnapshot.bind_info() needs
+            to read it back
+        """
+        names = array('I', [self.string(name) for name in info.names])
+        data = bytearray()
+        for column, typecode in [(info.addresses, 'Q'), (info.ordinals, 'q'), (info.addends, 'q'),
+                                 (info.threaded_starts, 'Q'), (info.threaded_ordinals, 'q'), (info.symbols, 'I'),
+                                 (info.opcode_offsets, 'I'), (info.threaded_symbols, 'I'), (names, 'I'),
+                                 (info.types, 'B'), (info.flags, 'B'), (info.segments, 'B')]:
+            data += array(typecode, column).tobytes()
+        self.add(tag, len(info), data)
+        return [table_start, len(info.names), len(info.threaded_symbols), len(info.threaded_starts)]
+
+    def finish(self) -> bytearray:
+        if _NEEDS_BYTESWAP:
+            raise InvalidSnapshotException('Snapshots can only be written on little endian hosts')
+
+        self.add(b'STRO', len(self.string_offsets) - 1, self.string_offsets)
+        self.add(b'STRD', len(self.string_data), self.string_data)
+
+        out = bytearray(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(self.tables)))
+        data_start = len(out) + _DIRECTORY_ENTRY.size * len(self.tables)
+        offset = (data_start + 7) & ~7
+        directory = bytearray()
+        for tag, count, data in self.tables:
+            directory += _DIRECTORY_ENTRY.pack(tag, count, offset, len(data))
+            offset = (offset + len(data) + 7) & ~7
+        out += directory
+
+        for tag, count, data in self.tables:
+            out += b'\x00' * (((len(out) + 7) & ~7) - len(out))
+            out += data
+
+        return out
@@ -26,11 +26,9 @@
 
 from ktool_macho.base import Constructable
 from ktool_swift.structs import *
-from ktool_swift.demangle import demangle
 
 from ktool.loader import Image
 from ktool.macho import Section
-from ktool.objc import Class
 from lib0cyn.log import log
 from ktool.util import uint_to_int
 
@@ -126,13 +124,10 @@ class SwiftClass(Constructable):
         field_descriptor = _FieldDescriptor.from_image(objc_image, fd_loc)
         ivars = []
 
-        for objc_class in objc_image.classlist:
-            mangled_name = objc_class.name
-            project, classname = demangle(mangled_name)
-            if classname == name:
-                objc_backing_class: Class = objc_class
-                ivars = objc_backing_class.ivars
-                name = f'{project}.{name}'
+        if name in objc_image.swift_classes_by_name:
+            project, objc_backing_class = objc_image.swift_classes_by_name[name]
+            ivars = objc_backing_class.ivars
+            name = f'{project}.{name}'
 
         return cls(name, field_descriptor.fields, class_descriptor, field_descriptor, ivars)
 
@@ -13,11 +13,16 @@
 #
 import concurrent.futures
 import inspect
+import json
 import os
 import sys
+import tarfile
 import time
+import zipfile
 from enum import Enum
-from typing import List, Union
+from io import BytesIO
+from itertools import chain, islice
+from typing import List, Optional, Union
 import re
 import shutil
 
@@ -27,6 +32,7 @@ from ktool.exceptions import *
 import pkg_resources
 
 import lib0cyn.log as log
+from lib0cyn.kmsgpack import packb
 
 from pygments import highlight
 from pygments.formatters.terminal import TerminalFormatter
@@ -38,6 +44,12 @@ except:
     XmlLexer = None
     JsonLexer = None
 
+try:
+    import zstandard
+except ImportError:
+    # Only needed for writing .tar.zst archives
+    zstandard = None
+
 try:
     KTOOL_VERSION = pkg_resources.get_distribution('k2l').version
 except pkg_resources.DistributionNotFound:
@@ -76,6 +88,14 @@ class opts:
     DISABLE_COLOR = False
     USE_SYMTAB_INSTEAD_OF_SELECTORS = False
     OBJC_LOAD_ERRORS_SEND_TO_DEBUG = False
+    # Processes used to decode chained fixups on large images. 1 decodes in the calling process, 0 uses every core.
+    #   The CLI uses every core unless told otherwise (--fixup-jobs).
+    FIXUP_WORKERS = 1
+    # Processes used to generate header text for large images. 1 generates in the calling process, 0 uses every core.
+    #   The CLI uses every core unless told otherwise (dump --headers --jobs).
+    HEADER_WORKERS = 1
+    # Color headers with ktool's own ObjC header highlighter, which is much faster than pygments
+    BUILTIN_HEADER_HIGHLIGHTING = False
 
 
 class QueueItem:
@@ -171,10 +191,22 @@ class FileType(Enum):
     UnknownFileType = 512
 
 
+# Fat headers with more archs than this are something else (see detect_filetype)
+FAT_MAX_ARCHS = 20
+
+
 def detect_filetype(fp) -> FileType:
-    magic = fp.read(4)
+    raw_magic = fp.read(4)
+    # both the magic and cigam are in each list, so the byte order we read it in doesn't matter
+    magic = int.from_bytes(raw_magic, 'little')
     if magic in [FAT_MAGIC, FAT_CIGAM]:
-        return FileType.FatMachOFileType
+        # Java class files start with 0xcafebabe too, followed by their version (45 and up) where a fat header has
+        #   its arch count. Like file(1), only take a small arch count as a fat MachO.
+        nfat_arch = int.from_bytes(fp.read(4), 'big' if raw_magic == b'\xca\xfe\xba\xbe' else 'little')
+        fp.seek(0)
+        if nfat_arch < FAT_MAX_ARCHS:
+            return FileType.FatMachOFileType
+        return None
     elif magic in [MH_MAGIC, MH_CIGAM, MH_MAGIC_64, MH_CIGAM_64]:
         first1k = fp.read(0x1000)
         fp.seek(0)
@@ -183,7 +215,8 @@ def detect_filetype(fp) -> FileType:
         else:
             return FileType.MachOFileType
 
-    elif magic == b'dyld':
+    fp.seek(0)
+    if raw_magic == b'dyld':
         return FileType.SharedCacheFileType
 
 
@@ -231,6 +264,153 @@ class TapiYAMLWriter:
         return text
 
 
+class JSONLinesRecordWriter:
+    """
+    Writes (record type, record) pairs (see Image.serialize_records) as one json object per line.
+
+    Each line is {"record": type, <context>..., "data": record}, where context is whatever keyword args
+        (e.g. slice=0) were passed to write()
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+
+    def write(self, record_type: str, record: dict, **context):
+        line = {'record': record_type}
+        line.update(context)
+        line['data'] = record
+        self.fp.write(json.dumps(line) + '\n')
+
+
+class MsgPackRecordWriter(JSONLinesRecordWriter):
+    """
+    Same records as JSONLinesRecordWriter, written as a stream of concatenated msgpack maps.
+
+    fp must be opened in binary mode.
+    """
+
+    def write(self, record_type: str, record: dict, **context):
+        line = {'record': record_type}
+        line.update(context)
+        line['data'] = record
+        self.fp.write(packb(line))
+
+
+ARCHIVE_EXTENSIONS = ['.tar.zst', '.tar.gz', '.tar', '.zip']
+
+
+def archive_format(path: str) -> Optional[str]:
+    """
+    The ARCHIVE_EXTENSIONS entry path ends with, or None if it isn't an archive path
+    """
+    for extension in ARCHIVE_EXTENSIONS:
+        if path.lower().endswith(extension):
+            return extension
+    return None
+
+
+class ArchiveWriter:
+    """
+    Streams files into a single .zip, .tar, .tar.gz or .tar.zst archive as they're added, rather than writing them
+        out to a directory first. .tar.zst needs the zstandard package.
+
+    Use as a context manager; if the block raises, the partly written archive is removed.
+    """
+
+    def __init__(self, path: str):
+        ArchiveWriter.check_supported(path)
+        self.path = path
+        self.format = archive_format(path)
+        self.mtime = int(time.time())
+
+        self._fp = open(path, 'wb')
+        self._zip = None
+        self._tar = None
+        self._zstd = None
+
+        if self.format == '.zip':
+            self._zip = zipfile.ZipFile(self._fp, 'w', zipfile.ZIP_DEFLATED)
+        elif self.format == '.tar.zst':
+            self._zstd = zstandard.ZstdCompressor().stream_writer(self._fp, closefd=False)
+            self._tar = tarfile.open(fileobj=self._zstd, mode='w|')
+        else:
+            self._tar = tarfile.open(fileobj=self._fp, mode='w|gz' if self.format == '.tar.gz' else 'w|')
+
+    @staticmethod
+    def check_supported(path: str):
+        """
+        Raise UnsupportedArchiveException if path can't be written as an archive, before anything is done that
+            would have to be thrown away.
+        """
+        extension = archive_format(path)
+        if extension is None:
+            raise UnsupportedArchiveException(f'{path} doesn\'t end with one of {", ".join(ARCHIVE_EXTENSIONS)}')
+        if extension == '.tar.zst' and zstandard is None:
+            raise UnsupportedArchiveException('Writing .tar.zst archives needs the zstandard package '
+                                              '(pip3 install zstandard)')
+
+    def add(self, name: str, data: Union[str, bytes]):
+        """
+        Add a file to the archive
+
+        :param name: Path of the file within the archive, '/' separated
+        :param data: File contents. str is written as UTF-8.
+        """
+        if isinstance(data, str):
+            data = data.encode()
+        if self._zip is not None:
+            info = zipfile.ZipInfo(name, time.localtime(self.mtime)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            self._zip.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = self.mtime
+            info.mode = 0o644
+            self._tar.addfile(info, BytesIO(data))
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+        if self._tar is not None:
+            self._tar.close()
+        if self._zstd is not None:
+            self._zstd.close()
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.close()
+        finally:
+            if exc_type is not None:
+                os.remove(self.path)
+
+
+class VirtualRows:
+    """
+    Read-only sequence of table rows, generated on access from a list of items (an image's symbols, etc.)
+    """
+
+    def __init__(self, items, row_func):
+        self.items = items
+        self.row_func = row_func
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.row_func(item) for item in self.items[index]]
+        return self.row_func(self.items[index])
+
+    def __iter__(self):
+        return (self.row_func(item) for item in self.items)
+
+
 class Table:
     """
     ASCII Table Renderer
@@ -242,8 +422,17 @@ class Table:
     This can be used with and without curses;
         you just need to set the max width it can be rendered at on the render call.
         (shutil.get_terminal_size)
+
+    For printing a table in the CLI, use .print_all(); it writes rows as they're rendered, and .rows can be a
+        VirtualRows or a generator, so the table never has to exist in memory as a whole.
     """
 
+    # Lines rendered between writes in print_all()
+    PRINT_BATCH_LINES = 0x100
+    # When .rows has no len() (a generator, etc.), print_all() measures column widths on this many rows from the
+    #   start of it. Anything wider further down wraps.
+    PRINT_SAMPLE_ROWS = 0x1000
+
     def __init__(self, dividers=False, avoid_wrapping_titles=False):
         self.titles = []
         self.rows = []
@@ -260,31 +449,43 @@ class Table:
         # Most recently calculated maxes (not thread safe)
         self.most_recent_adjusted_maxes = []
 
-        # width-based caches for loaded and rendered columns
+        # Caches for rendered rows and headers. Only the most recently fetched screen width is kept.
         self.rendered_row_cache = {}
         self.header_cache = {}
 
-    def preheat(self):
+    def preheat(self, rows=None):
         """
         Call this whenever there's a second to do so, to pre-run a few width-independent calculations
 
+        Anything already rendered is dropped, as it was laid out for the old column widths.
+
+        :param rows: Rows to measure, if not .rows
         :return:
         """
         self.column_maxes = [0 for _ in self.titles]
         self.most_recent_adjusted_maxes = [*self.column_maxes]
+        self.rendered_row_cache = {}
+        self.header_cache = {}
+
+        column_maxes = self.column_maxes
+        column_pad = self.column_pad
 
         # Iterate through each row,
-        for row in self.rows:
+        for row in self.rows if rows is None else rows:
             # And in each row, iterate through each column
             for index, col in enumerate(row):
                 # Check the length of this column; if it's larger than the length in the array,
                 #   set the max to the new one
-                col_size = max([len(i) + self.column_pad for i in col.split('\n')])
-                self.column_maxes[index] = max(col_size, self.column_maxes[index])
+                if '\n' in col:
+                    col_size = max([len(i) for i in col.split('\n')]) + column_pad
+                else:
+                    col_size = len(col) + column_pad
+                if col_size > column_maxes[index]:
+                    column_maxes[index] = col_size
 
         # If the titles are longer than any of the items in that column, account for those too
         for i, title in enumerate(self.titles):
-            self.column_maxes[i] = max(self.column_maxes[i], len(title) + 1 + len(self.titles))
+            column_maxes[i] = max(column_maxes[i], len(title) + 1 + len(self.titles))
 
     def fetch_all(self, screen_width):
         """
@@ -298,6 +499,77 @@ class Table:
         # This function effectively replaces the previous usage of .render() and does it all in one go.
         return self.fetch(0, len(self.rows), screen_width)
 
+    def print_all(self, screen_width, file=sys.stdout):
+        """
+        Print the entirety of the table for a screen width, as ktool_print(self.fetch_all(screen_width)) would.
+
+        Rows are written out in batches as they're rendered, and nothing is cached, so a table of any length starts
+            printing immediately and is never held in memory in full.
+
+        :param screen_width:
+        :param file: File to print to
+        :return:
+        """
+        cgrey = '\33[0m\33[38;5;242m'
+        reset = '\33[0m'
+        cend = '\33[0m\33[39m'
+        if opts.DISABLE_COLOR:
+            cgrey = reset
+            cend = reset
+
+        if file.isatty():
+            def write(text):
+                file.write(text.replace('┣', cgrey + '┣').replace('┫', '┫' + cend))
+        else:
+            def write(text):
+                file.write(strip_ansi(text))
+
+        rows = self.rows
+        if not hasattr(rows, '__len__'):
+            rows = iter(rows)
+            sample = list(islice(rows, self.PRINT_SAMPLE_ROWS))
+            if len(sample) == 0:
+                write('\n')
+                return
+            if not len(self.column_maxes) > 0:
+                self.preheat(sample)
+            rows = chain(sample, rows)
+        elif len(rows) == 0:
+            write('\n')
+            return
+        elif not len(self.column_maxes) > 0:
+            self.preheat()
+
+        width = screen_width - 1
+
+        column_maxes = self._fit_columns(width)
+        if column_maxes is None:
+            write('Width too small to render table\n')
+            return
+
+        sep_line = self._sep_line(column_maxes, width)
+        row_sep_line = cgrey + sep_line + cend
+
+        write(self._header(screen_width, row_sep_line))
+
+        lines = []
+        if self.dividers:
+            lines.append(sep_line)
+
+        for row_index, row in enumerate(rows):
+            if self.dividers and row_index > 0:
+                lines.append(row_sep_line)
+            lines.extend(self._row_lines(row, column_maxes, width))
+            if len(lines) >= self.PRINT_BATCH_LINES:
+                write('\n'.join(lines) + '\n')
+                lines = []
+
+        if self.dividers:
+            lines.append(row_sep_line.replace('┣', '┗').replace('╋', '┻').replace('┫', '┛'))
+        else:
+            lines.append('')
+        write('\n'.join(lines) + '\n')
+
     def fetch(self, row_start, row_count, screen_width):
         """
         Cache-based batch processing and rendering
@@ -312,7 +584,6 @@ class Table:
 
         cgrey = '\33[0m\33[38;5;242m'
         reset = '\33[0m'
-        cwhitebold = '\33[0m\33[1m'
         cend = '\33[0m\33[39m'
         if opts.DISABLE_COLOR:
             cgrey = reset
@@ -328,7 +599,8 @@ class Table:
                 else:
                     break
         else:
-            self.rendered_row_cache[screen_width] = {}
+            # Rows rendered for any other width are stale now
+            self.rendered_row_cache = {screen_width: {}}
         r_row_count = row_count - len(rows)
         r_start = row_start + len(rows)
         rows_text = ''.join([i + '\n' for i in rows])
@@ -338,11 +610,7 @@ class Table:
 
         if self.dividers:
             rows_text = rows_text[:-1]  # cut off the "\n"
-            sep_line = '┣━'
-            for size in self.most_recent_adjusted_maxes:
-                sep_line += ''.ljust(size - 2, '━') + '╋━'
-            sep_line = cgrey + sep_line[:-self.column_pad].ljust(screen_width - 1, '━')[
-                               :-self.column_pad] + '━━━┫' + cend
+            sep_line = cgrey + self._sep_line(self.most_recent_adjusted_maxes, screen_width - 1) + cend
 
             rows_text = rows_text[:-(len(sep_line))]  # Use our calculated sep_line length to cut off the last one
             rows_text += sep_line.replace('┣', '┗').replace('╋', '┻').replace('┫', '┛')
@@ -350,52 +618,55 @@ class Table:
         if screen_width in self.header_cache:
             rows_text = self.header_cache[screen_width] + rows_text
         else:
-            title_row = ''
-            for i, title in enumerate(self.titles):
-                if self.dividers:
-                    try:
-                        title_row += cgrey + '┃ ' + cwhitebold + title.ljust(self.most_recent_adjusted_maxes[i], ' ')[
-                                                             :-(self.column_pad - 1)]
-                    except IndexError:
-                        # I have no idea what causes this
-                        title_row = ""
-                else:
-                    try:
-                        title_row += ' ' + title.ljust(self.most_recent_adjusted_maxes[i], ' ')[:-(self.column_pad - 1)]
-                    except IndexError:
-                        title_row = ""
-            header_text = ""
-            if self.dividers:
-                header_text += cgrey + sep_line.replace('┣', '┏').replace('╋', '┳').replace('┫', '┓') + cwhitebold + '\n'
-            header_text += title_row.ljust(screen_width - 1)[
-                           :-1] + cgrey + '  ┃\n' + cwhitebold if self.dividers else cwhitebold + title_row + reset + '\n'
-            if self.dividers:
-                header_text += sep_line + '\n'
-            self.header_cache[screen_width] = header_text
+            header_text = self._header(screen_width, sep_line)
+            self.header_cache = {screen_width: header_text}
             rows_text = header_text + rows_text
 
         rows_text = rows_text.replace('┣', cgrey + '┣').replace('┫', '┫' + cend)
         return rows_text
 
-    # noinspection PyUnreachableCode
-    def render(self, _rows, width, row_start):
+    def _header(self, screen_width, sep_line):
         """
-        Render a list of rows for screen_width
+        Title row (and borders, with dividers) for the most recently calculated column widths
 
-        :param _rows: list of rows to be rendered
-        :param width: Screen width
-        :param row_start: Starting index of rows (for the sake of cacheing)
+        :param screen_width: Screen width
+        :param sep_line: Colored separator line, with dividers
         :return:
         """
+        cgrey = '\33[0m\33[38;5;242m'
+        reset = '\33[0m'
+        cwhitebold = '\33[0m\33[1m'
 
-        width -= 1
-
-        if len(_rows) == 0:
-            return ""
+        title_row = ''
+        for i, title in enumerate(self.titles):
+            if self.dividers:
+                try:
+                    title_row += cgrey + '┃ ' + cwhitebold + title.ljust(self.most_recent_adjusted_maxes[i], ' ')[
+                                                         :-(self.column_pad - 1)]
+                except IndexError:
+                    # I have no idea what causes this
+                    title_row = ""
+            else:
+                try:
+                    title_row += ' ' + title.ljust(self.most_recent_adjusted_maxes[i], ' ')[:-(self.column_pad - 1)]
+                except IndexError:
+                    title_row = ""
+        header_text = ""
+        if self.dividers:
+            header_text += cgrey + sep_line.replace('┣', '┏').replace('╋', '┳').replace('┫', '┓') + cwhitebold + '\n'
+        header_text += title_row.ljust(screen_width - 1)[
+                       :-1] + cgrey + '  ┃\n' + cwhitebold if self.dividers else cwhitebold + title_row + reset + '\n'
+        if self.dividers:
+            header_text += sep_line + '\n'
+        return header_text
 
-        if not len(self.column_maxes) > 0:
-            self.preheat()
+    def _fit_columns(self, width):
+        """
+        Shrink (or grow) the column widths to fit in width
 
+        :param width: Usable width (screen width - 1)
+        :return: The adjusted column widths, or None if the table can't fit
+        """
         column_maxes = [*self.column_maxes]
 
         # if column widths aren't large enough for the width, fill out the last col.
@@ -416,82 +687,146 @@ class Table:
                 else:
                     column_maxes[index] = max(col_min, column_maxes[index] - 1)
             if sum(column_maxes) == last_sum:
-                return 'Width too small to render table'
+                return None
             last_sum = sum(column_maxes)
 
         self.most_recent_adjusted_maxes = [*column_maxes]
+        return column_maxes
 
-        def split_handling_ansi(input_string, split_length):
-            """
-            Splits the input_string into chunks of split_length, taking into account
-            ANSI escape sequences and trying to wrap whole words.
-            """
-            parts = []
-            current_part = ''
-            current_length = 0
-            current_color = '\x1b[0m'
-            i = 0
-            while i < len(input_string):
-                match = ansi_escape.match(input_string, i)
-                if match:
-                    # Include the ANSI sequence without adding to the length
-                    current_color = match.group()
-                    current_part += match.group()
-                    i += len(match.group())
+    def _sep_line(self, column_maxes, width):
+        sep_line = '┣━'
+        for size in column_maxes:
+            sep_line += ''.ljust(size - 2, '━') + '╋━'
+        return sep_line[:-self.column_pad].ljust(width, '━')[:-self.column_pad] + '━━━┫'
+
+    @staticmethod
+    def _split_handling_ansi(input_string, split_length):
+        """
+        Splits the input_string into chunks of split_length, taking into account
+        ANSI escape sequences and trying to wrap whole words.
+        """
+        # Most cells are plain text that fits (or a single word, which is never broken); skip the walk for those.
+        if input_string and '\n' not in input_string and (' ' not in input_string or
+                                                          len(input_string) + 6 <= split_length):
+            if not ansi_escape.search(input_string):
+                return [input_string]
+
+        parts = []
+        current_part = ''
+        current_length = 0
+        current_color = '\x1b[0m'
+        i = 0
+        while i < len(input_string):
+            match = ansi_escape.match(input_string, i)
+            if match:
+                # Include the ANSI sequence without adding to the length
+                current_color = match.group()
+                current_part += match.group()
+                i += len(match.group())
+            else:
+                space_pos = input_string.find(' ', i)
+                newline_pos = input_string.find('\n', i)
+                next_break = min(space_pos if space_pos != -1 else len(input_string),
+                                 newline_pos if newline_pos != -1 else len(input_string))
+                word_end = next_break if next_break != -1 else len(input_string)
+                word_length = strip_ansi(input_string[i:word_end]).__len__()
+
+                if current_length + word_length + 6 <= split_length or current_length == 0:
+                    # Add the word to the current line
+                    current_part += input_string[i:word_end]
+                    current_length += word_length
+                    i = word_end
                 else:
-                    space_pos = input_string.find(' ', i)
-                    newline_pos = input_string.find('\n', i)
-                    next_break = min(space_pos if space_pos != -1 else len(input_string),
-                                     newline_pos if newline_pos != -1 else len(input_string))
-                    word_end = next_break if next_break != -1 else len(input_string)
-                    word_length = strip_ansi(input_string[i:word_end]).__len__()
-
-                    if current_length + word_length + 6 <= split_length or current_length == 0:
-                        # Add the word to the current line
-                        current_part += input_string[i:word_end]
-                        current_length += word_length
-                        i = word_end
-                    else:
-                        # Finish the current line and start a new one
-                        parts.append(current_part)
-                        current_part = current_color  # Reset with the current ANSI color
-                        current_length = 0
-
-                    if input_string[i:i + 1] == ' ':
-                        # Include the space in the current part if it's not at the end
-                        current_part += ' '
-                        i += 1
-                    elif input_string[i:i + 1] == '\n':
-                        # Handle newline: finish the current part and reset
-                        parts.append(current_part)
-                        current_part = current_color  # Reset with the current ANSI color
-                        current_length = 0
-                        i += 1
-
-            if strip_ansi(current_part):
-                parts.append(current_part)
-            return parts
+                    # Finish the current line and start a new one
+                    parts.append(current_part)
+                    current_part = current_color  # Reset with the current ANSI color
+                    current_length = 0
+
+                if input_string[i:i + 1] == ' ':
+                    # Include the space in the current part if it's not at the end
+                    current_part += ' '
+                    i += 1
+                elif input_string[i:i + 1] == '\n':
+                    # Handle newline: finish the current part and reset
+                    parts.append(current_part)
+                    current_part = current_color  # Reset with the current ANSI color
+                    current_length = 0
+                    i += 1
+
+        if strip_ansi(current_part):
+            parts.append(current_part)
+        return parts
+
+    def _row_lines(self, row, column_maxes, width):
+        """
+        Lay out a single row
 
-        rows = []
-        for row_i, row in enumerate(_rows):
-            cols = []
-            max_line_count_in_row = 0
-            for col_i, col in enumerate(row):
-                lines = []
-                column_width = column_maxes[col_i] - self.column_pad
-                wrapped_lines = split_handling_ansi(col, column_width)
-                for line in wrapped_lines:
-                    # Splitting further if there are newline characters in the wrapped line
-                    lines.extend(line.split('\n'))
-                max_line_count_in_row = max(len(lines), max_line_count_in_row)
-                cols.append(lines)
-            for col in cols:
-                while len(col) < max_line_count_in_row:
-                    col.append('')
-            rows.append(cols)
-
-        lines = ""
-        sep_line = ""
+        :param row: List of column strings
+        :param column_maxes: Adjusted column widths
+        :param width: Usable width (screen width - 1)
+        :return: The row's lines, not including the separator below it
+        """
+        cgrey = '\33[0m\33[38;5;242m'
+        reset = '\33[0m'
+        cend = '\33[0m\33[39m'
+        if opts.DISABLE_COLOR:
+            cgrey = reset
+            cend = reset
+
+        cols = []
+        max_line_count_in_row = 0
+        for col_i, col in enumerate(row):
+            lines = []
+            column_width = column_maxes[col_i] - self.column_pad
+            wrapped_lines = self._split_handling_ansi(col, column_width)
+            for line in wrapped_lines:
+                # Splitting further if there are newline characters in the wrapped line
+                lines.extend(line.split('\n'))
+            max_line_count_in_row = max(len(lines), max_line_count_in_row)
+            cols.append(lines)
+        for col in cols:
+            while len(col) < max_line_count_in_row:
+                col.append('')
+
+        row_lines = []
+        column_count = len(cols[0])
+        for i in range(0, column_count):
+            line = ""
+            for j, col in enumerate(cols):
+                diff = column_maxes[j] - len(strip_ansi(col[i]))
+                line += col[i] + (' ' * diff)
+                if self.dividers:
+                    line = line[:-self.column_pad] + f' ┃ '
+            if self.dividers:
+                diff = width - len(strip_ansi(line))
+                line = cgrey + '┃ ' + reset + (line + (' ' * diff))[:-self.column_pad] + cgrey + ' ┃ ' + cend
+                line = line.replace('┃', cgrey + '┃' + reset)
+            else:
+                line = ' ' + line[:-self.column_pad].ljust(width, ' ')[:-self.column_pad] + (' ' * self.column_pad)
+            row_lines.append(line)
+        return row_lines
+
+    def render(self, _rows, width, row_start):
+        """
+        Render a list of rows for screen_width
+
+        :param _rows: list of rows to be rendered
+        :param width: Screen width
+        :param row_start: Starting index of rows (for the sake of cacheing)
+        :return:
+        """
+
+        width -= 1
+
+        if len(_rows) == 0:
+            return ""
+
+        if not len(self.column_maxes) > 0:
+            self.preheat()
+
+        column_maxes = self._fit_columns(width)
+        if column_maxes is None:
+            return 'Width too small to render table'
 
         cgrey = '\33[0m\33[38;5;242m'
         reset = '\33[0m'
@@ -500,40 +835,23 @@ class Table:
             cgrey = reset
             cend = reset
 
-        if self.dividers:
-            sep_line = '┣━'
-            for size in column_maxes:
-                sep_line += ''.ljust(size - 2, '━') + '╋━'
-            sep_line = sep_line[:-self.column_pad].ljust(width, '━')[:-self.column_pad] + '━━━┫'
+        sep_line = self._sep_line(column_maxes, width) if self.dividers else ""
+        row_cache = self.rendered_row_cache.setdefault(width + 1, {})
 
+        lines = []
         if self.dividers:
-            lines += sep_line + '\n'
+            lines.append(sep_line + '\n')
 
-        for row_index, row in enumerate(rows):
-            row_lines = []
-            column_count = len(row[0])
-            for i in range(0, column_count):
-                line = ""
-                for j, col in enumerate(row):
-                    diff = column_maxes[j] - len(strip_ansi(col[i]))
-                    line += col[i] + (' ' * diff)
-                    if self.dividers:
-                        line = line[:-self.column_pad] + f' ┃ '
-                if self.dividers:
-                    diff = width - len(strip_ansi(line))
-                    line = cgrey + '┃ ' + reset + (line + (' ' * diff))[:-self.column_pad] + cgrey + ' ┃ ' + cend
-                    line = line.replace('┃', cgrey + '┃' + reset)
-                else:
-                    line = ' ' + line[:-self.column_pad].ljust(width, ' ')[:-self.column_pad] + (' ' * self.column_pad)
-                row_lines.append(line)
+        for row_index, row in enumerate(_rows):
+            row_lines = self._row_lines(row, column_maxes, width)
 
             if self.dividers:
                 row_lines.append(cgrey + sep_line + cend)
 
-            self.rendered_row_cache[width + 1][str(row_index + row_start)] = '\n'.join(row_lines)
-            lines += '\n'.join(row_lines)
-            lines += '\n'
-        return lines
+            row_text = '\n'.join(row_lines)
+            row_cache[str(row_index + row_start)] = row_text
+            lines.append(row_text + '\n')
+        return ''.join(lines)
 
 
 ansi_escape = re.compile(r'(?:\x1B[@-_]|[\x80-\x9F])[0-?]*[ -/]*[@-~]')
@@ -29,14 +29,12 @@
 import curses
 import os
 import pprint
+import queue
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from math import ceil
 
-from pygments import highlight
-from pygments.formatters.terminal import TerminalFormatter
-from pygments.formatters.terminal256 import Terminal256Formatter
-from pygments.lexers.objective import ObjectiveCLexer
-
 import ktool.ktool
 from ktool.swift import SwiftClass
 from ktool_macho import LOAD_COMMAND
@@ -44,8 +42,8 @@ from ktool_macho import LOAD_COMMAND
 from ktool.macho import MachOFile
 from ktool.loader import MachOImageLoader
 from ktool.objc import ObjCImage
-from ktool.headers import HeaderGenerator
-from ktool.util import Table
+from ktool.headers import HeaderGenerator, HeaderUtils, TypeResolver, header_for, highlight_header_text
+from ktool.util import Table, VirtualRows
 
 from ktool.kcache import KernelCache, Kext
 
@@ -62,6 +60,9 @@ BOX_CHARS = ['┦', '─', '━', '│', '┃', '┄', '┅', '┆', '┇', '┈
 
 SIDEBAR_WIDTH = 40
 
+# How often (ms) the run-loop wakes up to pick up sidebar items from the background loader while it's busy
+LOADER_POLL_INTERVAL = 100
+
 MAIN_TEXT = """ktool ------
 
 This is a *very* pre-release version of the GUI Tool, and it has a long ways to go. 
@@ -74,6 +75,8 @@ Navigate the sidebar with arrow keys or mouse. You can use left/right arrow, or
 
 Hit tab to swap between the sidebar context and main context. Scroll the main context with up/down keys.
 
+In a hex view, hit g and type an address (then enter) to jump to that VM address.
+
 Backspace to exit (or click the X in the top right corner).
 """
 
@@ -251,62 +254,225 @@ class DestroyTitleMenuException(Exception):
     """
 
 
+class LoadCancelledException(Exception):
+    """Raised inside the background loader to abandon a load once a different file has been opened
+    """
+
+
 class PanicException(Exception):
     """Raise this within the program and set the global PANIC_STRING to panic the window,
             and print the string after cleaning up the window display.
     """
 
 
-class HexDumpTable(Table):
+class VirtualTable(Table):
     """
-    Subclass of table, just set the .hex value to a bytearray and it'll handle rendering it.
+    Table backed directly by a list of items, for lists far too long to format up front (symbol tables, etc.).
 
+    Rows are only generated and rendered for the window being displayed, a page at a time, and only the most recently
+        used pages are kept; scrolling costs the same however long the list is.
     """
 
-    def __init__(self):
+    PAGE_ROWS = 0x40
+    CACHED_PAGES = 8
+    # Column widths are measured on this many rows spread across the list, rather than on every row.
+    #   Anything wider just wraps.
+    SAMPLE_ROWS = 0x1000
+
+    def __init__(self, items, row_func, titles):
+        """
+        :param items: Backing list
+        :param row_func: Builds the row (a list of column strings) for an item
+        :param titles: Column titles
+        """
         super().__init__()
-        self.titles = ['Raw Data', 'ASCII']
-        self.hex = bytearray(b'')
+        self.titles = titles
+        self.rows = VirtualRows(items, row_func)
+
+        # (screen_width, page index) -> list of rendered rows
+        self.page_cache = OrderedDict()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def preheat(self):
+        self.column_maxes = [0 for _ in self.titles]
+        self.most_recent_adjusted_maxes = [*self.column_maxes]
+
+        step = max(1, len(self.rows) // VirtualTable.SAMPLE_ROWS)
+        for i in range(0, len(self.rows), step):
+            for index, col in enumerate(self.rows[i]):
+                col_size = max([len(i) + self.column_pad for i in col.split('\n')])
+                self.column_maxes[index] = max(col_size, self.column_maxes[index])
+
+        for i, title in enumerate(self.titles):
+            self.column_maxes[i] = max(self.column_maxes[i], len(title) + 1 + len(self.titles))
+
+    def page(self, index, screen_width):
+        key = (screen_width, index)
+        if key in self.page_cache:
+            self.page_cache.move_to_end(key)
+            return self.page_cache[key]
+
+        start = index * VirtualTable.PAGE_ROWS
+        rows = self.rows[start:start + VirtualTable.PAGE_ROWS]
+        self.rendered_row_cache = {screen_width: {}}
+        self.render(rows, screen_width, start)
+        page = [self.rendered_row_cache[screen_width][str(i)] for i in range(start, start + len(rows))]
+        self.rendered_row_cache = {}
+
+        self.page_cache[key] = page
+        if len(self.page_cache) > VirtualTable.CACHED_PAGES:
+            self.page_cache.popitem(last=False)
+        return page
 
     def fetch(self, row_start, row_count, screen_width):
+        if len(self.rows) == 0:
+            return super().fetch(0, 0, screen_width)
+        row_start = max(0, min(row_start, len(self.rows) - 1))
+        row_count = min(row_count, len(self.rows) - row_start)
+
+        # Hand Table.fetch the window pre-rendered, so it only has to put the header on top of it
+        rendered = {}
+        first_page = row_start // VirtualTable.PAGE_ROWS
+        last_page = (row_start + row_count - 1) // VirtualTable.PAGE_ROWS
+        for index in range(first_page, last_page + 1):
+            for i, row in enumerate(self.page(index, screen_width)):
+                rendered[str(index * VirtualTable.PAGE_ROWS + i)] = row
+        self.rendered_row_cache = {screen_width: rendered}
+        fetched = super().fetch(row_start, row_count, screen_width)
+        self.rendered_row_cache = {}
 
-        col_count = 2
-        self.rows = []
+        return fetched
 
-        stack = ""
-        decode_stack = ""
-        stack_div = ""
-        decode_stack_div = ""
 
-        for i, byte in enumerate(self.hex[row_start * 8:row_start * 8 + row_count * 8]):
-            stack_div += hex(byte)[2:].rjust(2, '0')
-            decode_stack_div += byte.to_bytes(1, 'big').decode('ascii') + ' ' if byte in range(32, 127) else '. '
-            if len(stack_div) >= 8:
-                stack += stack_div + '  '
-                decode_stack += decode_stack_div + '  '
-                stack_div = ""
-                decode_stack_div = ""
-            if len(stack) >= 10 * col_count:
-                self.rows.append([stack, decode_stack])
-                stack = ""
-                decode_stack = ""
+class HexDumpChunks:
+    """
+    Sequence of (row index, bytes) for each HexDumpTable.ROW_BYTES bytes of a region, read as they're accessed.
+    """
 
-        self.rows.append([stack, decode_stack])
+    def __init__(self, read, size):
+        self.read = read
+        self.size = size
 
-        if not len(self.column_maxes) > 0:
-            self.preheat()
+    def __len__(self):
+        return (self.size + HexDumpTable.ROW_BYTES - 1) // HexDumpTable.ROW_BYTES
 
-        fetched = super().fetch(0, row_count, screen_width)
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            if index < 0:
+                index += len(self)
+            return self[index:index + 1][0]
+        start, stop, _ = index.indices(len(self))
+        if stop <= start:
+            return []
+        row_bytes = HexDumpTable.ROW_BYTES
+        data = self.read(start * row_bytes, (stop - start) * row_bytes)
+        return [(i, data[(i - start) * row_bytes:(i - start + 1) * row_bytes]) for i in range(start, stop)]
 
-        self.rendered_row_cache = {}
 
-        return fetched
+class HexDumpTable(VirtualTable):
+    """
+    Subclass of table, just set the .hex value to a bytearray and it'll handle rendering it.
+
+    Use for_region() to view a region of an image instead; that reads straight out of the slice's file as rows are
+        displayed, so a view of a huge segment doesn't copy it, and it can jump to VM addresses.
+    """
+
+    ROW_BYTES = 8
+
+    def __init__(self):
+        super().__init__([], None, ['Raw Data', 'ASCII'])
+        self.image = None
+        self.file_address = 0
+        self.vm_address = None
+
+        self.hex = bytearray(b'')
+
+    @classmethod
+    def for_region(cls, image, file_address, size, vm_address=None):
+        """
+        Hex view of a region of an image's slice
+
+        :param image: Image the region belongs to
+        :param file_address: Offset of the region within the slice
+        :param size: Size of the region; clamped to the end of the slice
+        :param vm_address: VM address of the region. Rows are labeled with it, and it enables row_for_vm_address()
+        :return: HexDumpTable
+        """
+        table = cls()
+        table.image = image
+        table.file_address = file_address
+        table.vm_address = vm_address
+        table.titles = ['Address', 'Raw Data', 'ASCII']
+
+        file = image.slice.file
+        size = max(0, min(size, file.size - file_address))
+        table.set_source(lambda offset, count: file.read_bytes(file_address + offset, min(count, size - offset)), size)
+        return table
+
+    @property
+    def hex(self):
+        return self._hex
+
+    @hex.setter
+    def hex(self, data):
+        self._hex = data
+        self.set_source(lambda offset, count: data[offset:offset + count], len(data))
+
+    def set_source(self, read, size):
+        self.rows = VirtualRows(HexDumpChunks(read, size), self.format_row)
+        self.column_maxes = []
+        self.page_cache.clear()
+        self.header_cache = {}
+
+    def format_row(self, chunk):
+        index, data = chunk
+        raw = ''
+        decoded = ''
+        for i in range(0, len(data), 4):
+            group = data[i:i + 4]
+            raw += group.hex() + '  '
+            decoded += ''.join(chr(byte) + ' ' if 32 <= byte < 127 else '. ' for byte in group) + '  '
+        if self.image is None:
+            return [raw, decoded]
+        base = self.vm_address if self.vm_address is not None else self.file_address
+        return [hex(base + index * HexDumpTable.ROW_BYTES), raw, decoded]
+
+    def preheat(self):
+        # Every row is the same width, bar a short last one. Table's word wrapping wants 6 columns of slack before
+        #   it'll fit the last word of a cell on the same line, without which every row would wrap onto two lines.
+        self.column_maxes = [len(title) + 1 + len(self.titles) for title in self.titles]
+        for i in {0, len(self.rows) - 1}:
+            if i < 0:
+                continue
+            for index, col in enumerate(self.rows[i]):
+                self.column_maxes[index] = max(len(col) + self.column_pad + 6, self.column_maxes[index])
+        self.most_recent_adjusted_maxes = [*self.column_maxes]
+
+    def row_for_vm_address(self, vm_address):
+        """
+        Row containing a VM address, for jumping to it
+
+        :param vm_address: VM Address
+        :return: Row index
+        :raises ValueError: if the address isn't mapped within this view
+        """
+        if self.image is None:
+            raise ValueError("This view isn't backed by an image")
+        offset = self.image.vm.translate(vm_address) - self.file_address
+        if not 0 <= offset < self.rows.items.size:
+            raise ValueError(f'{hex(vm_address)} is outside of this view')
+        return offset // HexDumpTable.ROW_BYTES
 
 
 class LazilyProcessedTextBuffer:
     def __init__(self):
         self.lines = []
         self.processed = False
+        # If False, lines are dropped once they've been displayed and the target is called again next time; for
+        #   targets that cache their own results (with a bound), so every item ever viewed isn't held onto
+        self.keep = True
 
         self.target = None
         self.target_args = []
@@ -447,11 +613,20 @@ class ScrollingDisplayBuffer:
             wrapped_lines = []
 
             if len(self.lines) > 0 and isinstance(self.lines[0], LazilyProcessedTextBuffer):
-                if not self.lines[0].processed:
-                    self.lines[0].go()
-                self.lines = self.lines[0].lines + self.lines[1:]
+                buffer = self.lines[0]
+                if not buffer.processed:
+                    buffer.go()
+                self.lines = buffer.lines + self.lines[1:]
+                if not buffer.keep:
+                    buffer.lines = []
+                    buffer.processed = False
 
             for line in self.lines:
+                if isinstance(line, VirtualTable):
+                    wrapped_lines.append(line)
+                    # Enough for the last rows to sit at the bottom of the screen, under the title row
+                    self.filled_line_count = len(line) + 2
+                    continue
                 if isinstance(line, Table):
                     wrapped_lines.append(line)
                     self.filled_line_count = -1
@@ -869,6 +1044,8 @@ class FooterBar(View):
         super().__init__()
         self.show_debug = False
         self.debug_text = ''
+        # Progress of the background loader, if it's working on something
+        self.status_text = ''
 
         self.hi_text = ''
 
@@ -896,6 +1073,9 @@ class FooterBar(View):
             self.box.write(self.box.width - len(self.debug_text) - 5, 0, self.debug_text, curses.A_NORMAL)
         else:
             self.box.write(self.box.width - len(self.hi_text) - 5, 0, self.hi_text, curses.color_pair(9))
+            if self.status_text:
+                status = ' ' + ' - '.join(self.status_text.split('\n')) + ' '
+                self.box.write(2, 0, status[:max(0, self.box.width - len(self.hi_text) - 10)], curses.A_NORMAL)
 
 
 # # # # #
@@ -917,6 +1097,28 @@ class SidebarMenuItem:
         self.show_children = False
         self.selected = False
 
+        # (builder, lib) for items whose content is only built once the user selects or expands them
+        self.loader = None
+        self.loading = False
+
+    @property
+    def expandable(self):
+        return len(self.children) > 0 or self.loader is not None
+
+    def fill(self, item):
+        """
+        Take on the content and children of a built item, replacing this placeholder's
+
+        :param item: Item built by this item's loader
+        :return:
+        """
+        self.content = item.content
+        self.children = item.children
+        for child in self.children:
+            child.parent = self
+        self.loader = None
+        self.loading = False
+
     def parse_mmc(self):
 
         lines = []
@@ -1002,7 +1204,7 @@ class Sidebar(ScrollView):
         for index, item in enumerate(self.processed_items):
             name = item.rend_name.ljust(SIDEBAR_WIDTH - 6, ' ')
 
-            if len(item.children) > 0:
+            if item.expandable:
                 if item.show_children:
                     name = name + '-'
                 else:
@@ -1049,7 +1251,7 @@ class Sidebar(ScrollView):
         :return:
         """
         item = self.processed_items[index]
-        if len(item.children) > 0 and item.show_children:
+        if item.expandable and item.show_children:
             item.show_children = False
 
             self.update_item_listing()
@@ -1084,7 +1286,7 @@ class Sidebar(ScrollView):
         elif key == curses.KEY_RIGHT:
             index = self.selected_index
             item = self.processed_items[index]
-            if len(item.children) > 0:
+            if item.expandable:
                 item.show_children = True
                 self.update_item_listing()
 
@@ -1094,7 +1296,7 @@ class Sidebar(ScrollView):
             if item.show_children:
                 self.collapse_index(index)
             else:
-                if len(item.children) > 0:
+                if item.expandable:
                     item.show_children = True
                     self.update_item_listing()
         else:
@@ -1112,7 +1314,7 @@ class Sidebar(ScrollView):
             if -1 <= x - SIDEBAR_WIDTH + 6 <= 1 and y < len(self.processed_items):
                 index = y
                 item = self.processed_items[index]
-                if len(item.children) > 0:
+                if item.expandable:
                     if item.show_children:
                         self.selected_index = y
                         self.collapse_index(y)
@@ -1161,6 +1363,10 @@ class MainScreen(ScrollView):
 
         self.currently_displayed_index = 0
 
+        # Address being typed in after hitting 'g' on a hex view, and the result of the last jump
+        self.goto_input = None
+        self.goto_status = ''
+
     def set_tab_name(self, name):
         """
         Update the tab name
@@ -1186,8 +1392,55 @@ class MainScreen(ScrollView):
         self.info_box.write(3, 1, f' {self.tabname.strip()} ',
                             curses.A_NORMAL if not self.highlighted else curses.A_STANDOUT)
 
+        if self.goto_input is not None or self.goto_status:
+            if self.goto_input is not None:
+                goto_text = f' Go to address: 0x{self.goto_input}_ '
+            else:
+                goto_text = f' {self.goto_status} '
+            self.info_box.write(width - len(goto_text) - 2, 1, goto_text, curses.A_STANDOUT)
+
+    def hex_table(self):
+        for line in self.scroll_view_text_buffer.processed_lines:
+            if isinstance(line, HexDumpTable) and line.image is not None:
+                return line
+        return None
+
+    def goto(self, text):
+        """
+        Scroll the hex view to a VM address
+
+        :param text: Address, in hex
+        :return:
+        """
+        try:
+            row = self.hex_table().row_for_vm_address(int(text, 16))
+        except ValueError as ex:
+            self.goto_status = str(ex) if text else 'No address given'
+            return
+        self.scroll_view_text_buffer.scrollcursor = row
+        self.goto_status = ''
+
+    def handle_goto_key_press(self, key):
+        if key == curses.KEY_ENTER or key == 10:
+            text = self.goto_input
+            self.goto_input = None
+            self.goto(text)
+        elif key == 27:
+            self.goto_input = None
+        elif 0 <= key < 0x100 and chr(key) in '0123456789abcdefABCDEF':
+            self.goto_input += chr(key).lower()
+        self.scroll_view_text_buffer.draw_lines()
+        return True
+
     def handle_key_press(self, key):
-        if key == curses.KEY_UP:
+        self.goto_status = ''
+        if self.goto_input is not None:
+            return self.handle_goto_key_press(key)
+
+        if key == ord("g") and self.hex_table() is not None:
+            self.goto_input = ''
+            return True
+        elif key == curses.KEY_UP:
             self.scroll_view_text_buffer.scrollcursor = max(0, self.scroll_view_text_buffer.scrollcursor - 1)
             self.scroll_view_text_buffer.draw_lines()
             return True
@@ -1570,6 +1823,15 @@ class FileSystemBrowserOverlayView(ScrollView):
                 self.selected_index += 1
             return True
 
+        elif key == curses.KEY_ENTER or key == 10:
+            entries = ['..'] + os.listdir(self.current_dir_path)
+            if self.selected_index < len(entries):
+                path = os.path.join(self.current_dir_path, entries[self.selected_index])
+                if os.path.isfile(path) and self.callback is not None:
+                    self.draw = False
+                    self.callback(path)
+            return True
+
         return False
 
 
@@ -1581,6 +1843,98 @@ class FileSystemBrowserOverlayView(ScrollView):
 # # # # #
 
 
+class BackgroundLoader:
+    """
+    Runs the File Loaders on a worker thread, so the UI stays usable while a file loads.
+
+    Curses isn't thread safe, so the worker never touches the screen or the sidebar; everything it produces is queued,
+        and applied on the UI thread by poll().
+    """
+
+    def __init__(self):
+        self.status = ''
+
+        self._tasks = queue.Queue()
+        self._results = queue.Queue()
+        self._cancelled = threading.Event()
+        # Tasks submitted that poll() hasn't handed the result of back yet. Only touched on the UI thread.
+        self._pending = 0
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def busy(self):
+        return self._pending > 0
+
+    def submit(self, func, args, on_done=None):
+        """
+        Queue func(*args) to be run on the worker thread
+
+        :param func: Function to run
+        :param args: Arguments to run it with
+        :param on_done: Called on the UI thread with the result (or the exception raised) once it finishes
+        :return:
+        """
+        self._pending += 1
+        self._tasks.put((func, args, on_done))
+
+    def publish(self, func, *args):
+        """
+        Called from the worker; queue func(*args) to be run on the UI thread at the next poll()
+        """
+        self._check_cancelled()
+        self._results.put((func, args, False))
+
+    def update_status(self, msg):
+        """
+        Status callback handed to the File Loaders. As they call it often, it's also where a cancelled load bails out.
+        """
+        self._check_cancelled()
+        self.status = msg
+
+    def cancel(self):
+        self._cancelled.set()
+        self._tasks.put(None)
+
+    def poll(self):
+        """
+        Apply whatever the worker has queued up since the last poll.
+
+        :return: Whether anything was applied
+        """
+        applied = False
+        while not self._cancelled.is_set():
+            try:
+                func, args, finished = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if finished:
+                self._pending -= 1
+            if func is not None:
+                func(*args)
+            applied = True
+        return applied
+
+    def _check_cancelled(self):
+        if self._cancelled.is_set():
+            raise LoadCancelledException
+
+    def _run(self):
+        while True:
+            task = self._tasks.get()
+            if task is None or self._cancelled.is_set():
+                return
+            func, args, on_done = task
+            try:
+                result = func(*args)
+            except LoadCancelledException:
+                return
+            except Exception as ex:
+                result = ex
+            self._results.put((on_done, (result,), True))
+
+
 class KToolMachOLoader:
     SUPPORTS_256 = False
     SUPPORTS_COLOR = True
@@ -1588,6 +1942,10 @@ class KToolMachOLoader:
     CUR_SL = 0
     SL_CNT = 0
 
+    # id(image) -> (image, ObjCImage) for the images of the file being loaded, so the ObjC Headers and Swift Types
+    #   items share one ObjCImage
+    OBJC_IMAGES = {}
+
     @staticmethod
     def parent_count(item):
         count = 0
@@ -1597,69 +1955,110 @@ class KToolMachOLoader:
             item = item.parent
         return count
 
+    @staticmethod
+    def attach(parent, item):
+        """
+        Default publish function for the loaders; attach items to their parent as soon as they're built.
+        """
+        if parent is not None:
+            parent.children.append(item)
+
     @classmethod
-    def contents_for_file(cls, fd, callback, mmap=True):
+    def contents_for_file(cls, fd, callback, mmap=True, publish=None):
+        """
+        Build the sidebar items for a file, one root item per slice.
+
+        :param fd: File to load
+        :param callback: Status callback
+        :param mmap: Use mmaped IO
+        :param publish: Called with (parent, item) as each item is built, parent being None for root items.
+            Items are only attached to their parent by this function, so a caller can show them while the rest load.
+        :return: Root items
+        """
         machofile = MachOFile(fd, use_mmaped_io=mmap)
         items = []
+        KToolMachOLoader.OBJC_IMAGES = {}
+        KToolMachOLoader.CUR_SL = 0
         KToolMachOLoader.SL_CNT = len(machofile.slices)
         for macho_slice in machofile.slices:
             KToolMachOLoader.CUR_SL += 1
             try:
-                items.append(cls.slice_item(macho_slice, callback))
+                items.append(cls.slice_item(macho_slice, callback, publish=publish))
             except Exception as ex:
                 raise ex
         return items
 
     @classmethod
-    def contents_for_image(cls, image, callback):
+    def contents_for_image(cls, image, callback, publish=None):
         items = []
+        KToolMachOLoader.OBJC_IMAGES = {}
 
-        items.append(cls.slice_item(None, callback, image))
+        items.append(cls.slice_item(None, callback, image, publish=publish))
 
         return items
 
     @staticmethod
-    def slice_item(macho_slice, callback, loaded_image=None):
+    def lazy_item(name, builder, lib, parent):
+        """
+        Placeholder for an item that's expensive to build; its builder is run once the user selects or expands it.
+
+        :param name: Sidebar name
+        :param builder: Loader function, called as builder(lib, parent, callback)
+        :param lib: Image (or whatever else the builder takes)
+        :param parent: Parent item
+        :return: Placeholder item
+        """
+        item = SidebarMenuItem(name, MainMenuContentItem([f'Loading {name}...']), parent)
+        item.loader = (builder, lib)
+        return item
+
+    @staticmethod
+    def has_section(lib, prefix):
+        return any(sect.startswith(prefix) for segm in lib.segments.values() for sect in segm.sections.keys())
+
+    @staticmethod
+    def slice_item(macho_slice, callback, loaded_image=None, publish=None):
+        publish = publish if publish is not None else KToolMachOLoader.attach
+        callback(f'Slice {KToolMachOLoader.CUR_SL}/{KToolMachOLoader.SL_CNT}\nLoading MachO Image')
         if not loaded_image:
             loaded_image = MachOImageLoader.load(macho_slice)
         if hasattr(macho_slice, 'type'):
             slice_nick = f'{macho_slice.type.name}:{macho_slice.subtype.name}' + " Slice"
         else:
             slice_nick = "Thin MachO"
-        callback(f'Slice {KToolMachOLoader.CUR_SL}/{KToolMachOLoader.SL_CNT}\nLoading MachO Image')
         slice_item = SidebarMenuItem(f'{slice_nick}', None, None)
         slice_item.content = KToolMachOLoader._file(loaded_image, slice_item, callback).content
+        slice_item.show_children = True
+        publish(None, slice_item)
+
+        # Cheap items are built up front, in the background when there's a publish function to hand them to;
+        #   the rest can take minutes on a big image, so they're only built when they're looked at.
         items = [KToolMachOLoader.load_cmds,
                  KToolMachOLoader.segments,
                  KToolMachOLoader.codesign,
-                 KToolMachOLoader.linked,
-                 KToolMachOLoader.imports,
-                 KToolMachOLoader.exports,
-                 KToolMachOLoader.symtab]
+                 KToolMachOLoader.linked]
         for item in items:
             try:
-                slice_item.children.append(item(loaded_image, slice_item, callback))
+                publish(slice_item, item(loaded_image, slice_item, callback))
+            except LoadCancelledException:
+                raise
             except Exception as ex:
                 if KToolMachOLoader.HARD_FAIL:
                     raise ex
                 else:
                     pass
-        try:
-            slice_item.children += KToolMachOLoader.objc_items(loaded_image, slice_item, callback)
-        except Exception as ex:
-            if KToolMachOLoader.HARD_FAIL:
-                raise ex
-            else:
-                pass
 
-        try:
-            slice_item.children += KToolMachOLoader.swift_items(loaded_image, slice_item, callback)
-        except Exception as ex:
-            if KToolMachOLoader.HARD_FAIL:
-                pass
-            else:
-                pass
-        slice_item.show_children = True
+        lazy_items = [("Imports", KToolMachOLoader.imports),
+                      ("Exports", KToolMachOLoader.exports),
+                      ("Symbol Table", KToolMachOLoader.symtab)]
+        if KToolMachOLoader.has_section(loaded_image, '__objc_'):
+            lazy_items.append(("ObjC Headers", KToolMachOLoader.objc_items))
+        if KToolMachOLoader.has_section(loaded_image, '__swift5_types'):
+            lazy_items.append(("Swift Types", KToolMachOLoader.swift_items))
+
+        for name, builder in lazy_items:
+            publish(slice_item, KToolMachOLoader.lazy_item(name, builder, loaded_image, slice_item))
+
         return slice_item
 
     @staticmethod
@@ -1680,16 +2079,14 @@ class KToolMachOLoader:
             item = SidebarMenuItem(f'{segname} [{len(segm.sections.items())} Sections]', mmci, ssmi)
             for secname, sect in segm.sections.items():
                 segtable.rows.append([secname, hex(sect.vm_address), hex(sect.size), hex(sect.file_address)])
-                hextab = HexDumpTable()
-                hextab.hex = lib.slice.read_bytearray(sect.file_address, sect.size)
+                hextab = HexDumpTable.for_region(lib, sect.file_address, sect.size, sect.vm_address)
                 itm = MainMenuContentItem()
                 itm.lines.append(hextab)
                 item.children.append(SidebarMenuItem(secname, itm, item))
             ssmi.children.append(item)
             if len(segm.sections.items()) == 0:
                 if 'PAGEZERO' not in segname:
-                    hextab = HexDumpTable()
-                    hextab.hex = lib.slice.read_bytearray(segm.file_address, segm.size)
+                    hextab = HexDumpTable.for_region(lib, segm.file_address, segm.size, segm.vm_address)
                     mmci.lines.append(hextab)
             else:
                 mmci.lines.append(segtable)
@@ -1815,10 +2212,8 @@ class KToolMachOLoader:
     def symtab(lib, parent=None, callback=None):
         callback(f'Slice {KToolMachOLoader.CUR_SL}/{KToolMachOLoader.SL_CNT}\nProcessing Symtab')
         mmci = MainMenuContentItem()
-        tab = Table()
-        tab.titles = ['Address', 'Name']
-        for sym in lib.symbol_table.table:
-            tab.rows.append([hex(sym.address), sym.fullname])
+        tab = VirtualTable(lib.symbol_table.table, lambda sym: [hex(sym.address), sym.fullname], ['Address', 'Name'])
+        tab.preheat()
         mmci.lines.append(tab)
 
         menuitem = SidebarMenuItem("Symbol Table", mmci, parent)
@@ -1838,19 +2233,35 @@ class KToolMachOLoader:
         menuitem.parse_mmc()
         return menuitem
 
+    @staticmethod
+    def objc_image(lib, callback=None) -> ObjCImage:
+        """
+        Get the ObjCImage for an image, loading it the first time it's asked for
+
+        :param lib: Image
+        :param callback: Status callback
+        :return: ObjCImage for the image
+        """
+        if id(lib) not in KToolMachOLoader.OBJC_IMAGES:
+            callback(f'Slice {KToolMachOLoader.CUR_SL}/{KToolMachOLoader.SL_CNT}\nLoading ObjC Metadata')
+            KToolMachOLoader.OBJC_IMAGES[id(lib)] = (lib, ObjCImage.from_image(lib))
+        return KToolMachOLoader.OBJC_IMAGES[id(lib)][1]
+
     @staticmethod
     def objc_items(lib, parent=None, callback=None):
-        objc_lib = ObjCImage.from_image(lib)
+        objc_lib = KToolMachOLoader.objc_image(lib, callback)
 
-        return [KToolMachOLoader.objc_headers(objc_lib, parent, callback)]
+        return KToolMachOLoader.objc_headers(objc_lib, parent, callback)
 
     @staticmethod
     def swift_items(lib, parent=None, callback=None):
-        return [KToolMachOLoader.swift_types(lib, parent, callback)]
+        objc_lib = KToolMachOLoader.objc_image(lib, callback)
+
+        return KToolMachOLoader.swift_types(objc_lib, parent, callback)
 
     @staticmethod
     def swift_types(lib, parent=None, callback=None):
-        callback(f'Loading Swift Types')
+        callback(f'Slice {KToolMachOLoader.CUR_SL}/{KToolMachOLoader.SL_CNT}\nLoading Swift Types')
         root_mmci = MainMenuContentItem()
 
         types = ktool.ktool.load_swift_metadata(lib).types
@@ -1890,12 +2301,18 @@ class KToolMachOLoader:
         callback(f'Slice {KToolMachOLoader.CUR_SL}/{KToolMachOLoader.SL_CNT}\nProcessing Imports')
         mmci = MainMenuContentItem()
 
-        table = Table()
-        table.titles = ['Address', 'Symbol', 'Library']
+        def row(symbol):
+            # Rows are generated while drawing, so a special ordinal can't be allowed to raise here
+            try:
+                ordinal = int(symbol.ordinal)
+            except ValueError:
+                # opcode binds carry the install name they resolved to already
+                return [hex(symbol.address), symbol.fullname, symbol.ordinal]
+            install_name = lib.linked_images[ordinal - 1].install_name if 0 < ordinal <= len(lib.linked_images) else ''
+            return [hex(symbol.address), symbol.fullname, install_name]
 
-        for symbol in lib.imports:
-            table.rows.append(
-                [hex(symbol.address), symbol.fullname, lib.linked_images[int(symbol.ordinal) - 1].install_name])
+        table = VirtualTable(lib.imports, row, ['Address', 'Symbol', 'Library'])
+        table.preheat()
         mmci.lines.append(table)
 
         menuitem = SidebarMenuItem("Imports", mmci, parent)
@@ -1908,11 +2325,8 @@ class KToolMachOLoader:
         callback(f'Slice {KToolMachOLoader.CUR_SL}/{KToolMachOLoader.SL_CNT}\nProcessing Exports')
         mmci = MainMenuContentItem()
 
-        table = Table()
-        table.titles = ['Address', 'Symbol']
-
-        for symbol in lib.exports:
-            table.rows.append([hex(symbol.address), symbol.fullname])
+        table = VirtualTable(lib.exports, lambda symbol: [hex(symbol.address), symbol.fullname], ['Address', 'Symbol'])
+        table.preheat()
 
         mmci.lines.append(table)
 
@@ -1924,8 +2338,7 @@ class KToolMachOLoader:
     @staticmethod
     def get_header_item(text, name):
         mmci = MainMenuContentItem()
-        formatter = Terminal256Formatter() if KToolMachOLoader.SUPPORTS_256 else TerminalFormatter()
-        text = highlight(text, ObjectiveCLexer(), formatter)
+        text = highlight_header_text(text, KToolMachOLoader.SUPPORTS_256)
         lines = text.split('\n')
         mmci.lines = lines
         h_menu_item = SidebarMenuItem(name, mmci, None)
@@ -1933,8 +2346,7 @@ class KToolMachOLoader:
 
     @staticmethod
     def get_header_text(text):
-        formatter = Terminal256Formatter() if KToolMachOLoader.SUPPORTS_256 else TerminalFormatter()
-        text = highlight(text, ObjectiveCLexer(), formatter)
+        text = highlight_header_text(text, KToolMachOLoader.SUPPORTS_256)
 
         lines = []
 
@@ -1943,29 +2355,43 @@ class KToolMachOLoader:
 
         return lines
 
+    @staticmethod
+    def get_item_header_text(item, objc_lib, type_resolver, head):
+        try:
+            text = header_for(item, objc_lib, type_resolver, False, head).text
+        except Exception as ex:
+            if KToolMachOLoader.HARD_FAIL:
+                raise ex
+            return [f'Failed to generate header: {ex}']
+        return KToolMachOLoader.get_header_text(text)
+
     @staticmethod
     def objc_headers(objc_lib, parent=None, callback=None):
-        generator = HeaderGenerator(objc_lib)
+        header_items = HeaderGenerator.header_items(objc_lib)
+        image_headers = HeaderGenerator.image_headers(objc_lib, dict.fromkeys(name for name, _ in header_items))
         hnci = MainMenuContentItem()
-        hnci.lines = generator.headers.keys()
+        hnci.lines = [name for name, _ in header_items] + list(image_headers.keys())
         menuitem = SidebarMenuItem("ObjC Headers", hnci, parent)
-        count = len(generator.headers.keys())
         callback(
-            f'Slice {KToolMachOLoader.CUR_SL}/{KToolMachOLoader.SL_CNT}\nProcessing {count} ObjC Headers')
+            f'Slice {KToolMachOLoader.CUR_SL}/{KToolMachOLoader.SL_CNT}\nProcessing {len(hnci.lines)} ObjC Headers')
 
-        items = []
-        i = 1
-        for header_name, header in generator.headers.items():
-            callback(
-                f'Slice {KToolMachOLoader.CUR_SL}/{KToolMachOLoader.SL_CNT}\nProcessing {count} ObjC Headers\n{i}/{count}')
+        # Header text is generated (and highlighted) when it's displayed, not here
+        type_resolver = TypeResolver(objc_lib)
+        head = HeaderUtils.header_head(objc_lib.image)
+
+        def header_item(header_name, target, *target_args):
             mmci = MainMenuContentItem()
             buffer = LazilyProcessedTextBuffer()
-            buffer.target = KToolMachOLoader.get_header_text
-            buffer.target_args = [str(header)]
+            buffer.keep = False
+            buffer.target = target
+            buffer.target_args = list(target_args)
             mmci.lines = [buffer]
-            sbmi = SidebarMenuItem(header_name, mmci, menuitem)
-            items.append(sbmi)
-            i += 1
+            return SidebarMenuItem(header_name, mmci, menuitem)
+
+        items = [header_item(header_name, KToolMachOLoader.get_item_header_text, item, objc_lib, type_resolver, head)
+                 for header_name, item in header_items]
+        items += [header_item(header_name, KToolMachOLoader.get_header_text, str(header))
+                  for header_name, header in image_headers.items()]
 
         menuitem.children = items
 
@@ -1976,38 +2402,35 @@ class KToolMachOLoader:
 class KToolKernelCacheLoader(KToolMachOLoader):
 
     @staticmethod
-    def slice_item(macho_slice, callback):
-        loaded_image = MachOImageLoader.load(macho_slice)
-        slice_nick = f'Kernel Cache'
+    def slice_item(macho_slice, callback, loaded_image=None, publish=None):
+        publish = publish if publish is not None else KToolMachOLoader.attach
         callback(f'Kernel Cache\nLoading MachO Image')
         slice_item = SidebarMenuItem(f'Kernel Cache', None, None)
         kcache = KernelCache(macho_slice.macho_file)
+        loaded_image = kcache.mach_kernel
         slice_item.content = KToolKernelCacheLoader._file(kcache, slice_item, callback).content
+        slice_item.show_children = True
+        publish(None, slice_item)
+
         items = [KToolMachOLoader.load_cmds,
-                 KToolMachOLoader.segments,
-                 KToolMachOLoader.symtab]
+                 KToolMachOLoader.segments]
 
         for item in items:
             try:
-                slice_item.children.append(item(loaded_image, slice_item, callback))
+                publish(slice_item, item(loaded_image, slice_item, callback))
+            except LoadCancelledException:
+                raise
             except Exception as ex:
                 if KToolMachOLoader.HARD_FAIL:
                     raise ex
                 else:
                     pass
 
-        kernel_items = [KToolKernelCacheLoader.get_kexts]
-
-        for item in kernel_items:
-            try:
-                slice_item.children.append(item(kcache, slice_item, callback))
-            except Exception as ex:
-                if KToolMachOLoader.HARD_FAIL:
-                    raise ex
-                else:
-                    pass
+        lazy_items = [("Symbol Table", KToolMachOLoader.symtab, loaded_image),
+                      ("KEXTs", KToolKernelCacheLoader.get_kexts, kcache)]
+        for name, builder, lib in lazy_items:
+            publish(slice_item, KToolMachOLoader.lazy_item(name, builder, lib, slice_item))
 
-        slice_item.show_children = True
         return slice_item
 
     @staticmethod
@@ -2042,36 +2465,35 @@ class KToolKernelCacheLoader(KToolMachOLoader):
         hnci = MainMenuContentItem()
         hnci.lines = [kext.name for kext in kcache.kexts]
         menuitem = SidebarMenuItem("KEXTs", hnci, parent)
-        count = len(kcache.kexts)
         callback(
-            f'Kernel Cache\nProcessing {count} KEXTs')
+            f'Kernel Cache\nProcessing {len(kcache.kexts)} KEXTs')
 
-        items = []
-        i = 1
-        for kext in kcache.kexts:
-            callback(
-                f'Kernel Cache\nProcessing {count} KEXT \n{i}/{count}')
-            mmci = MainMenuContentItem()
-            mmci.lines = []
-            mmci.lines.append(f'ID: {kext.name}')
-            mmci.lines.append(f'Embedded Version: {kext.version}')
+        # a kext's full bundle info is parsed out of the prelink info again, so that's only done once it's looked at
+        menuitem.children = [KToolMachOLoader.lazy_item(kext.name, KToolKernelCacheLoader.kext_info, (kcache, kext),
+                                                        menuitem) for kext in kcache.kexts]
 
-            if kext.prelink_info:
-                bundle_text = f"Executable Name: {kext.executable_name}\n{kext.info_string}\nVersion: {kext.version_str}\nStart Address: {hex(kext.start_addr | (0xffff000000000000 if kcache.mach_kernel.vm.detag_kern_64 else 0))}".split(
-                    '\n')
-                bundle_text += ['', '']
+        menuitem.parse_mmc()
+        return menuitem
 
-                bundle_text += pprint.pformat(kext.prelink_info).split('\n')
+    @staticmethod
+    def kext_info(lib, parent=None, callback=None):
+        kcache, kext = lib
+        callback(f'Kernel Cache\nLoading {kext.name}')
+        mmci = MainMenuContentItem()
+        mmci.lines = []
+        mmci.lines.append(f'ID: {kext.name}')
+        mmci.lines.append(f'Embedded Version: {kext.version}')
 
-                mmci.lines += bundle_text
-            sbmi = SidebarMenuItem(kext.name, mmci, menuitem)
-            items.append(sbmi)
-            i += 1
+        if kext.prelink_info:
+            bundle_text = f"Executable Name: {kext.executable_name}\n{kext.info_string}\nVersion: {kext.version_str}\nStart Address: {hex(kext.start_addr | (0xffff000000000000 if kcache.mach_kernel.vm.detag_kern_64 else 0))}".split(
+                '\n')
+            bundle_text += ['', '']
 
-        menuitem.children = items
+            bundle_text += pprint.pformat(kcache.bundle_info(kext.id)).split('\n')
 
-        menuitem.parse_mmc()
-        return menuitem
+            mmci.lines += bundle_text
+
+        return SidebarMenuItem(kext.name, mmci, parent)
 
 
 # # # # #
@@ -2113,6 +2535,10 @@ class KToolScreen:
 
         self.is_showing_menu_overlay = False
 
+        # Builds the sidebar for the current file in the background
+        self.loader = None
+        self.file_browser.callback = self.open_file
+
         self.active_key_handler = self.sidebar
         self.key_handlers = []
         self.mouse_handlers = []
@@ -2189,6 +2615,8 @@ class KToolScreen:
             return
 
         item = self.sidebar.processed_items[self.sidebar.selected_index]
+        if item.loader is not None and not item.loading:
+            self.load_item(item)
         self.mainscreen.scroll_view_text_buffer.lines = item.content.lines
 
         if self.mainscreen.currently_displayed_index != self.sidebar.selected_index:
@@ -2197,10 +2625,138 @@ class KToolScreen:
             self.mainscreen.scroll_view_text_buffer.process_lines()
         self.mainscreen.set_tab_name(item.name)
 
-    def update_load_status(self, msg):
-        self.loader_status.status_string = msg
+    def start_loader(self, name):
+        """
+        Cancel whatever is currently loading, clear out the sidebar, and get a fresh background loader going.
+
+        :param name: Name of what's being loaded
+        :return: The new loader
+        """
+        if self.loader is not None:
+            self.loader.cancel()
+        self.loader = BackgroundLoader()
+
+        self.sidebar.items = []
+        self.sidebar.selected_index = 0
+        self.sidebar.update_item_listing()
+        self.mainscreen.currently_displayed_index = -1
+        self.mainscreen.scroll_view_text_buffer.lines = [f'Loading {name}...']
+        self.mainscreen.scroll_view_text_buffer.process_lines()
+        self.mainscreen.set_tab_name(name)
+        self.loader_status.status_string = f'Loading {name}...'
+        self.loader_status.draw = True
+
+        return self.loader
+
+    def attach_item(self, parent, item):
+        """
+        Publish function for the background loader; runs on the UI thread.
+        """
+        if parent is None:
+            self.sidebar.items.append(item)
+            # The overlay covers the screen until there's something to look at
+            self.loader_status.draw = False
+        else:
+            parent.children.append(item)
+        self.refresh_sidebar()
+
+    def refresh_sidebar(self, changed_item=None):
+        """
+        Re-list the sidebar after the loader added to it, keeping the same item selected.
+
+        :param changed_item: Item whose content was replaced, if any
+        :return:
+        """
+        processed_items = self.sidebar.processed_items
+        selected = processed_items[self.sidebar.selected_index] if processed_items else None
+        self.sidebar.update_item_listing()
+        if selected is None or selected is changed_item:
+            # Nothing was being displayed, or what was is out of date
+            self.mainscreen.currently_displayed_index = -1
+        if selected is not None and selected in self.sidebar.processed_items:
+            index = self.sidebar.processed_items.index(selected)
+            if self.mainscreen.currently_displayed_index == self.sidebar.selected_index:
+                self.mainscreen.currently_displayed_index = index
+            self.sidebar.select_item(index)
+
+    def load_item(self, item):
+        """
+        Have the background loader build a placeholder sidebar item.
+
+        :param item: Item with a .loader
+        :return:
+        """
+        builder, lib = item.loader
+        item.loading = True
+        loader = self.loader
+        loader.submit(builder, (lib, item.parent, loader.update_status),
+                      on_done=lambda result: self.fill_item(item, result))
+
+    def fill_item(self, item, result):
+        if isinstance(result, Exception):
+            if self.hard_fail:
+                raise result
+            result = SidebarMenuItem(item.name, MainMenuContentItem([f'Failed to load {item.name}: {result}']))
+        item.fill(result)
+        self.refresh_sidebar(item)
+
+    def loaded(self, result):
+        if isinstance(result, Exception):
+            if self.hard_fail:
+                raise result
+            self.mainscreen.scroll_view_text_buffer.lines = [f'Failed to load file: {result}']
+            self.mainscreen.currently_displayed_index = -1
+        self.loader_status.draw = False
+
+    def poll_loader(self):
+        """
+        Pick up whatever the background loader has finished, and have any placeholders that were expanded loaded.
+
+        :return:
+        """
+        if self.loader is None:
+            return
+        self.loader.poll()
+        for item in self.sidebar.processed_items:
+            if item.show_children and item.loader is not None and not item.loading:
+                self.load_item(item)
+        self.footerbar.status_text = self.loader.status if self.loader.busy else ''
+        self.loader_status.status_string = self.loader.status or self.loader_status.status_string
+
+    def open_file(self, filename, mmap=True):
+        """
+        Start loading a file into the GUI, replacing whatever is currently loaded.
+
+        :param filename:
+        :param mmap:
+        :return:
+        """
+        loader = self.start_loader(filename)
+
+        def publish(parent, item):
+            loader.publish(self.attach_item, parent, item)
+
+        def contents_for_file():
+            with open(filename, 'rb') as fd:
+                first1k = fd.read(0x1000)
+                fd.seek(0)
+                if b'__BOOTDATA\x00\x00\x00\x00\x00\x00' in first1k:
+                    return KToolKernelCacheLoader.contents_for_file(fd, loader.update_status, publish=publish)
+                return KToolMachOLoader.contents_for_file(fd, loader.update_status, mmap, publish=publish)
+
+        loader.submit(contents_for_file, (), on_done=self.loaded)
+
+    def show(self):
+        self.active_key_handler = self.sidebar
+        self.key_handlers = [self.sidebar, self.mainscreen, self.titlebar, self.file_browser]
+        self.mouse_handlers = [self.sidebar, self.titlebar, self.title_menu_overlay, self.debug_menu,
+                               self.input_overlay, self.help_menu]
+        self.input_overlay.draw = False
+
         self.redraw_all()
 
+        self.program_loop()
+
     def load_image(self, image, filename):
         """
          Load an Image into the GUI.
@@ -2210,26 +2766,15 @@ class KToolScreen:
          """
         try:
             # KToolMachOLoader.SUPPORTS_256 = self.supported_colors > 200
+            loader = self.start_loader(filename)
 
-            self.loader_status.draw = True
-            self.mainscreen.scroll_view_text_buffer.lines = [f'Loading {filename}...']
-            self.redraw_all()
-
-            self.mainscreen.set_tab_name(filename)
-
-            for item in KToolMachOLoader.contents_for_image(image, self.update_load_status):
-                self.sidebar.add_menu_item(item)
-
-            self.active_key_handler = self.sidebar
-            self.key_handlers = [self.sidebar, self.mainscreen, self.titlebar, self.file_browser]
-            self.mouse_handlers = [self.sidebar, self.titlebar, self.title_menu_overlay, self.debug_menu,
-                                   self.input_overlay, self.help_menu]
-            self.loader_status.draw = False
-            self.input_overlay.draw = False
+            def publish(parent, item):
+                loader.publish(self.attach_item, parent, item)
 
-            self.redraw_all()
+            loader.submit(KToolMachOLoader.contents_for_image, (image, loader.update_status, publish),
+                          on_done=self.loaded)
 
-            self.program_loop()
+            self.show()
 
         except Exception as ex:
             self.teardown()
@@ -2239,40 +2784,16 @@ class KToolScreen:
         """
         Load a file by filename into the GUI.
 
+        Items are loaded in the background and show up in the sidebar as they're built.
+
         :param filename:
         :return:
         """
         try:
             # KToolMachOLoader.SUPPORTS_256 = self.supported_colors > 200
-            self.loader_status.draw = True
-            self.mainscreen.scroll_view_text_buffer.lines = [f'Loading {filename}...']
-            self.redraw_all()
-
-            fd = open(filename, 'rb')
-
-            self.mainscreen.set_tab_name(filename)
-
-            filename_base = os.path.basename(filename)
-
-            first1k = fd.read(0x1000)
-            fd.seek(0)
-            if b'__BOOTDATA\x00\x00\x00\x00\x00\x00' in first1k:
-                for item in KToolKernelCacheLoader.contents_for_file(fd, self.update_load_status):
-                    self.sidebar.add_menu_item(item)
-            else:
-                for item in KToolMachOLoader.contents_for_file(fd, self.update_load_status, mmap):
-                    self.sidebar.add_menu_item(item)
-
-            self.active_key_handler = self.sidebar
-            self.key_handlers = [self.sidebar, self.mainscreen, self.titlebar, self.file_browser]
-            self.mouse_handlers = [self.sidebar, self.titlebar, self.title_menu_overlay, self.debug_menu,
-                                   self.input_overlay, self.help_menu]
-            self.loader_status.draw = False
-            self.input_overlay.draw = False
+            self.open_file(filename, mmap)
 
-            self.redraw_all()
-
-            self.program_loop()
+            self.show()
 
         except Exception as ex:
             self.teardown()
@@ -2407,7 +2928,10 @@ class KToolScreen:
             # So, rebuild our contexts here with the new screen size.
             raise RebuildAllException
 
-        if c == curses.KEY_MOUSE:
+        if self.mainscreen.goto_input is not None:
+            self.mainscreen.handle_key_press(c)
+
+        elif c == curses.KEY_MOUSE:
             _, mx, my, _, _ = curses.getmouse()
             self.handle_mouse(mx, my)
 
@@ -2447,9 +2971,15 @@ class KToolScreen:
 
         while True:
             try:
+                # While the loader is busy, wake up every so often to show what it's finished
+                busy = self.loader is not None and self.loader.busy
+                self.stdscr.timeout(LOADER_POLL_INTERVAL if busy else -1)
                 c = self.stdscr.getch()
 
-                self.handle_key_press(c)
+                if c != -1:
+                    self.handle_key_press(c)
+
+                self.poll_loader()
 
                 self.redraw_all()
 
@@ -2507,6 +3037,8 @@ class KToolScreen:
                 self.teardown()
                 raise ex
 
+        if self.loader is not None:
+            self.loader.cancel()
         self.teardown()
 
 
@@ -0,0 +1,207 @@
+#
+#  ktool | lib0cyn
+#  kmsgpack.py
+#
+#  Minimal MessagePack (https://msgpack.org) encoder/decoder.
+#
+#  Only the types ktool actually serializes are supported (None, bool, int, float, str, bytes, list/tuple, dict).
+#  Output is plain msgpack, so anything with a real msgpack library can read it back.
+#
+#  This file is part of ktool. ktool is free software that
+#  is made available under the MIT license. Consult the
+#  file "LICENSE" that is distributed together with this file
+#  for the exact licensing terms.
+#
+#  Copyright (c) 0cyn 2022.
+#
+
+import struct
+from typing import Iterator, Union
+
+
+def _pack_into(obj, out: bytearray):
+    if obj is None:
+        out.append(0xc0)
+    elif obj is True:
+        out.append(0xc3)
+    elif obj is False:
+        out.append(0xc2)
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(obj)
+        elif -0x20 <= obj < 0:
+            out.append(obj & 0xff)
+        elif obj >= 0:
+            if obj <= 0xff:
+                out += b'\xcc' + obj.to_bytes(1, 'big')
+            elif obj <= 0xffff:
+                out += b'\xcd' + obj.to_bytes(2, 'big')
+            elif obj <= 0xffffffff:
+                out += b'\xce' + obj.to_bytes(4, 'big')
+            elif obj <= 0xffffffffffffffff:
+                out += b'\xcf' + obj.to_bytes(8, 'big')
+            else:
+                raise OverflowError(f'{obj} is too large to pack')
+        else:
+            if obj >= -0x80:
+                out += b'\xd0' + obj.to_bytes(1, 'big', signed=True)
+            elif obj >= -0x8000:
+                out += b'\xd1' + obj.to_bytes(2, 'big', signed=True)
+            elif obj >= -0x80000000:
+                out += b'\xd2' + obj.to_bytes(4, 'big', signed=True)
+            elif obj >= -0x8000000000000000:
+                out += b'\xd3' + obj.to_bytes(8, 'big', signed=True)
+            else:
+                raise OverflowError(f'{obj} is too small to pack')
+    elif isinstance(obj, float):
+        out += b'\xcb' + struct.pack('>d', obj)
+    elif isinstance(obj, str):
+        raw = obj.encode('utf-8', errors='surrogateescape')
+        length = len(raw)
+        if length < 0x20:
+            out.append(0xa0 | length)
+        elif length <= 0xff:
+            out += b'\xd9' + length.to_bytes(1, 'big')
+        elif length <= 0xffff:
+            out += b'\xda' + length.to_bytes(2, 'big')
+        else:
+            out += b'\xdb' + length.to_bytes(4, 'big')
+        out += raw
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        length = len(obj)
+        if length <= 0xff:
+            out += b'\xc4' + length.to_bytes(1, 'big')
+        elif length <= 0xffff:
+            out += b'\xc5' + length.to_bytes(2, 'big')
+        else:
+            out += b'\xc6' + length.to_bytes(4, 'big')
+        out += obj
+    elif isinstance(obj, (list, tuple)):
+        length = len(obj)
+        if length < 0x10:
+            out.append(0x90 | length)
+        elif length <= 0xffff:
+            out += b'\xdc' + length.to_bytes(2, 'big')
+        else:
+            out += b'\xdd' + length.to_bytes(4, 'big')
+        for item in obj:
+            _pack_into(item, out)
+    elif isinstance(obj, dict):
+        length = len(obj)
+        if length < 0x10:
+            out.append(0x80 | length)
+        elif length <= 0xffff:
+            out += b'\xde' + length.to_bytes(2, 'big')
+        else:
+            out += b'\xdf' + length.to_bytes(4, 'big')
+        for key, value in obj.items():
+            _pack_into(key, out)
+            _pack_into(value, out)
+    else:
+        raise TypeError(f'Cannot pack object of type {obj.__class__.__name__}')
+
+
+def packb(obj) -> bytes:
+    """
+    Encode an object as msgpack
+
+    :param obj: Object to encode
+    :return: Encoded bytes
+    """
+    out = bytearray()
+    _pack_into(obj, out)
+    return bytes(out)
+
+
+_FIXED_FORMATS = {
+    0xcc: ('>B', 1), 0xcd: ('>H', 2), 0xce: ('>I', 4), 0xcf: ('>Q', 8),
+    0xd0: ('>b', 1), 0xd1: ('>h', 2), 0xd2: ('>i', 4), 0xd3: ('>q', 8),
+    0xca: ('>f', 4), 0xcb: ('>d', 8)
+}
+
+
+def _unpack_from(data, offset):
+    byte = data[offset]
+    offset += 1
+
+    if byte < 0x80:
+        return byte, offset
+    if byte >= 0xe0:
+        return byte - 0x100, offset
+    if byte == 0xc0:
+        return None, offset
+    if byte == 0xc2:
+        return False, offset
+    if byte == 0xc3:
+        return True, offset
+    if byte in _FIXED_FORMATS:
+        fmt, size = _FIXED_FORMATS[byte]
+        return struct.unpack_from(fmt, data, offset)[0], offset + size
+
+    if 0xa0 <= byte <= 0xbf or byte in (0xd9, 0xda, 0xdb):
+        if byte <= 0xbf:
+            length = byte & 0x1f
+        else:
+            size = {0xd9: 1, 0xda: 2, 0xdb: 4}[byte]
+            length = int.from_bytes(data[offset:offset + size], 'big')
+            offset += size
+        return bytes(data[offset:offset + length]).decode('utf-8', errors='surrogateescape'), offset + length
+
+    if byte in (0xc4, 0xc5, 0xc6):
+        size = {0xc4: 1, 0xc5: 2, 0xc6: 4}[byte]
+        length = int.from_bytes(data[offset:offset + size], 'big')
+        offset += size
+        return bytes(data[offset:offset + length]), offset + length
+
+    if 0x90 <= byte <= 0x9f or byte in (0xdc, 0xdd):
+        if byte <= 0x9f:
+            length = byte & 0xf
+        else:
+            size = 2 if byte == 0xdc else 4
+            length = int.from_bytes(data[offset:offset + size], 'big')
+            offset += size
+        items = []
+        for _ in range(length):
+            item, offset = _unpack_from(data, offset)
+            items.append(item)
+        return items, offset
+
+    if 0x80 <= byte <= 0x8f or byte in (0xde, 0xdf):
+        if byte <= 0x8f:
+            length = byte & 0xf
+        else:
+            size = 2 if byte == 0xde else 4
+            length = int.from_bytes(data[offset:offset + size], 'big')
+            offset += size
+        items = {}
+        for _ in range(length):
+            key, offset = _unpack_from(data, offset)
+            value, offset = _unpack_from(data, offset)
+            items[key] = value
+        return items, offset
+
+    raise ValueError(f'Unsupported msgpack type byte {hex(byte)} at offset {hex(offset - 1)}')
+
+
+def unpackb(data: Union[bytes, bytearray, memoryview]):
+    """
+    Decode a single msgpack encoded object
+
+    :param data: Encoded bytes
+    :return: Decoded object
+    """
+    obj, _ = _unpack_from(data, 0)
+    return obj
+
+
+def unpack_stream(data: Union[bytes, bytearray, memoryview]) -> Iterator:
+    """
+    Decode a sequence of concatenated msgpack objects, one at a time.
+
+    :param data: Encoded bytes
+    :return: Iterator over each decoded object
+    """
+    offset = 0
+    while offset < len(data):
+        obj, offset = _unpack_from(data, offset)
+        yield obj
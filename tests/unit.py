@@ -154,6 +154,1045 @@ class StructTestCase(unittest.TestCase):
             '{:08b}'.format(0b01011010101010101111111100100100)[::-1], 2)
 
 
+class MsgPackTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        from lib0cyn.kmsgpack import packb, unpackb, unpack_stream
+        values = [None, True, False, 0, 0x7f, 0x80, 0xffff, 0x1_0000_0000, -1, -0x21, -0x8000_0000_0000, 1.5, '',
+                  'a' * 0x20, 'b' * 0x10000, b'\x00\x01', list(range(0x20)), {'k': [1, {'n': 'v'}], 'x': None}]
+        for value in values:
+            self.assertEqual(unpackb(packb(value)), value)
+        self.assertEqual(list(unpack_stream(b''.join(packb(v) for v in values))), values)
+
+
+class BatchTestCase(unittest.TestCase):
+    def test_timeout_isnt_swallowed(self):
+        import signal
+        import time
+        from tempfile import NamedTemporaryFile
+        from ktool import batch
+
+        if not hasattr(signal, 'SIGALRM'):
+            self.skipTest('No SIGALRM')
+
+        def stubborn(fp):
+            # like the loaders skipping over bad metadata
+            while True:
+                try:
+                    time.sleep(0.05)
+                except Exception:
+                    pass
+
+        previous_handler = signal.getsignal(signal.SIGALRM)
+        batch._BATCH_FUNCS['stubborn'] = stubborn
+        try:
+            with NamedTemporaryFile() as fp:
+                result = batch.process_file('stubborn', fp.name, timeout=1)
+        finally:
+            del batch._BATCH_FUNCS['stubborn']
+        self.assertEqual(result.status, 'timeout')
+        self.assertIs(signal.getsignal(signal.SIGALRM), previous_handler)
+
+    def test_serial_keeps_settings(self):
+        from tempfile import TemporaryDirectory
+        from ktool import batch
+        from ktool.util import ignore
+        with TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'libpeople.dylib'), 'wb') as fp:
+                fp.write(build_macho('/usr/lib/libpeople.dylib', ['_person_new'], ['_malloc']))
+            log_level, fixup_workers = log.LOG_LEVEL, opts.FIXUP_WORKERS
+            opts.FIXUP_WORKERS = 3
+            try:
+                results = list(batch.batch_process(directory, 'symbols', jobs=1, force_load=True))
+                # processed in this process, which keeps the log level, options and malformed handling it had
+                self.assertEqual([result.status for result in results], ['ok'])
+                self.assertEqual((log.LOG_LEVEL, opts.FIXUP_WORKERS, ignore.MALFORMED), (log_level, 3, False))
+            finally:
+                opts.FIXUP_WORKERS = fixup_workers
+
+    def test_java_class_isnt_fat(self):
+        from ktool.util import detect_filetype
+        # 0xcafebabe, then minor and major version
+        self.assertIsNone(detect_filetype(BytesIO(b'\xca\xfe\xba\xbe\x00\x00\x00\x34' + bytes(0x18))))
+        self.assertEqual(detect_filetype(BytesIO(b'\xca\xfe\xba\xbe\x00\x00\x00\x02' + bytes(0x18))),
+                         FileType.FatMachOFileType)
+
+
+class TableTestCase(unittest.TestCase):
+    ROWS = [[hex(i), f'sym_{i}' * (i % 5), ('word ' * (i % 30)) + ('\nline' if i % 7 == 0 else '')]
+            for i in range(0x180)]
+
+    def test_print_all_matches_fetch_all(self):
+        from io import StringIO
+        for dividers in [False, True]:
+            for rows in [self.ROWS, VirtualRows(self.ROWS, list), (row for row in self.ROWS)]:
+                table = Table(dividers=dividers)
+                table.titles = ['Address', 'Name', 'Data']
+                table.rows = rows
+                printed = StringIO()
+                table.print_all(100, file=printed)
+
+                expected = StringIO()
+                table.rows = self.ROWS
+                ktool_print(table.fetch_all(100), file=expected)
+                self.assertEqual(printed.getvalue(), expected.getvalue())
+
+    def test_virtual_table_matches_table(self):
+        from ktool.window import VirtualTable
+        titles = ['Address', 'Name', 'Data']
+        # a couple of full pages, and a partial one
+        items = list(range(VirtualTable.PAGE_ROWS * 2 + 0x15))
+
+        table = Table()
+        table.titles = titles
+        table.rows = [self.ROWS[i] for i in items]
+        table.preheat()
+        virtual_table = VirtualTable(items, lambda i: self.ROWS[i], titles)
+        virtual_table.preheat()
+
+        page = VirtualTable.PAGE_ROWS
+        windows = [(0, 10), (page - 4, 10), (page - 4, page + 8), (len(items) - 10, 10), (len(items) - 5, 5),
+                   (0, len(items)), (page - 4, 10)]
+        for screen_width in [80, 140]:
+            for row_start, row_count in windows:
+                with self.subTest(screen_width=screen_width, row_start=row_start, row_count=row_count):
+                    self.assertEqual(virtual_table.fetch(row_start, row_count, screen_width),
+                                     table.fetch(row_start, row_count, screen_width))
+
+
+class HexDumpTableTestCase(unittest.TestCase):
+    def test_for_region(self):
+        from types import SimpleNamespace
+        from ktool.window import HexDumpTable
+        data = bytearray(b'hexdump!' * 0x400)
+        data[0x1000:0x1010] = bytes(range(0x10))
+        # __DATA-ish: file 0x1000 mapped at 0x100004000
+        vm = VM(0x1000)
+        vm.map_pages(0, 0x100000000, 0x1000)
+        vm.map_pages(0x1000, 0x100004000, 0x1000)
+        image = SimpleNamespace(slice=SimpleNamespace(file=SimpleNamespace(
+            size=len(data), read_bytes=lambda offset, count: bytes(data[offset:offset + count]))), vm=vm)
+
+        # 0x15 bytes, so two full rows and a short one
+        table = HexDumpTable.for_region(image, 0x1000, 0x15, vm_address=0x100004000)
+        self.assertEqual(len(table.rows), 3)
+        self.assertEqual(table.rows[0], ['0x100004000', '00010203  04050607  ', '. . . .   . . . .   '])
+        self.assertEqual(table.rows[2], ['0x100004010', '68657864  75  ', 'h e x d   u   '])
+
+        self.assertEqual(table.row_for_vm_address(0x100004000), 0)
+        self.assertEqual(table.row_for_vm_address(0x100004011), 2)
+        for vm_address in [0x100004015, 0x100000100]:
+            with self.assertRaises(ValueError):
+                table.row_for_vm_address(vm_address)
+
+        # regions are clamped to the end of the file, and rows are labeled by file offset without a VM address
+        table = HexDumpTable.for_region(image, 0x1ffc, 0x100)
+        self.assertEqual(len(table.rows), 1)
+        self.assertEqual(table.rows[0], ['0x1ffc', '756d7021  ', 'u m p !   '])
+        with self.assertRaises(ValueError):
+            HexDumpTable().row_for_vm_address(0x100004000)
+
+
+class BackgroundLoaderTestCase(unittest.TestCase):
+    @staticmethod
+    def _wait(loader, done):
+        from time import monotonic
+        deadline = monotonic() + 10
+        while not done() and monotonic() < deadline:
+            loader.poll()
+
+    def test_publish_order(self):
+        from ktool.window import BackgroundLoader
+        loader = BackgroundLoader()
+        applied = []
+
+        def task(name):
+            for index in range(3):
+                loader.update_status(f'{name} {index}')
+                loader.publish(applied.append, (name, index))
+            return name
+
+        def fail():
+            raise ValueError('bad image')
+
+        loader.submit(task, ('a',), on_done=lambda result: applied.append(('done', result)))
+        loader.submit(fail, (), on_done=lambda result: applied.append(('done', type(result))))
+        loader.submit(task, ('b',), on_done=lambda result: applied.append(('done', result)))
+        self.assertTrue(loader.busy)
+        self._wait(loader, lambda: not loader.busy)
+
+        # everything a task publishes is applied before it's done, and tasks run in the order they were submitted
+        self.assertEqual(applied, [('a', 0), ('a', 1), ('a', 2), ('done', 'a'), ('done', ValueError),
+                                   ('b', 0), ('b', 1), ('b', 2), ('done', 'b')])
+        self.assertEqual(loader.status, 'b 2')
+        loader.cancel()
+
+    def test_cancel(self):
+        import threading
+        from ktool.window import BackgroundLoader
+        loader = BackgroundLoader()
+        applied = []
+        started, resume = threading.Event(), threading.Event()
+
+        def task():
+            loader.publish(applied.append, 'before')
+            started.set()
+            resume.wait(10)
+            # a cancelled load bails out the next time it reports its status
+            loader.update_status('after')
+            loader.publish(applied.append, 'after')
+
+        loader.submit(task, (), on_done=applied.append)
+        loader.submit(applied.append, ('next',), on_done=applied.append)
+        started.wait(10)
+        loader.cancel()
+        resume.set()
+        loader._thread.join(10)
+
+        self.assertFalse(loader._thread.is_alive())
+        self.assertFalse(loader.poll())
+        self.assertEqual(applied, [])
+        self.assertNotEqual(loader.status, 'after')
+
+
+class ArchiveWriterTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        import tarfile
+        import zipfile
+        from tempfile import TemporaryDirectory
+        files = {'Person.h': '@interface Person\n@end\n', 'sub/Pet.tbd': b'--- !tapi-tbd\n'}
+        with TemporaryDirectory() as directory:
+            for name in ['out.zip', 'out.tar', 'out.tar.gz']:
+                path = os.path.join(directory, name)
+                with ArchiveWriter(path) as archive:
+                    for file_name, data in files.items():
+                        archive.add(file_name, data)
+                if name.endswith('.zip'):
+                    with zipfile.ZipFile(path) as fp:
+                        read = {file_name: fp.read(file_name) for file_name in fp.namelist()}
+                else:
+                    with tarfile.open(path) as fp:
+                        read = {member.name: fp.extractfile(member).read() for member in fp.getmembers()}
+                self.assertEqual(read, {'Person.h': b'@interface Person\n@end\n', 'sub/Pet.tbd': b'--- !tapi-tbd\n'})
+
+            with self.assertRaises(ValueError):
+                with ArchiveWriter(os.path.join(directory, 'failed.zip')) as archive:
+                    archive.add('Person.h', '')
+                    raise ValueError
+            self.assertFalse(os.path.exists(os.path.join(directory, 'failed.zip')))
+
+            with self.assertRaises(UnsupportedArchiveException):
+                ArchiveWriter(os.path.join(directory, 'out.rar'))
+
+
+class HeaderRecordTestCase(unittest.TestCase):
+    def test_records_generate_same_headers(self):
+        from types import SimpleNamespace
+        from ktool.objc import ObjCImage, Class, Category, Protocol, Method, Property, Ivar, TypeProcessor
+        from ktool.headers import HeaderGenerator, HeaderUtils, TypeResolver, header_record, _header_texts
+        import pickle
+
+        tp = TypeProcessor()
+        proto = Protocol.from_values('Greeter', [Method.from_values('greet:', 'v24@0:8@16', type_processor=tp)],
+                                     [Method.from_values('wave', 'v16@0:8', type_processor=tp)],
+                                     [Property.from_values('greeting', 'T@"NSString",R,N', tp)])
+        cls = Class.from_values('Person', '_OBJC_CLASS_$_NSObject',
+                                [Method.from_values('name', '@16@0:8', type_processor=tp),
+                                 Method.from_values('setName:', 'v24@0:8@16', type_processor=tp),
+                                 Method.from_values('friendWith:', 'v24@0:8@"Person"16', type_processor=tp)],
+                                [Property.from_values('name', 'T@"NSString",C,N,V_name', tp)],
+                                [Ivar.from_values('_name', '@"NSString"', tp),
+                                 Ivar.from_values('_best', '@"Person"', tp),
+                                 Ivar.from_values('_greeter', '@"<Greeter>"', tp)], [proto], load_errors=['bad ivar'])
+        cat = Category.from_values('Person', 'Extras', [Method.from_values('extra', 'v16@0:8', type_processor=tp)], [])
+        image = SimpleNamespace(base_name='People', imports=[], linked_images=[])
+        objc_image = ObjCImage.from_values(image, 'People', [cls], [cat], [proto], tp)
+
+        generator = HeaderGenerator(objc_image)
+        # as a worker process would get them
+        context = pickle.loads(pickle.dumps((HeaderUtils.header_head(image), TypeResolver(objc_image), False)))
+        records = [pickle.loads(pickle.dumps(header_record(item)))
+                   for _, item in HeaderGenerator.header_items(objc_image)]
+        names = ['Person.h', 'Person+Extras.h', 'Greeter-Protocol.h']
+        self.assertEqual(_header_texts(context, records), [str(generator.headers[name]) for name in names])
+
+    def test_type_resolver_find_linked(self):
+        from types import SimpleNamespace
+        from ktool.objc import ObjCImage, Class, Protocol
+        from ktool.headers import TypeResolver
+        from ktool.loader import SymbolType
+        import pickle
+
+        linked = [SimpleNamespace(install_name='/System/Library/Frameworks/UIKit.framework/UIKit'),
+                  SimpleNamespace(install_name='/usr/lib/libobjc.A.dylib')]
+        imports = [SimpleNamespace(dec_type=SymbolType.CLASS, name='_UIView', ordinal=1),
+                   SimpleNamespace(dec_type=SymbolType.CLASS, name='_Root', ordinal=2),
+                   SimpleNamespace(dec_type=SymbolType.CLASS, name='_Gone', ordinal=9),
+                   SimpleNamespace(dec_type=SymbolType.CLASS, name='_NSString',
+                                   ordinal='/System/Library/Frameworks/Foundation.framework/Foundation')]
+        image = SimpleNamespace(base_name='People', imports=imports, linked_images=linked)
+        objc_image = ObjCImage.from_values(image, 'People', [Class.from_values('Person', '', [], [], [], [])], [],
+                                           [Protocol.from_values('Greeter', [], [], [])])
+
+        resolver = TypeResolver(objc_image)
+        for res in [resolver, pickle.loads(pickle.dumps(resolver))]:
+            self.assertEqual(res.find_linked('Person'), "")
+            self.assertEqual(res.find_linked('<Greeter>'), "-Protocol")
+            self.assertEqual(res.find_linked('UIView'), '/System/Library/Frameworks/UIKit.framework/UIKit')
+            self.assertIsNone(res.find_linked('Root'))
+            self.assertIsNone(res.find_linked('Gone'))
+            self.assertEqual(res.find_linked('NSString'), '/System/Library/Frameworks/Foundation.framework/Foundation')
+            self.assertIsNone(res.find_linked('Unknown'))
+
+    def test_update_headers_only_rewrites_changes(self):
+        from types import SimpleNamespace
+        from tempfile import TemporaryDirectory
+        from ktool.objc import ObjCImage, Class, Method
+        from ktool.headers import update_headers
+
+        def people(*names):
+            classes = [Class.from_values(name, '_OBJC_CLASS_$_NSObject',
+                                         [Method.from_values(sel, 'v16@0:8') for sel in sels], [], [], [])
+                       for name, sels in names]
+            return ObjCImage.from_values(SimpleNamespace(base_name='People', imports=[], linked_images=[]), 'People',
+                                         classes, [], [])
+
+        with TemporaryDirectory() as directory:
+            written, removed = update_headers(directory, people(('Person', ['walk']), ('Pet', ['sit'])))
+            self.assertEqual(written, ['Person.h', 'Pet.h', 'People.h', 'People-Structs.h'])
+
+            self.assertEqual(update_headers(directory, people(('Person', ['walk']), ('Pet', ['sit']))), ([], []))
+
+            written, removed = update_headers(directory, people(('Person', ['walk', 'run'])))
+            self.assertEqual((written, removed), (['Person.h', 'People.h'], ['Pet.h']))
+            self.assertFalse(os.path.exists(os.path.join(directory, 'Pet.h')))
+            with open(os.path.join(directory, 'Person.h')) as fp:
+                self.assertIn('run', fp.read())
+
+
+class HeaderHighlightTestCase(unittest.TestCase):
+    TEXT = '// ktool\n#import <Foundation/Foundation.h>\n#import "Person.h"\n\n@interface Pet : NSObject\n' \
+           '@property (retain) Person *owner;\n-(void)sitWith:(unsigned int)arg0 ;\n@end\n'
+
+    def test_builtin_colors_without_changing_text(self):
+        from ktool.headers import colorize_header_text
+        for use_256 in [True, False]:
+            colored = colorize_header_text(self.TEXT, use_256)
+            self.assertNotEqual(colored, self.TEXT)
+            self.assertEqual(strip_ansi(colored), self.TEXT)
+
+    def test_cache_is_bounded(self):
+        from ktool import headers
+        opts.BUILTIN_HEADER_HIGHLIGHTING = True
+        try:
+            for index in range(headers.HIGHLIGHT_CACHE_SIZE + 8):
+                headers.highlight_header_text(f'{self.TEXT}// {index}\n')
+            self.assertEqual(len(headers._highlight_cache), headers.HIGHLIGHT_CACHE_SIZE)
+            self.assertIs(headers.highlight_header_text(f'{self.TEXT}// 8\n'),
+                          headers.highlight_header_text(f'{self.TEXT}// 8\n'))
+        finally:
+            opts.BUILTIN_HEADER_HIGHLIGHTING = False
+
+
+class SwiftClassIndexTestCase(unittest.TestCase):
+    def test_demangled_names(self):
+        from ktool.objc import ObjCImage, Class
+        classes = [Class.from_values(name, '', [], [], [], [])
+                   for name in ['_TtC7MyStuff6Person', 'NSFoo', '_TtC5Other6Person', '_TtC7MyStuff3Pet']]
+        index = ObjCImage.from_values(None, 'MyStuff', classes, [], []).swift_classes_by_name
+        # first class with a given type name wins, as it always has
+        self.assertEqual(index['Person'], ('MyStuff', classes[0]))
+        self.assertEqual(index['Pet'], ('MyStuff', classes[3]))
+        self.assertNotIn('NSFoo', index)
+
+
+def build_macho(install_name, exports, imports):
+    """
+    Build a minimal x86_64 dylib: __TEXT, __DATA and __LINKEDIT segments, an LC_ID_DYLIB, an LC_LOAD_DYLIB for
+        libSystem, an LC_DYLD_INFO_ONLY with rebase and bind opcodes and an export trie, and an LC_SYMTAB.
+
+    :param install_name: Install name of the dylib
+    :param exports: Names of symbols to export, at 0x100 + 0x10 * index in __text
+    :param imports: Names of symbols bound to pointers at 0x1100 + 8 * index in __data. The first is bound from
+        libSystem, the rest from the flat namespace.
+    :return: MachO bytes
+    """
+    import struct
+    linkedit = bytearray()
+
+    def add_linkedit(data):
+        offset = 0x2000 + len(linkedit)
+        linkedit.extend(data + bytes(-len(data) % 8))
+        return offset, len(data)
+
+    # rebase two pointers at the start of __DATA
+    rebase = add_linkedit(bytes([0x11, 0x21, 0x00, 0x52, 0x00]))
+    bind_opcodes = bytearray()
+    for index, name in enumerate(imports):
+        bind_opcodes += bytes([0x11 if index == 0 else 0x3e, 0x40]) + name.encode() + b'\x00'
+        bind_opcodes += bytes([0x51, 0x71, 0x80 | (index * 8), 0x02, 0x90])
+    bind = add_linkedit(bind_opcodes + b'\x00')
+
+    # a root node with an edge straight to a terminal node for each export
+    edges = [name.encode() + b'\x00' for name in exports]
+    trie = bytearray([0, len(edges)])
+    nodes_start = 2 + sum(len(edge) + 1 for edge in edges)
+    nodes = bytearray()
+    for index, edge in enumerate(edges):
+        trie += edge + bytes([nodes_start + len(nodes)])
+        nodes += bytes([3, 0, 0x80 | (index * 0x10), 0x02, 0])
+    export = add_linkedit(bytes(trie + nodes))
+
+    strings = bytearray(b'\x00')
+    symbols = bytearray()
+    for index, name in enumerate(exports):
+        symbols += struct.pack('<IBBHQ', len(strings), 0xf, 1, 0, 0x100 + 0x10 * index)
+        strings += name.encode() + b'\x00'
+    for index, name in enumerate(imports):
+        symbols += struct.pack('<IBBHQ', len(strings), 0x1, 0, (1 if index == 0 else 0xfe) << 8, 0)
+        strings += name.encode() + b'\x00'
+    symtab = add_linkedit(bytes(symbols))
+    strtab = add_linkedit(bytes(strings))
+
+    def dylib_command(cmd, name):
+        name = name.encode() + b'\x00'
+        name += bytes(-(len(name) + 24) % 8)
+        return struct.pack('<IIIIII', cmd, 24 + len(name), 24, 0, 0x10000, 0x10000) + name
+
+    commands = struct.pack('<II16sQQQQIIII', 0x19, 152, b'__TEXT', 0, 0x1000, 0, 0x1000, 5, 5, 1, 0)
+    commands += struct.pack('<16s16sQQIIIIIIII', b'__text', b'__TEXT', 0x100, 0x100, 0x100, 4, 0, 0, 0x80000400, 0,
+                            0, 0)
+    commands += struct.pack('<II16sQQQQIIII', 0x19, 152, b'__DATA', 0x1000, 0x1000, 0x1000, 0x1000, 3, 3, 1, 0)
+    commands += struct.pack('<16s16sQQIIIIIIII', b'__data', b'__DATA', 0x1000, 0x200, 0x1000, 3, 0, 0, 0, 0, 0, 0)
+    commands += struct.pack('<II16sQQQQIIII', 0x19, 72, b'__LINKEDIT', 0x2000, 0x1000, 0x2000, len(linkedit), 1, 1,
+                            0, 0)
+    commands += dylib_command(0xd, install_name)
+    commands += dylib_command(0xc, '/usr/lib/libSystem.B.dylib')
+    commands += struct.pack('<12I', 0x80000022, 48, *rebase, *bind, 0, 0, 0, 0, *export)
+    commands += struct.pack('<6I', 0x2, 24, symtab[0], len(exports) + len(imports), *strtab)
+    header = struct.pack('<IIIIIIII', 0xfeedfacf, 0x1000007, 3, 6, 7, len(commands), 0x100085, 0)
+
+    data = bytearray(0x2000 + len(linkedit))
+    data[0:len(header) + len(commands)] = header + commands
+    # rebased pointers into __text
+    struct.pack_into('<QQ', data, 0x1000, 0x100, 0x110)
+    data[0x2000:] = linkedit
+    return data
+
+
+class SnapshotTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        from ktool.loader import MachOImageLoader
+        from ktool.snapshot import ImageSnapshot
+        data = build_macho('/usr/lib/libpeople.dylib', ['_person_new', '_person_free', '_pet_new'],
+                           ['_malloc', '_free'])
+        image = ktool.load_image(BytesIO(data))
+        raw = image.snapshot()
+
+        macho_slice = ktool.load_macho_file(BytesIO(data)).slices[0]
+        restored = Image.restore(macho_slice, raw)
+        self.assertEqual(restored.serialize(), image.serialize())
+        for address in [0x100, 0x110, 0x120]:
+            self.assertEqual(restored.export_table[address].name, image.export_table[address].name)
+            self.assertEqual(restored.symbols[address].name, image.symbols[address].name)
+        self.assertEqual({address: (sym.name, sym.ordinal) for address, sym in restored.import_table.items()},
+                         {0x1100: ('_malloc', '/usr/lib/libSystem.B.dylib'), 0x1108: ('_free', '-2')})
+        self.assertEqual([(node.text, node.offset) for node in restored.export_trie.nodes],
+                         [(node.text, node.offset) for node in image.export_trie.nodes])
+        self.assertEqual(restored.export_trie.lookup('_pet_new').offset, 0x120)
+        self.assertIsNone(restored.export_trie.lookup('_pet_free'))
+        self.assertEqual(list(restored.rebase_table.addresses), [0x1000, 0x1008])
+
+        # restore_into() fills in an image whose load commands were parsed some other way
+        bare = Image(ktool.load_macho_file(BytesIO(data)).slices[0], False)
+        MachOImageLoader._parse_load_commands(bare, load_symtab=False, load_imports=False, load_exports=False,
+                                              load_function_starts=False)
+        self.assertEqual(ImageSnapshot(raw).restore_into(bare).serialize(), image.serialize())
+
+    def test_binding_tables(self):
+        from ktool.snapshot import ImageSnapshot
+        bind_info_columns = ['addresses', 'ordinals', 'symbols', 'addends', 'types', 'flags', 'segments',
+                             'opcode_offsets', 'names', 'threaded_ordinals', 'threaded_symbols', 'threaded_starts']
+        for data in [build_macho('/usr/lib/libpeople.dylib', ['_person_new'], ['_malloc', '_free']),
+                     build_objc_macho('threaded')]:
+            image = ktool.load_image(BytesIO(data))
+            restored = ImageSnapshot(image.snapshot()).restore(ktool.load_macho_file(BytesIO(data)).slices[0])
+            for table in ['binding_table', 'weak_binding_table', 'lazy_binding_table']:
+                loaded, snapshotted = getattr(image, table), getattr(restored, table)
+                self.assertEqual(snapshotted.actions, loaded.actions)
+                self.assertEqual(snapshotted.import_stack, loaded.import_stack)
+                for column in bind_info_columns:
+                    self.assertEqual(list(getattr(snapshotted.bind_info, column)),
+                                     list(getattr(loaded.bind_info, column)))
+            # plain binds in the first image, threaded ones in the second
+            self.assertTrue(image.binding_table.actions or image.binding_table.bind_info.threaded_starts)
+
+    def test_patched_slice(self):
+        from ktool.exceptions import InvalidSnapshotException
+        data = build_macho('/usr/lib/libpeople.dylib', ['_person_new'], ['_malloc'])
+        raw = ktool.load_image(BytesIO(data)).snapshot()
+
+        macho_slice = ktool.load_macho_file(BytesIO(data)).slices[0]
+        # rename the export, in the string table in __LINKEDIT
+        macho_slice.patch(data.index(b'_person_new\x00', 0x2000), b'_persoN_new')
+        with self.assertRaises(InvalidSnapshotException):
+            Image.restore(macho_slice, raw)
+
+    def test_invalid_snapshot(self):
+        from ktool.snapshot import ImageSnapshot, SNAPSHOT_MAGIC
+        from ktool.exceptions import InvalidSnapshotException
+        with self.assertRaises(InvalidSnapshotException):
+            ImageSnapshot.from_values(b'\x00' * 0x40)
+        with self.assertRaises(InvalidSnapshotException):
+            ImageSnapshot.from_values(SNAPSHOT_MAGIC)
+
+
+class ExportTrieTestCase(unittest.TestCase):
+    # root -"_"-> node -"a"-> _a (0x1000)
+    #                  -"b"-> _b (0x2000)
+    TRIE = bytes([0x00, 0x01, 0x5f, 0x00, 0x05,
+                  0x00, 0x02, 0x61, 0x00, 0x0d, 0x62, 0x00, 0x12,
+                  0x03, 0x00, 0x80, 0x20, 0x00,
+                  0x03, 0x00, 0x80, 0x40, 0x00])
+
+    def test_walk(self):
+        from ktool.loader import ExportTrie
+        nodes = list(ExportTrie.walk(self.TRIE))
+        self.assertEqual([(node.text, node.offset, node.flags) for node in nodes], [('_a', 0x1000, 0), ('_b', 0x2000, 0)])
+
+    def test_lookup(self):
+        from ktool.loader import ExportTrie
+        self.assertEqual(ExportTrie.find(self.TRIE, '_b').offset, 0x2000)
+        self.assertIsNone(ExportTrie.find(self.TRIE, '_'))
+        self.assertIsNone(ExportTrie.find(self.TRIE, '_c'))
+
+    def test_empty_trie(self):
+        from io import BytesIO
+        from ktool.loader import ExportTrie
+        from ktool.exceptions import MalformedMachOException
+        self.assertEqual(list(ExportTrie.walk(b'')), [])
+        self.assertIsNone(ExportTrie.find(b'', '_a'))
+
+        # an image without exports has an empty trie, which isn't an error
+        enable_error_capture()
+        try:
+            image = ktool.load_image(BytesIO(build_objc_macho('opcodes')))
+        finally:
+            disable_error_capture()
+        self.assertEqual(error_buffer, '')
+        self.assertEqual((image.export_trie.nodes, image.exports), ([], []))
+
+        # but an edge to a node past the end of the trie is
+        with self.assertRaises(MalformedMachOException):
+            list(ExportTrie.walk(bytes([0x00, 0x01, 0x5f, 0x00, 0x40])))
+
+
+class PrelinkInfoTestCase(unittest.TestCase):
+    PRELINK_INFO = (b'<dict><key>_PrelinkInfoDictionary</key><array>'
+                    b'<dict><key>CFBundleIdentifier</key><string>com.apple.kpi.mach</string>'
+                    b'<key>CFBundleVersion</key><string ID="1">22.1.0</string>'
+                    b'<key>OSBundleLibraries</key><dict><key>CFBundleVersion</key><string>8.0.0</string></dict>'
+                    b'<key>_PrelinkExecutableSize</key><integer size="64" ID="2">0x4000</integer></dict>'
+                    b'<dict><key>CFBundleIdentifier</key><string>com.apple.iokit.IONetworkingFamily</string>'
+                    b'<key>CFBundleVersion</key><string IDREF="1"/><key>OSBundleRequired</key><string>Root</string>'
+                    b'<key>_PrelinkExecutableSize</key><integer IDREF="2"/></dict>'
+                    b'</array><key>_PrelinkKCID</key><data>AAAAAAAAAAA=</data></dict>')
+
+    def test_streamed_parse(self):
+        from ktool.kcache import _PrelinkInfoParser
+        parser = _PrelinkInfoParser()
+        parser.feed(b'<plist version="1.0">')
+        data = memoryview(self.PRELINK_INFO)
+        for i in range(0, len(data), 7):
+            if not parser.feed(data[i:i + 7]):
+                break
+        # everything after _PrelinkInfoDictionary is skipped
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.bundles, [
+            {'CFBundleIdentifier': 'com.apple.kpi.mach', 'CFBundleVersion': '22.1.0', '_PrelinkExecutableSize': 0x4000},
+            {'CFBundleIdentifier': 'com.apple.iokit.IONetworkingFamily', 'CFBundleVersion': '22.1.0',
+             '_PrelinkExecutableSize': 0x4000}])
+
+    def test_data_and_dates(self):
+        from datetime import datetime
+        from ktool.kcache import _PrelinkInfoParser, _PrelinkBundleParser
+        entry = (b'<dict><key>CFBundleIdentifier</key><string>com.apple.kpi.mach</string>'
+                 b'<key>OSBundleSignature</key><data ID="1">3q2+7w==</data>'
+                 b'<key>OSBundleBuildDate</key><date>2022-10-18T09:30:00Z</date></dict>')
+        parser = _PrelinkInfoParser(keys={'OSBundleSignature', 'OSBundleBuildDate'})
+        parser.feed(b'<dict><key>_PrelinkInfoDictionary</key><array>' + entry + b'</array></dict>')
+        expected = {'OSBundleSignature': b'\xde\xad\xbe\xef', 'OSBundleBuildDate': datetime(2022, 10, 18, 9, 30)}
+        self.assertEqual(parser.bundles, [expected])
+        # and the same from the parser bundle_info() uses
+        bundle = _PrelinkBundleParser({}).parse(entry)
+        self.assertEqual({key: bundle[key] for key in expected}, expected)
+
+
+class BindOpcodeTestCase(unittest.TestCase):
+    def test_bind(self):
+        from ktool.loader import run_bind_opcodes
+        # ordinal 1, "_a", seg 0 + 0x10, bind; flat-namespace, bind again 8 bytes on; DONE; trailing garbage
+        opcodes = bytes([0x11, 0x40]) + b'_a\x00' + bytes([0x70, 0x10, 0x90, 0x3e, 0x90, 0x00, 0x11])
+        info = run_bind_opcodes(opcodes, [0x1000], 8)
+        self.assertEqual(list(info.addresses), [0x1010, 0x1018])
+        self.assertEqual(list(info.ordinals), [1, -2])
+        self.assertEqual([info.names[i] for i in info.symbols], ['_a', '_a'])
+
+    def test_rebase(self):
+        from ktool.loader import run_rebase_opcodes
+        # pointer type, seg 0 + 0x8, rebase 3 times, DONE
+        addresses, types = run_rebase_opcodes(bytes([0x11, 0x20, 0x08, 0x53, 0x00]), [0x4000], 8)
+        self.assertEqual(list(addresses), [0x4008, 0x4010, 0x4018])
+        self.assertEqual(list(types), [1, 1, 1])
+
+
+class FixupChainTestCase(unittest.TestCase):
+    def test_arm64e_chain(self):
+        from array import array
+        from ktool.loader import walk_fixup_chain
+        page = bytearray(0x20)
+        # rebase to 0x4000, next pointer 2 strides (16 bytes) on; then a bind to import 3, end of chain
+        page[0:8] = (0x4000 | (2 << 51)).to_bytes(8, 'little')
+        page[0x10:0x18] = (3 | (1 << 62)).to_bytes(8, 'little')
+        rebase_offsets, rebase_targets, bind_offsets, bind_imports = array('Q'), array('Q'), array('Q'), array('I')
+        self.assertTrue(walk_fixup_chain(page, 0, 0x20, 1, 0x100000000, rebase_offsets, rebase_targets,
+                                         bind_offsets, bind_imports))
+        self.assertEqual((list(rebase_offsets), list(rebase_targets)), ([0], [0x4000]))
+        self.assertEqual((list(bind_offsets), list(bind_imports)), ([0x10], [3]))
+
+        # a chain pointing past the end of its page is malformed
+        page[0x10:0x18] = (3 | (1 << 62) | (0x10 << 51)).to_bytes(8, 'little')
+        self.assertFalse(walk_fixup_chain(page, 0, 0x20, 1, 0, array('Q'), array('Q'), array('Q'), array('I')))
+
+    def test_pages(self):
+        from ktool.loader import walk_fixup_pages, fixup_page
+        # two 0x10 byte pages at file offset 0x100, one rebase each
+        data = bytearray(0x28)
+        data[0x8:0x10] = (0x4000).to_bytes(8, 'little')
+        data[0x10:0x18] = (0x5000).to_bytes(8, 'little')
+        pages = [fixup_page(0x100, [0x8], 0x1100), fixup_page(0x110, [0], 0x1110)]
+        rebase_addresses, rebase_targets, _, _, bad_chains = walk_fixup_pages(data, 0x100, pages, 0x10, 1, 0)
+        self.assertEqual(list(rebase_addresses), [0x1108, 0x1110])
+        self.assertEqual(list(rebase_targets), [0x4000, 0x5000])
+        self.assertEqual(bad_chains, 0)
+
+
+def build_objc_macho(fixups):
+    """
+    Build a minimal arm64 dylib with one ObjC class, Person : NSObject, with a -(void)walk method. Every pointer the
+        class is made of is stored the way `fixups` says, with the superclass pointers bound to NSObject.
+
+    :param fixups: 'opcodes' (plain pointers, LC_DYLD_INFO rebase and bind opcodes), 'chained'
+        (LC_DYLD_CHAINED_FIXUPS, DYLD_CHAINED_PTR_64_OFFSET) or 'threaded' (arm64e, threaded binds)
+    :return: MachO bytes. The image is based at 0x100000000, __TEXT at file offset 0, __DATA at 0x1000.
+    """
+    import struct
+    base = 0x100000000
+    imports = ['_OBJC_CLASS_$_NSObject', '_OBJC_METACLASS_$_NSObject']
+    # location -> target (relative to base), or import index for binds
+    rebases = {0x1000: 0x1100, 0x1100: 0x1180, 0x1120: 0x1200, 0x11a0: 0x1280, 0x1218: 0x800, 0x1220: 0x1300,
+               0x1298: 0x800, 0x1308: 0x810, 0x1310: 0x820, 0x1318: 0x900}
+    binds = {0x1108: 0, 0x1180: 1, 0x1188: 1}
+
+    data = bytearray(0x1000)
+    # class_ro flags (meta for the metaclass), instance start and size
+    struct.pack_into('<III', data, 0x200, 0, 8, 8)
+    struct.pack_into('<III', data, 0x280, 1, 40, 40)
+    # method list, one 24 byte entry
+    struct.pack_into('<II', data, 0x300, 24, 1)
+
+    linkedit = bytearray()
+
+    def add_linkedit(blob):
+        offset = 0x2000 + len(linkedit)
+        linkedit.extend(blob + bytes(-len(blob) % 8))
+        return offset, len(blob)
+
+    locations = sorted(list(rebases) + list(binds))
+    if fixups == 'opcodes':
+        for location, target in rebases.items():
+            struct.pack_into('<Q', data, location - 0x1000, base + target)
+        rebase_opcodes = bytearray([0x11])
+        for location in sorted(rebases):
+            rebase_opcodes += bytes([0x21, 0x80 | (location - 0x1000) & 0x7f, (location - 0x1000) >> 7, 0x51])
+        bind_opcodes = bytearray()
+        for location, index in binds.items():
+            bind_opcodes += bytes([0x11, 0x40]) + imports[index].encode() + b'\x00'
+            bind_opcodes += bytes([0x51, 0x71, 0x80 | (location - 0x1000) & 0x7f, (location - 0x1000) >> 7, 0x90])
+        dyld_info = add_linkedit(bytes(rebase_opcodes + b'\x00')) + add_linkedit(bytes(bind_opcodes + b'\x00'))
+        fixup_command = struct.pack('<12I', 0x80000022, 48, *dyld_info, 0, 0, 0, 0, 0, 0)
+        cpu_subtype = 0
+    elif fixups == 'chained':
+        for location, next_location in zip(locations, locations[1:] + [None]):
+            next_count = (next_location - location) // 4 if next_location else 0
+            if location in binds:
+                raw = binds[location] | next_count << 51 | 1 << 63
+            else:
+                raw = rebases[location] | next_count << 51
+            struct.pack_into('<Q', data, location - 0x1000, raw)
+        symbols = b'\x00' + b''.join(name.encode() + b'\x00' for name in imports)
+        name_offsets = [1, 1 + len(imports[0]) + 1]
+        # header, starts_in_image (3 segments, only __DATA has starts), starts_in_segment, imports, symbols
+        starts = struct.pack('<IIII', 3, 0, 16, 0)
+        starts += struct.pack('<IHHQIHH', 24, 0x1000, 6, 0x1000, 0, 1, 0)
+        chained_imports = b''.join(struct.pack('<I', 1 | offset << 9) for offset in name_offsets)
+        header_size = 28
+        blob = struct.pack('<7I', 0, header_size, header_size + len(starts),
+                           header_size + len(starts) + len(chained_imports), len(imports), 1, 0)
+        fixup_command = struct.pack('<4I', 0x80000034, 16, *add_linkedit(blob + starts + chained_imports + symbols))
+        cpu_subtype = 0
+    else:
+        for location, next_location in zip(locations, locations[1:] + [None]):
+            next_count = (next_location - location) // 8 if next_location else 0
+            if location in binds:
+                raw = binds[location] | next_count << 51 | 1 << 62
+            elif location == 0x1318:
+                # authenticated, so an offset from the image base
+                raw = rebases[location] | next_count << 51 | 1 << 63
+            else:
+                raw = (base + rebases[location]) | next_count << 51
+            struct.pack_into('<Q', data, location - 0x1000, raw)
+        bind_opcodes = bytearray([0xd0, len(imports)])
+        for name in imports:
+            bind_opcodes += bytes([0x11, 0x40]) + name.encode() + b'\x00' + bytes([0x51, 0x90])
+        bind_opcodes += bytes([0x71, 0x00, 0xd1, 0x00])
+        fixup_command = struct.pack('<12I', 0x80000022, 48, 0, 0, *add_linkedit(bytes(bind_opcodes)), 0, 0, 0, 0,
+                                    0, 0)
+        cpu_subtype = 2
+
+    name = b'/usr/lib/libperson.dylib\x00'
+    name += bytes(-(len(name) + 24) % 8)
+    commands = struct.pack('<II16sQQQQIIII', 0x19, 232, b'__TEXT', base, 0x1000, 0, 0x1000, 5, 5, 2, 0)
+    commands += struct.pack('<16s16sQQIIIIIIII', b'__cstring', b'__TEXT', base + 0x800, 0x100, 0x800, 0, 0, 0, 2, 0,
+                            0, 0)
+    commands += struct.pack('<16s16sQQIIIIIIII', b'__text', b'__TEXT', base + 0x900, 0x100, 0x900, 2, 0, 0,
+                            0x80000400, 0, 0, 0)
+    commands += struct.pack('<II16sQQQQIIII', 0x19, 232, b'__DATA', base + 0x1000, 0x1000, 0x1000, 0x1000, 3, 3, 2,
+                            0)
+    commands += struct.pack('<16s16sQQIIIIIIII', b'__objc_classlist', b'__DATA', base + 0x1000, 8, 0x1000, 3, 0, 0,
+                            0x10000000, 0, 0, 0)
+    commands += struct.pack('<16s16sQQIIIIIIII', b'__objc_data', b'__DATA', base + 0x1100, 0x300, 0x1100, 3, 0, 0, 0,
+                            0, 0, 0)
+    commands += struct.pack('<II16sQQQQIIII', 0x19, 72, b'__LINKEDIT', base + 0x2000, 0x1000, 0x2000, len(linkedit),
+                            1, 1, 0, 0)
+    commands += struct.pack('<IIIIII', 0xd, 24 + len(name), 24, 0, 0x10000, 0x10000) + name
+    foundation = b'/System/Library/Frameworks/Foundation.framework/Foundation\x00'
+    foundation += bytes(-(len(foundation) + 24) % 8)
+    commands += struct.pack('<IIIIII', 0xc, 24 + len(foundation), 24, 0, 0x10000, 0x10000) + foundation
+    commands += fixup_command
+    header = struct.pack('<IIIIIIII', 0xfeedfacf, 0x100000c, cpu_subtype, 6, 6, len(commands), 0x100085, 0)
+
+    macho = bytearray(0x2000 + len(linkedit))
+    macho[0:len(header) + len(commands)] = header + commands
+    strings = b'Person\x00'.ljust(0x10, b'\x00') + b'walk\x00'.ljust(0x10, b'\x00') + b'v16@0:8\x00'
+    macho[0x800:0x800 + len(strings)] = strings
+    macho[0x1000:0x2000] = data
+    macho[0x2000:] = linkedit
+    return macho
+
+
+class ObjCFixupsTestCase(unittest.TestCase):
+    def test_class_through_fixups(self):
+        from io import BytesIO
+        for fixups in ['opcodes', 'chained', 'threaded']:
+            with self.subTest(fixups=fixups):
+                image = ktool.load_image(BytesIO(build_objc_macho(fixups)))
+                self.assertEqual(image.read_ptr(0x100001000, vm=True), 0x100001100)
+                self.assertEqual({address: symbol.name for address, symbol in image.import_table.items()},
+                                 {0x100001108: '_NSObject', 0x100001180: '_NSObject', 0x100001188: '_NSObject'})
+                objc_image = ktool.load_objc_metadata(image)
+                objc_class = objc_image.classlist[0]
+                self.assertEqual((objc_class.name, objc_class.superclass), ('Person', 'NSObject'))
+                self.assertEqual([(method.sel, method.type_string) for method in objc_class.methods],
+                                 [('walk', 'v16@0:8')])
+
+
+class KToolMachOLoaderTestCase(unittest.TestCase):
+    def test_objc_image_is_shared(self):
+        from io import BytesIO
+        from unittest import mock
+        from ktool.window import KToolMachOLoader
+        image = ktool.load_image(BytesIO(build_objc_macho('chained')))
+        statuses = []
+        KToolMachOLoader.OBJC_IMAGES = {}
+
+        # the ObjC Headers and Swift Types items get the same ObjCImage, only loaded the once
+        with mock.patch.object(KToolMachOLoader, 'objc_headers', lambda lib, parent, callback: lib), \
+                mock.patch.object(KToolMachOLoader, 'swift_types', lambda lib, parent, callback: lib):
+            objc_image = KToolMachOLoader.objc_items(image, None, statuses.append)
+            self.assertIs(KToolMachOLoader.swift_items(image, None, statuses.append), objc_image)
+        self.assertEqual(objc_image.classlist[0].name, 'Person')
+        self.assertEqual(sum(status.endswith('Loading ObjC Metadata') for status in statuses), 1)
+        KToolMachOLoader.OBJC_IMAGES = {}
+
+
+def write_shared_cache(path, install_names, split=False):
+    """
+    Write a minimal dyld shared cache, with a dylib for each install name. Each dylib has a __TEXT and __LINKEDIT
+        segment, an LC_ID_DYLIB, an LC_SYMTAB and export trie with a single symbol (_ + the dylib's file name) at
+        +0x100, and an ObjC class named after the dylib's file name in its __objc_classlist.
+
+    :param path: Path of the main cache file
+    :param install_names: Install names of the dylibs to put in it
+    :param split: Put __LINKEDIT in a .01 subcache, at file offsets overlapping the main cache's __TEXT
+    """
+    import struct
+    text_address, linkedit_address, text_start = 0x180000000, 0x190000000, 0x4000
+    count = len(install_names)
+    linkedit_start = text_start if split else text_start + count * 0x1000
+
+    def cache_header(mapping_count):
+        header = bytearray(0x1d0)
+        header[0:16] = b'dyld_v1  arm64e\x00'
+        struct.pack_into('<II', header, 0x10, 0x1d0, mapping_count)
+        return header
+
+    main = cache_header(1 if split else 2)
+    main += bytes(text_start + count * 0x1000 - len(main))
+    struct.pack_into('<QQQII', main, 0x1d0, text_address, text_start + count * 0x1000, 0, 5, 5)
+    linkedit = bytearray(count * 0x1000)
+    for index, install_name in enumerate(install_names):
+        text_vm, text_off = text_address + text_start + index * 0x1000, text_start + index * 0x1000
+        linkedit_vm, linkedit_off = linkedit_address + index * 0x1000, linkedit_start + index * 0x1000
+
+        name = install_name.encode() + b'\x00'
+        name += bytes(-(len(name) + 24) % 8)
+        commands = struct.pack('<II16sQQQQIIII', 0x19, 152, b'__TEXT', text_vm, 0x1000, text_off, 0x1000, 5, 5, 1, 0)
+        commands += struct.pack('<16s16sQQIIIIIIII', b'__objc_classlist', b'__TEXT', text_vm + 0xc00, 8,
+                                text_off + 0xc00, 3, 0, 0, 0, 0, 0, 0)
+        commands += struct.pack('<II16sQQQQIIII', 0x19, 72, b'__LINKEDIT', linkedit_vm, 0x1000, linkedit_off, 0x1000,
+                                1, 1, 0, 0)
+        commands += struct.pack('<IIIIII', 0xd, 24 + len(name), 24, 0, 0x10000, 0x10000) + name
+        symbol = b'\x00_' + os.path.basename(install_name).encode() + b'\x00'
+        commands += struct.pack('<IIIIII', 0x2, 24, linkedit_off, 1, linkedit_off + 0x10, len(symbol))
+        trie = bytes([0, 1]) + symbol[1:] + bytes([len(symbol) + 2, 3, 0, 0x80, 0x02, 0])
+        commands += struct.pack('<IIII', 0x80000033, 16, linkedit_off + 0x40, len(trie))
+        mach_header = struct.pack('<IIIIIIII', 0xfeedfacf, 0x100000c, 0, 6, 5, len(commands), 0x80000000, 0)
+        main[text_off:text_off + 0x1000] = (mach_header + commands).ljust(0x1000, b'\x00')
+
+        # classlist -> objc2_class -> objc2_class_ro -> name
+        class_name = os.path.basename(install_name).encode() + b'\x00'
+        struct.pack_into('<QQQQQ', main, text_off + 0x800, 0, 0, 0, 0, text_vm + 0x840)
+        struct.pack_into('<IIIIQQ', main, text_off + 0x840, 0, 0, 0, 0, 0, text_vm + 0x8a0)
+        main[text_off + 0x8a0:text_off + 0x8a0 + len(class_name)] = class_name
+        struct.pack_into('<Q', main, text_off + 0xc00, text_vm + 0x800)
+
+        linkedit[index * 0x1000:index * 0x1000 + 0x10] = struct.pack('<IBBHQ', 1, 0xf, 1, 0, text_vm + 0x100)
+        linkedit[index * 0x1000 + 0x10:index * 0x1000 + 0x10 + len(symbol)] = symbol
+        linkedit[index * 0x1000 + 0x40:index * 0x1000 + 0x40 + len(trie)] = trie
+
+        # dyld_cache_image_info, and the install name it points to
+        struct.pack_into('<QQQII', main, 0x300 + index * 0x20, text_vm, 0, 0, 0x800 + index * 0x100, 0)
+        main[0x800 + index * 0x100:0x800 + index * 0x100 + len(name)] = name
+    struct.pack_into('<II', main, 0x1c0, 0x300, count)
+
+    if split:
+        struct.pack_into('<II', main, 0x188, 0x210, 1)
+        struct.pack_into('<16sQ32s', main, 0x210, bytes(16), linkedit_address - text_address, b'.01')
+        subcache = cache_header(1)
+        subcache += bytes(linkedit_start - len(subcache)) + linkedit
+        struct.pack_into('<QQQII', subcache, 0x1d0, linkedit_address, len(linkedit), linkedit_start, 1, 1)
+        with open(path + '.01', 'wb') as fp:
+            fp.write(subcache)
+    else:
+        struct.pack_into('<QQQII', main, 0x1f0, linkedit_address, len(linkedit), linkedit_start, 1, 1)
+        main += linkedit
+
+    with open(path, 'wb') as fp:
+        fp.write(main)
+
+
+class SharedCacheTestCase(unittest.TestCase):
+    INSTALL_NAMES = ['/usr/lib/libfoo.dylib', '/System/Library/Frameworks/Bar.framework/Bar']
+
+    def _check_cache(self, split):
+        from tempfile import TemporaryDirectory
+        from ktool.dyld_cache import DyldSharedCache
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'dyld_shared_cache_arm64e')
+            write_shared_cache(path, self.INSTALL_NAMES, split=split)
+            cache = DyldSharedCache(path)
+            self.assertEqual(cache.install_names, self.INSTALL_NAMES)
+            self.assertEqual(len(cache.subcaches), 1 if split else 0)
+
+            # nothing is loaded until it's asked for, and it's only loaded once
+            self.assertEqual(cache._loaded_images, {})
+            image = cache.image('/System/Library/Frameworks/Bar.framework/Bar')
+            self.assertIs(cache.image('/System/Library/Frameworks/Bar.framework/Bar'), image)
+            self.assertEqual(list(cache._loaded_images), ['/System/Library/Frameworks/Bar.framework/Bar'])
+
+            self.assertEqual(image.install_name, '/System/Library/Frameworks/Bar.framework/Bar')
+            self.assertEqual([symbol.name for symbol in image.symbol_table.table], ['_Bar'])
+            self.assertEqual(image.symbol_table.table[0].address, 0x180005100)
+            self.assertEqual(image.read_uint(0x180005000, 4, vm=True), 0xfeedfacf)
+
+            with self.assertRaises(KeyError):
+                cache.image('/usr/lib/libmissing.dylib')
+            cache.close()
+
+    def test_cache(self):
+        self._check_cache(split=False)
+
+    def test_split_cache(self):
+        self._check_cache(split=True)
+
+    def test_index(self):
+        from tempfile import TemporaryDirectory
+        from unittest import mock
+        from ktool.dyld_cache import DyldSharedCache
+        from ktool.cache_index import SharedCacheIndex, index_entry
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'dyld_shared_cache_arm64e')
+            write_shared_cache(path, self.INSTALL_NAMES, split=True)
+            cache = DyldSharedCache(path)
+
+            index = SharedCacheIndex.for_cache(cache, directory)
+            self.assertEqual(cache._loaded_images, {})
+            self.assertEqual(index.symbol('_libfoo.dylib'), [index_entry('/usr/lib/libfoo.dylib', 0x180004100)])
+            self.assertEqual(index.objc_class('Bar'),
+                             [index_entry('/System/Library/Frameworks/Bar.framework/Bar', 0x180005800)])
+            self.assertEqual(index.symbol('_missing'), [])
+
+            # saved under the cache's UUID, and reused from there
+            saved = SharedCacheIndex.from_file(os.path.join(directory, f'{cache.uuid}.ktidx'))
+            self.assertEqual(saved.objc_class('libfoo.dylib'), index.objc_class('libfoo.dylib'))
+            saved.close()
+            self.assertTrue(saved.raw.closed)
+
+            # a dylib that fails partway through is skipped as a whole
+            classes = SharedCacheIndex._classes
+
+            def bad_classlist(cache_, image_file):
+                if image_file.name == 'libfoo.dylib':
+                    raise ValueError('bad classlist')
+                return classes(cache_, image_file)
+
+            with mock.patch.object(SharedCacheIndex, '_classes', side_effect=bad_classlist):
+                partial = SharedCacheIndex.from_cache(cache)
+            self.assertEqual(partial.symbol('_libfoo.dylib'), [])
+            self.assertEqual(partial.objc_class('Bar'), index.objc_class('Bar'))
+            cache.close()
+
+    def test_untag_pointer(self):
+        from ktool.dyld_cache import DyldSharedCache, slide_info
+        # arm64e (v3): authenticated pointers are offsets from the cache base, plain ones carry their top byte
+        v3 = slide_info(3, 0, 0x180000000)
+        self.assertEqual(DyldSharedCache.untag_pointer((1 << 63) | (0x7 << 51) | 0x1234, v3), 0x180001234)
+        self.assertEqual(DyldSharedCache.untag_pointer((0x7 << 51) | (0x80 << 43) | 0x180001234, v3),
+                         0x8000000180001234)
+        v2 = slide_info(2, 0x00ffff0000000000, 0)
+        self.assertEqual(DyldSharedCache.untag_pointer(0x0012000180001234, v2), 0x180001234)
+
+
+def write_kernelcache(path, kexts):
+    """
+    Write a minimal arm64 kernelcache with embedded kexts: a __TEXT segment holding the version string, a
+        __PRELINK_TEXT segment with a build_macho() dylib at the start of each 0x4000 byte page, and a
+        __PRELINK_INFO,__info plist describing them.
+
+    :param path: Path to write it to
+    :param kexts: (bundle ID, executable name) of each kext. The first should be com.apple.kpi.mach. Each depends on
+        com.apple.kpi.mach 8.0 in its OSBundleLibraries, deduped with an ID/IDREF.
+    """
+    import struct
+    base = 0xfffffff007004000
+    prelink_text_size = len(kexts) * 0x4000
+    prelink_text = bytearray(prelink_text_size)
+    entries = ''
+    for index, (bundle_id, executable_name) in enumerate(kexts):
+        kext = build_macho(f'/System/Library/Extensions/{executable_name}.kext/{executable_name}',
+                           [f'_{executable_name}_start'], ['_IOLog'])
+        prelink_text[index * 0x4000:index * 0x4000 + len(kext)] = kext
+        library = '<string ID="0">8.0</string>' if index == 0 else '<string IDREF="0"/>'
+        entries += f'<dict><key>CFBundleIdentifier</key><string>{bundle_id}</string>' \
+                   f'<key>CFBundleExecutable</key><string>{executable_name}</string>' \
+                   f'<key>CFBundleName</key><string>{executable_name}</string>' \
+                   f'<key>CFBundleVersion</key><string>22.1.0</string>' \
+                   f'<key>CFBundlePackageType</key><string>KEXT</string>' \
+                   f'<key>OSBundleLibraries</key><dict><key>com.apple.kpi.mach</key>{library}</dict>' \
+                   f'<key>_PrelinkExecutableLoadAddr</key>' \
+                   f'<integer size="64">{hex(base + 0x4000 + index * 0x4000)}</integer>' \
+                   f'<key>_PrelinkExecutableSize</key><integer size="64">{hex(len(kext))}</integer></dict>'
+    prelink_info = f'<dict><key>_PrelinkInfoDictionary</key><array>{entries}</array></dict>\x00'.encode()
+    prelink_info_size = len(prelink_info) + (-len(prelink_info) % 0x4000)
+    info_address, info_offset = base + 0x4000 + prelink_text_size, 0x4000 + prelink_text_size
+
+    commands = struct.pack('<II16sQQQQIIII', 0x19, 72, b'__TEXT', base, 0x4000, 0, 0x4000, 5, 5, 0, 0)
+    commands += struct.pack('<II16sQQQQIIII', 0x19, 72, b'__PRELINK_TEXT', base + 0x4000, prelink_text_size, 0x4000,
+                            prelink_text_size, 5, 5, 0, 0)
+    commands += struct.pack('<II16sQQQQIIII', 0x19, 152, b'__PRELINK_INFO', info_address, prelink_info_size,
+                            info_offset, prelink_info_size, 3, 3, 1, 0)
+    commands += struct.pack('<16s16sQQIIIIIIII', b'__info', b'__PRELINK_INFO', info_address, len(prelink_info),
+                            info_offset, 0, 0, 0, 0, 0, 0, 0)
+    header = struct.pack('<IIIIIIII', 0xfeedfacf, 0x100000c, 0, 2, 3, len(commands), 0x200001, 0)
+
+    kernel = bytearray(0x4000)
+    kernel[0:len(header) + len(commands)] = header + commands
+    version = b'@(#)VERSION: Darwin Kernel Version 22.1.0; root:xnu-8792.41.9~2/RELEASE_ARM64_T8101\x00'
+    kernel[0x3000:0x3000 + len(version)] = version
+    kernel += prelink_text + prelink_info.ljust(prelink_info_size, b'\x00')
+    with open(path, 'wb') as fp:
+        fp.write(kernel)
+
+
+class KernelCacheTestCase(unittest.TestCase):
+    KEXTS = [('com.apple.kpi.mach', 'Mach'), ('com.example.driver.A', 'com.example.driver.B'),
+             ('com.example.driver.B', 'B')]
+
+    def test_kext_index(self):
+        from tempfile import TemporaryDirectory
+        from ktool.kcache import KernelCache, Kext
+        from ktool.macho import SlicedBackingFile
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'kernelcache')
+            write_kernelcache(path, self.KEXTS)
+            with open(path, 'rb') as fp:
+                kernel_cache = KernelCache(ktool.load_macho_file(fp))
+                self.assertEqual([(kext.id, kext.executable_name) for kext in kernel_cache.kexts], self.KEXTS)
+                self.assertEqual(kernel_cache.version, '22.1.0')
+                self.assertEqual((kernel_cache.release_type, kernel_cache.arch, kernel_cache.soc),
+                                 ('release', 'arm64', 't8101'))
+                # indexed without loading any of the kexts
+                self.assertFalse(any(kext.image_loaded for kext in kernel_cache.kexts))
+
+                # executable names win over bundle IDs
+                self.assertIs(kernel_cache.kext('com.example.driver.B'), kernel_cache.kexts[1])
+                self.assertIs(kernel_cache.kext('B'), kernel_cache.kexts[2])
+                self.assertIs(kernel_cache.kext('com.example.driver.A'), kernel_cache.kexts[1])
+                self.assertIsNone(kernel_cache.kext('C'))
+
+                kext = kernel_cache.kext('B')
+                image = kext.image
+                self.assertEqual([kext.image_loaded for kext in kernel_cache.kexts], [False, False, True])
+                self.assertEqual(image.install_name, '/System/Library/Extensions/B.kext/B')
+                self.assertEqual([symbol.name for symbol in image.exports], ['_B_start'])
+                # a window onto the kernelcache's own backing file, not a copy of the kext
+                self.assertIsInstance(image.slice.file, SlicedBackingFile)
+                self.assertIs(image.slice.file.backing_file, kernel_cache.mach_kernel.slice.file)
+                self.assertEqual(image.slice.file.offset, 0xc000)
+                self.assertEqual(image.slice.file.size, kext.size)
+                self.assertIs(kext.backing_file, image.slice.file)
+
+                # every kind of kext knows how to load its image
+                with self.assertRaises(TypeError):
+                    Kext()
+
+    def test_bundle_info(self):
+        from tempfile import TemporaryDirectory
+        from ktool.kcache import KernelCache
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'kernelcache')
+            write_kernelcache(path, self.KEXTS)
+            with open(path, 'rb') as fp:
+                kernel_cache = KernelCache(ktool.load_macho_file(fp))
+                kext = kernel_cache.kext('B')
+                self.assertNotIn('OSBundleLibraries', kext.prelink_info)
+
+                bundle_info = kernel_cache.bundle_info(kext.id)
+                self.assertEqual(bundle_info['OSBundleLibraries'], {'com.apple.kpi.mach': '8.0'})
+                self.assertEqual({key: bundle_info[key] for key in kext.prelink_info}, kext.prelink_info)
+                self.assertEqual(kernel_cache.bundle_info('com.apple.kpi.mach')['CFBundleExecutable'], 'Mach')
+
+
 class BackingFileTestCase(unittest.TestCase):
     def test_with_mmaped_and_actual_file_pointer(self):
         # Rest of our tests use this class but only with our scratch files (which dont invoke binaryIO or mmaped io)
@@ -164,6 +1203,45 @@ class BackingFileTestCase(unittest.TestCase):
         self.assertEqual(bf.read_bytes(0, 4), b'\xde\xad\xbe\xef')
         fp.close()
 
+    def test_bulk_writes(self):
+        bf = BackingFile(BytesIO(bytes(0x100)))
+        bf.write_many([(0, b'\x01\x02'), (0xfe, b'\x03\x04')])
+        self.assertEqual(bf.read_bytes(0, 2), b'\x01\x02')
+        self.assertEqual(bf.read_bytes(0xfe, 2), b'\x03\x04')
+
+        # nothing in a batch gets applied if any write is out of bounds
+        with self.assertRaises(IndexError):
+            bf.write_many([(0, b'\xff'), (0xff, b'\xff\xff')])
+        self.assertEqual(bf.read_bytes(0, 1), b'\x01')
+        self.assertEqual(bf.size, 0x100)
+
+        sliced = SlicedBackingFile(bf, 0xfe, 2)
+        sliced.write(0, b'\x05')
+        out = BytesIO()
+        sliced.write_to(out)
+        self.assertEqual(out.getvalue(), b'\x05\x04')
+
+    def test_sliced_backing_file_is_lazy(self):
+        bf = BackingFile(BytesIO(bytes(range(0x100))))
+        sliced = SlicedBackingFile(bf, 0x10, 0x10)
+        self.assertEqual(sliced.read_bytes(0xc, 8), bytes(range(0x1c, 0x20)))
+        out = BytesIO()
+        sliced.write_to(out)
+        self.assertEqual(out.getvalue(), bytes(range(0x10, 0x20)))
+        # .file is a window onto the backing file until something is written
+        self.assertEqual(sliced.file[1], 0x11)
+        self.assertEqual(sliced.file[2:4], b'\x12\x13')
+        self.assertEqual(sliced.file.find(b'\x15'), 5)
+        self.assertEqual(sliced.file.find(b'\x05'), -1)
+        self.assertEqual(sliced.find(b'\x15', 2), 5)
+        with sliced.view(0xe, 8) as view:
+            self.assertEqual(bytes(view), b'\x1e\x1f')
+        # reads and write-outs go straight to the backing file, only writes give the slice its own copy
+        self.assertIsNone(sliced._file)
+        sliced.write(0, b'\xff')
+        self.assertEqual(bf.read_bytes(0x10, 1), b'\x10')
+        self.assertEqual(sliced.read_bytes(0, 2), b'\xff\x11')
+
 
 class SliceTestCase(unittest.TestCase):
     def __init__(self, *args, **kwargs):
@@ -491,6 +1569,13 @@ class MachOLoaderTestCase(unittest.TestCase):
         macho = ktool.load_macho_file(self.fat.get())
         assert macho.type == MachOFileType.FAT
 
+    def test_detect_filetype(self):
+        self.thin.reset()
+        self.fat.reset()
+        self.assertEqual(detect_filetype(self.thin.get()), FileType.MachOFileType)
+        self.assertEqual(detect_filetype(self.fat.get()), FileType.FatMachOFileType)
+        self.assertIsNone(detect_filetype(BytesIO(b'\xde\xad\xbe\xef' * 4)))
+
     def test_bad_magic(self):
         self.thin.reset()
         self.thin.write(0, 0xDEADBEEF)
@@ -580,10 +1665,10 @@ class VMTestCase(unittest.TestCase):
             self.assertEqual(correct_address, translated_address)
             self.assertEqual(vm.de_translate(translated_address), address)
 
-        vm.detag_64 = True
-        translated_address = vm.translate(vm_base + 0x1234000000000)
-        self.assertEqual(translated_address, vm_base - diff)
-        vm.detag_64 = False
+        # the VM no longer strips tags off pointers; they're decoded (Image.decode_ptr) before being translated
+        with self.assertRaises(VMAddressingError):
+            vm.translate(vm_base + 0x1234000000000)
+        self.assertEqual(vm.translate(vm_base), vm_base - diff)
 
         vm.detag_kern_64 = True
         tagged_k64_addr = 0x1234FFFFFFFF0008
@@ -616,10 +1701,10 @@ class VMTestCase(unittest.TestCase):
             self.assertEqual(correct_address, translated_address)
             self.assertEqual(vm.de_translate(translated_address), address)
 
-        vm.detag_64 = True
-        translated_address = vm.translate(vm_base + 0x1234000000000)
-        self.assertEqual(translated_address, vm_base - diff)
-        vm.detag_64 = False
+        # the VM no longer strips tags off pointers; they're decoded (Image.decode_ptr) before being translated
+        with self.assertRaises(VMAddressingError):
+            vm.translate(vm_base + 0x1234000000000)
+        self.assertEqual(vm.translate(vm_base), vm_base - diff)
 
         vm.detag_kern_64 = True
         tagged_k64_addr = 0x1234FFFFFFFF0008
@@ -668,6 +1753,21 @@ class ImageTestCase(unittest.TestCase):
         re_in = json.loads(out)
         assert re_in
 
+    def test_reload_after_patch(self):
+        self.thin.reset()
+
+        image = ktool.load_image(self.thin.get())
+
+        dylib_item = Struct.create_with_values(dylib, [0x18, 0x2, 0x010000, 0x010000])
+        dylib_cmd = Struct.create_with_values(dylib_command, [LOAD_COMMAND.LOAD_DYLIB.value, 0, dylib_item.raw])
+        new_header = image.macho_header.insert_load_command(dylib_cmd, -1, suffix='/usr/lib/libz.dylib')
+        image.slice.patch(0, new_header.raw)
+
+        resynced = ktool.reload_image(image)
+        self.assertIs(resynced, image)
+        self.assertEqual(resynced.linked_images[-1].install_name, '/usr/lib/libz.dylib')
+        self.assertEqual(resynced.serialize(), ktool.reload_image(image, full=True).serialize())
+
     def test_vm_realignment(self):
         self.thin.reset()
 